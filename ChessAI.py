@@ -0,0 +1,1072 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import struct
+import time
+
+import ChessStore
+import ChessTablebase
+
+PIECE_SCORE = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1}
+
+KNIGHT_SCORES = [[0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
+                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
+                 [0.2, 0.5, 0.6, 0.6, 0.6, 0.6, 0.5, 0.2],
+                 [0.2, 0.5, 0.6, 0.7, 0.7, 0.6, 0.5, 0.2],
+                 [0.2, 0.5, 0.6, 0.7, 0.7, 0.6, 0.5, 0.2],
+                 [0.2, 0.5, 0.6, 0.6, 0.6, 0.6, 0.5, 0.2],
+                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
+                 [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0]]
+
+BISHOP_SCORES = [[0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+                 [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
+                 [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
+                 [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
+                 [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
+                 [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
+                 [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
+                 [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0]]
+
+ROOK_SCORES = [[0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2],
+               [0.5, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.5],
+               [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+               [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+               [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+               [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+               [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
+               [0.2, 0.2, 0.2, 0.5, 0.5, 0.2, 0.2, 0.2]]
+
+QUEEN_SCORES = [[0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
+                [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
+                [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
+                [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
+                [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
+                [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
+                [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
+                [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0]]
+
+PAWN_SCORES = [[0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
+               [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
+               [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
+               [0.2, 0.2, 0.3, 0.4, 0.4, 0.3, 0.2, 0.2],
+               [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
+               [0.2, 0.1, 0.1, 0.2, 0.2, 0.1, 0.1, 0.2],
+               [0.2, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.2],
+               [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]]
+
+PIECE_POSITION_SCORES = {
+    "wp": PAWN_SCORES,
+    "bp": PAWN_SCORES[::-1],
+    "wN": KNIGHT_SCORES,
+    "bN": KNIGHT_SCORES[::-1],
+    "wB": BISHOP_SCORES,
+    "bB": BISHOP_SCORES[::-1],
+    "wR": ROOK_SCORES,
+    "bR": ROOK_SCORES[::-1],
+    "wQ": QUEEN_SCORES,
+    "bQ": QUEEN_SCORES[::-1]
+}
+
+CHECKMATE = 1000
+STALEMATE = 0
+MAX_DEPTH = 64  # profondeur maximale de l'approfondissement itératif
+MOVE_TIME = 2.0  # temps de réflexion par coup de l'IA, en secondes
+STORE_MIN_DEPTH = 5  # profondeur minimale d'un résultat gardé dans le magasin de positions (ChessStore)
+STORE_VERSION = 1  # à incrémenter quand la recherche change ses résultats : les entrées anciennes sont ignorées
+MATE_THRESHOLD = CHECKMATE - 200  # au-delà, le score est un mat (en CHECKMATE - ply)
+NODES_BETWEEN_CHECKS = 256  # fréquence de vérification du temps et du budget de noeuds
+MAX_PLY = 128  # distance maximale à la racine (coups killers)
+
+# move ordering: most valuable victim first, then least valuable attacker
+MVV_LVA_VALUES = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 20}
+TT_MOVE_ORDER = 1 << 30
+CAPTURE_ORDER = 1 << 26
+KILLER_ORDER = 1 << 24
+HISTORY_LIMIT = 1 << 20  # au-delà, les scores d'historique sont divisés par deux
+DELTA_MARGIN = 2.0  # élagage delta : marge (en pions) au-delà du gain matériel d'une capture
+NULL_MOVE_REDUCTION = 2  # le coup nul est cherché à depth - 1 - NULL_MOVE_REDUCTION
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_DEPTH = 3  # profondeur minimale pour réduire les coups tardifs
+LMR_FULL_DEPTH_MOVES = 3  # coups cherchés à pleine profondeur avant de réduire les suivants
+ZERO_WINDOW = 0.005  # fenêtre nulle : un demi-centipion, aucun score (multiple de 0.01) ne peut tomber dedans
+SEARCH_FEATURES = ("nullMove", "lateMoveReductions", "principalVariationSearch")  # options de Search, activées par défaut
+
+PROFILED_PHASES = ("getValidMoves", "makeMove", "undoMove")  # méthodes de GameState chronométrées (avec scoreBoard)
+TT_SIZE = 1 << 18  # nombre d'entrées de la table de transposition (puissance de 2)
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2  # type de borne du score stocké
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results, indexed by the low bits of GameState.zobristKey.
+    Each slot holds one entry (key, depth, score, bound, bestMoveID, generation), so memory never grows.
+    Replacement: a slot is overwritten by the same position, by a search at least as deep,
+    or when its entry was stored during an older search (generation).
+    """
+    def __init__(self, size=TT_SIZE):
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.generation = 0
+
+    """
+    Called once per root search so entries from previous moves can be replaced first
+    """
+    def newSearch(self):
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * (self.mask + 1)
+        self.generation = 0
+
+    """
+    Returns (depth, score, bound, bestMoveID) stored for this key, or None
+    """
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry[1:5]
+        return None
+
+    def store(self, key, depth, score, bound, bestMove):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[0] == key or depth >= entry[1] or entry[5] != self.generation:
+            bestMoveID = bestMove.moveID if bestMove is not None else None
+            self.entries[index] = (key, depth, score, bound, bestMoveID, self.generation)
+
+
+transpositionTable = TranspositionTable()
+tablebases = ChessTablebase.Tablebases()  # tables de finales du dossier "tablebases", s'il existe
+positionStore = ChessStore.PositionStore(None)  # désactivé ; ChessStore.PositionStore(chemin) garde les résultats sur disque
+
+"""
+Picks and returns a random move
+"""
+def findRandomMove(validMoves):
+    return random.choice(validMoves)
+
+
+"""
+Find nega max move helper. First recursive caller.
+Searches for at most maxTime seconds (MOVE_TIME by default) and puts the best move in returnQueue.
+With workers > 1 the root moves are shared between that many processes (see ParallelSearch).
+Returns the SearchResult, whose stats hold the search counters (and phase timings with profile=True)
+"""
+def findBestMove(gs, validMoves, returnQueue, maxTime=MOVE_TIME, maxNodes=None, maxDepth=MAX_DEPTH, workers=1,
+                 profile=False):
+    random.shuffle(validMoves)
+    search = ParallelSearch(workers) if workers > 1 else Search()
+    search.profile = profile
+    try:
+        result = search.iterativeDeepening(gs, validMoves, maxTime, maxNodes, maxDepth)
+    finally:
+        if workers > 1:
+            search.close()
+    returnQueue.put(result.bestMove)
+    return result
+
+
+class SearchAborted(Exception):
+    """
+    Raised inside the search when the time or node budget runs out
+    """
+    pass
+
+
+class SearchResult:
+    """
+    Outcome of a search: best move, its score (in pawns, from the point of view of the side to move),
+    depth of the last completed iteration, principal variation (list of moves), nodes searched and time spent,
+    and the SearchStats of the whole search
+    """
+    def __init__(self, bestMove, score, depth, pv, nodes, elapsed, firstMoveCutoffRate=0.0, stats=None):
+        self.bestMove = bestMove
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.firstMoveCutoffRate = firstMoveCutoffRate  # part des coupures beta obtenues par le premier coup essayé
+        self.stats = stats if stats is not None else SearchStats()
+
+
+class SearchStats:
+    """
+    Counters of a search: nodes (quiescence nodes included), quiescence nodes, beta cutoffs and those produced by
+    the first move searched, transposition table probes and hits, total nodes after each completed iteration,
+    and, when profiling, the calls and seconds spent in each phase: timers = {"makeMove": [calls, seconds], ...}
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.iterationNodes = []
+        self.timers = {}
+        self.elapsed = 0.0
+
+    """
+    Adds the counters of another search (a root move searched by a worker of ParallelSearch)
+    """
+    def add(self, other):
+        self.nodes += other.nodes
+        self.qnodes += other.qnodes
+        self.cutoffs += other.cutoffs
+        self.firstMoveCutoffs += other.firstMoveCutoffs
+        self.ttProbes += other.ttProbes
+        self.ttHits += other.ttHits
+        for name, (calls, seconds) in other.timers.items():
+            totals = self.timers.setdefault(name, [0, 0.0])
+            totals[0] += calls
+            totals[1] += seconds
+
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def ttHitRate(self):
+        return self.ttHits / self.ttProbes if self.ttProbes else 0.0
+
+    def nodesPerSecond(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    """
+    Effective branching factor: growth of the node count from one iteration to the next (geometric mean)
+    """
+    def branchingFactor(self):
+        counts = [total - previous for previous, total in zip([0] + self.iterationNodes, self.iterationNodes)]
+        counts = [count for count in counts if count > 0]
+        if len(counts) < 2:
+            return 0.0
+        return (counts[-1] / counts[0]) ** (1 / (len(counts) - 1))
+
+    def toDict(self):
+        return {"nodes": self.nodes, "qnodes": self.qnodes, "elapsed": self.elapsed,
+                "nodesPerSecond": self.nodesPerSecond(), "branchingFactor": self.branchingFactor(),
+                "iterationNodes": list(self.iterationNodes), "cutoffs": self.cutoffs,
+                "firstMoveCutoffRate": self.firstMoveCutoffRate(), "ttProbes": self.ttProbes,
+                "ttHitRate": self.ttHitRate(),
+                "timers": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.timers.items()}}
+
+    def toJSON(self, indent=None):
+        return json.dumps(self.toDict(), indent=indent)
+
+
+"""
+function wrapped so that each call adds to totals = [calls, seconds]
+"""
+def timedCall(function, totals):
+    clock = time.perf_counter
+
+    def timed(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            totals[0] += 1
+            totals[1] += clock() - start
+    return timed
+
+
+class Search:
+    """
+    Negamax alpha-beta search, driven by iterative deepening: depth 1, 2, 3... until the time or node budget runs out.
+    Every completed iteration leaves a best move ready; an interrupted one is thrown away.
+    """
+    def __init__(self, tt=None):
+        self.tt = tt if tt is not None else transpositionTable
+        self.nodes = 0
+        self.deadline = None
+        self.maxNodes = None
+        self.nextCheck = NODES_BETWEEN_CHECKS
+        self.pvTable = []
+        self.killers = [[None, None] for _ in range(MAX_PLY)]  # deux coups calmes ayant coupé, par ply
+        self.history = {}  # moveID -> bonus des coups calmes ayant coupé (profondeur au carré)
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.qnodes = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.iterationNodes = []
+        self.profile = False  # chronomètre les phases de la recherche (voir startProfiling)
+        self.timers = {}
+        self.evaluate = scoreBoard
+        self.nullMove = True  # élagage par coup nul
+        self.lateMoveReductions = True  # réduction des coups calmes tardifs
+        self.principalVariationSearch = True  # fenêtre nulle pour les coups après le premier
+        self.useStore = True  # cherche la position racine dans positionStore, et y garde le résultat
+        self.shouldStop = None  # fonction optionnelle : vraie quand la recherche doit s'arrêter (ordre "stop")
+        self.onIteration = None  # fonction optionnelle appelée avec le SearchResult de chaque itération terminée
+
+    """
+    Share of beta cutoffs produced by the first move searched: the closer to 1, the better the move ordering
+    """
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def resetCounters(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.iterationNodes = []
+        self.timers = {}
+
+    def searchStats(self, elapsed):
+        stats = SearchStats()
+        stats.nodes, stats.qnodes = self.nodes, self.qnodes
+        stats.cutoffs, stats.firstMoveCutoffs = self.cutoffs, self.firstMoveCutoffs
+        stats.ttProbes, stats.ttHits = self.ttProbes, self.ttHits
+        stats.iterationNodes = list(self.iterationNodes)
+        stats.timers = self.timers
+        stats.elapsed = elapsed
+        return stats
+
+    """
+    Times every call of the PROFILED_PHASES of gs and of the evaluation, by shadowing them with timed wrappers
+    for the length of the search. Without profile nothing is wrapped, so the search runs at full speed
+    """
+    def startProfiling(self, gs):
+        for name in PROFILED_PHASES:
+            setattr(gs, name, timedCall(getattr(gs, name), self.timers.setdefault(name, [0, 0.0])))
+        self.evaluate = timedCall(scoreBoard, self.timers.setdefault("scoreBoard", [0, 0.0]))
+
+    def stopProfiling(self, gs):
+        for name in PROFILED_PHASES:
+            gs.__dict__.pop(name, None)
+        self.evaluate = scoreBoard
+
+    """
+    Limits for a search starting now: maxTime seconds and maxNodes more nodes (None for no limit)
+    """
+    def setLimits(self, maxTime, maxNodes):
+        self.deadline = time.perf_counter() + maxTime if maxTime is not None else None
+        self.maxNodes = self.nodes + maxNodes if maxNodes is not None else None
+        self.nextCheck = self.nodes + NODES_BETWEEN_CHECKS
+
+    """
+    Sorts moves in place: transposition table move, captures by MVV-LVA, queen promotions,
+    killer moves of this ply, then quiet moves by history score
+    """
+    def orderMoves(self, moves, ply, ttMoveID):
+        killers = self.killers[ply] if ply < MAX_PLY else (None, None)
+        history = self.history
+
+        def moveOrder(move):
+            if move.moveID == ttMoveID:
+                return TT_MOVE_ORDER
+            if move.isCapture:
+                return CAPTURE_ORDER + MVV_LVA_VALUES[move.pieceCaptured[1]] * 32 - MVV_LVA_VALUES[move.pieceMoved[1]]
+            if move.isPawnPromotion:
+                return CAPTURE_ORDER
+            if move.moveID == killers[0]:
+                return KILLER_ORDER + 1
+            if move.moveID == killers[1]:
+                return KILLER_ORDER
+            return history.get(move.moveID, 0)
+
+        moves.sort(key=moveOrder, reverse=True)
+
+    """
+    Remembers a quiet move that caused a beta cutoff: killer for this ply, history bonus for the move
+    """
+    def recordQuietCutoff(self, move, depth, ply):
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move.moveID:
+                killers[1] = killers[0]
+                killers[0] = move.moveID
+        score = self.history.get(move.moveID, 0) + depth * depth
+        self.history[move.moveID] = score
+        if score > HISTORY_LIMIT:
+            self.ageHistory()
+
+    def ageHistory(self):
+        for moveID in self.history:
+            self.history[moveID] //= 2
+
+    """
+    Stops the search (by raising SearchAborted) once past the deadline or the node budget, or when told to stop
+    """
+    def checkLimits(self):
+        self.nextCheck = self.nodes + NODES_BETWEEN_CHECKS
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchAborted()
+        if self.maxNodes is not None and self.nodes >= self.maxNodes:
+            raise SearchAborted()
+        if self.shouldStop is not None and self.shouldStop():
+            raise SearchAborted()
+
+    def iterativeDeepening(self, gs, validMoves, maxTime=None, maxNodes=None, maxDepth=MAX_DEPTH):
+        self.resetCounters()
+        if not self.profile:
+            return self.deepen(gs, validMoves, maxTime, maxNodes, maxDepth)
+        self.startProfiling(gs)
+        try:
+            return self.deepen(gs, validMoves, maxTime, maxNodes, maxDepth)
+        finally:
+            self.stopProfiling(gs)
+
+    def deepen(self, gs, validMoves, maxTime, maxNodes, maxDepth):
+        startTime = time.perf_counter()
+        if gs.materialTable is None:
+            gs.setEvaluationTables(PIECE_SCORE, PIECE_POSITION_SCORES)
+        self.tt.newSearch()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.ageHistory()  # l'historique de la recherche précédente reste utile, mais compte moins
+        rootLength = len(gs.moveLog)
+        rootMoves = list(validMoves)
+        result = SearchResult(rootMoves[0] if rootMoves else None, 0, 0, rootMoves[:1], 0, 0.0)
+        if not rootMoves:
+            return result
+        rootResult = probeTablebaseRoot(gs, rootMoves, startTime)
+        if rootResult is None and self.useStore:
+            rootResult = probeStoreRoot(gs, rootMoves, maxDepth, startTime, storeTag(self))
+        if rootResult is not None:
+            if self.onIteration is not None:
+                self.onIteration(rootResult)
+            return rootResult
+
+        for depth in range(1, maxDepth + 1):
+            # depth 1 has no time or node limit, so a legal move is ready unless the search is told to stop first
+            # (the first root move is then returned)
+            self.deadline = startTime + maxTime if maxTime is not None and depth > 1 else None
+            self.maxNodes = maxNodes if depth > 1 else None
+            self.nextCheck = self.nodes + NODES_BETWEEN_CHECKS
+            try:
+                score = self.searchRoot(gs, rootMoves, depth)
+            except SearchAborted:
+                while len(gs.moveLog) > rootLength:  # l'exception a interrompu la recherche au milieu des coups
+                    gs.undoMove()
+                break
+            self.iterationNodes.append(self.nodes)
+            elapsed = time.perf_counter() - startTime
+            result = SearchResult(self.pvTable[0][0], score, depth, list(self.pvTable[0]), self.nodes, elapsed,
+                                  self.firstMoveCutoffRate(), self.searchStats(elapsed))
+            if self.onIteration is not None:
+                self.onIteration(result)
+            if abs(score) >= MATE_THRESHOLD or len(rootMoves) == 1:
+                break  # mat trouvé ou coup forcé : inutile d'aller plus loin
+            if maxTime is not None and time.perf_counter() - startTime > maxTime / 2:
+                break  # l'itération suivante ne finirait probablement pas à temps
+
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - startTime
+        result.stats = self.searchStats(result.elapsed)
+        gs.getValidMoves()  # rétablit checkmate/stalemate pour la position racine
+        if self.useStore:
+            recordStoreRoot(gs, result, storeTag(self))
+        return result
+
+    """
+    Searches every root move to depth, previous best move first. Returns the best score
+    """
+    def searchRoot(self, gs, rootMoves, depth):
+        self.pvTable = [[] for _ in range(depth + 1)]
+        alpha, beta = -CHECKMATE, CHECKMATE
+        bestScore = -CHECKMATE
+        for moveIndex, move in enumerate(rootMoves):
+            if moveIndex > 0 and self.principalVariationSearch:
+                score = self.searchRootMove(gs, move, depth, alpha, alpha + ZERO_WINDOW)
+                if score > alpha:  # meilleur que le premier coup : nouvelle recherche avec la fenêtre complète
+                    score = self.searchRootMove(gs, move, depth, alpha, beta)
+            else:
+                score = self.searchRootMove(gs, move, depth, alpha, beta)
+            if score > bestScore:
+                bestScore = score
+                self.pvTable[0] = [move] + self.pvTable[1]
+            if bestScore > alpha:
+                alpha = bestScore
+        rootMoves.remove(self.pvTable[0][0])
+        rootMoves.insert(0, self.pvTable[0][0])
+        self.tt.store(gs.zobristKey, depth, bestScore, EXACT, self.pvTable[0][0])
+        return bestScore
+
+    """
+    Score of one root move searched to depth (from the root side's point of view); its continuation is left in pvTable[1]
+    """
+    def searchRootMove(self, gs, move, depth, alpha, beta):
+        turnMultiplier = 1 if gs.whiteToMove else -1
+        gs.makeMove(move)
+        nextMoves = gs.getValidMoves()
+        score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, 1, -beta, -alpha, -turnMultiplier)
+        gs.undoMove()
+        return score
+
+    """
+    White searches the highest value, black the lowest
+    Explanation: https://www.youtube.com/watch?v=l-hh51ncgDI
+    ply is the distance from the root, used for the principal variation and to prefer the shortest mate.
+    Selective search, each part switched by an attribute of Search:
+    - nullMove: when not in check, with pieces other than pawns (zugzwang) and a static score already at beta,
+      the side to move passes; if a reduced search still fails high, the node is cut without searching any move
+    - lateMoveReductions: quiet moves ordered after the first LMR_FULL_DEPTH_MOVES (not killers, not giving
+      check) are searched one ply shallower, and again at full depth if they beat alpha
+    - principalVariationSearch: moves after the first are searched with a zero window around alpha, and again
+      with the full window only when they beat it
+    """
+    def findMoveNegaMaxAlphaBeta(self, gs, validMoves, depth, ply, alpha, beta, turnMultiplier):
+        self.nodes += 1
+        if self.nodes >= self.nextCheck:
+            self.checkLimits()
+        if len(self.pvTable) > ply:
+            self.pvTable[ply] = []
+        if gs.checkmate:
+            return -CHECKMATE + ply
+        if gs.stalemate:
+            return STALEMATE
+        if gs.isFiftyMoveDraw() or gs.isRepetition():  # une position répétée dans la ligne compte comme nulle
+            return STALEMATE
+        if gs.pieceCount <= ChessTablebase.MAX_PIECES and tablebases.available:
+            value = tablebases.probe(gs)
+            if value is not None:
+                return tablebaseScore(value, ply)
+
+        alphaOrig = alpha
+        ttMoveID = None
+        self.ttProbes += 1
+        ttEntry = self.tt.probe(gs.zobristKey)
+        if ttEntry is not None:
+            self.ttHits += 1
+            ttDepth, ttScore, ttBound, ttMoveID = ttEntry
+            ttScore = scoreFromTT(ttScore, ply)
+            if ttDepth >= depth:
+                if ttBound == EXACT:
+                    return ttScore
+                elif ttBound == LOWER_BOUND:
+                    alpha = max(alpha, ttScore)
+                else:
+                    beta = min(beta, ttScore)
+                if alpha >= beta:
+                    return ttScore
+
+        if depth == 0:
+            return self.quiescence(gs, ply, alpha, beta, turnMultiplier)
+
+        inCheck = (self.nullMove or self.lateMoveReductions) and gs.inCheck()
+        if (self.nullMove and depth >= NULL_MOVE_MIN_DEPTH and not inCheck and beta < MATE_THRESHOLD
+                and (not gs.moveLog or gs.moveLog[-1] is not None) and hasNonPawnMaterial(gs)
+                and turnMultiplier * self.evaluate(gs) >= beta):
+            gs.makeNullMove()
+            nextMoves = gs.getValidMoves()
+            score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1 - NULL_MOVE_REDUCTION, ply + 1,
+                                                   -beta, -beta + ZERO_WINDOW, -turnMultiplier)
+            gs.undoMove()
+            if score >= beta:
+                return beta if score >= MATE_THRESHOLD else score  # un mat trouvé après un coup nul n'est pas prouvé
+
+        self.orderMoves(validMoves, ply, ttMoveID)
+        killers = self.killers[ply] if ply < MAX_PLY else (None, None)
+        maxScore = -CHECKMATE
+        bestMove = None
+        for moveIndex, move in enumerate(validMoves):
+            gs.makeMove(move)
+            nextMoves = gs.getValidMoves()
+            if moveIndex == 0:
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, ply + 1, -beta, -alpha,
+                                                       -turnMultiplier)
+            else:
+                windowBeta = alpha + ZERO_WINDOW if self.principalVariationSearch else beta
+                reduction = 0
+                if (self.lateMoveReductions and depth >= LMR_MIN_DEPTH and moveIndex >= LMR_FULL_DEPTH_MOVES
+                        and not inCheck and not move.isCapture and not move.isPawnPromotion
+                        and move.moveID not in killers and not gs.inCheck()):
+                    reduction = 1
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1 - reduction, ply + 1, -windowBeta,
+                                                       -alpha, -turnMultiplier)
+                if reduction and score > alpha:  # la réduction a échoué : même fenêtre, pleine profondeur
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, ply + 1, -windowBeta, -alpha,
+                                                           -turnMultiplier)
+                if windowBeta < beta and alpha < score < beta:  # mieux qu'alpha : score exact avec la fenêtre complète
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, ply + 1, -beta, -alpha,
+                                                           -turnMultiplier)
+            gs.undoMove()
+
+            if score > maxScore:
+                maxScore = score
+                bestMove = move
+                if score > alpha and len(self.pvTable) > ply + 1:
+                    self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+
+            # pruning
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                self.cutoffs += 1
+                if moveIndex == 0:
+                    self.firstMoveCutoffs += 1
+                if not move.isCapture:
+                    self.recordQuietCutoff(move, depth, ply)
+                break
+
+        if maxScore <= alphaOrig:
+            bound = UPPER_BOUND
+        elif maxScore >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self.tt.store(gs.zobristKey, depth, scoreToTT(maxScore, ply), bound, bestMove)
+        return maxScore
+
+
+    """
+    Capture-only search at the horizon, so the score of a leaf never stops in the middle of an exchange.
+    Stand pat: the side to move may decline every capture, so the static score is a lower bound.
+    Delta pruning: a capture that cannot lift the score to alpha even with DELTA_MARGIN to spare is skipped.
+    In check every evasion is searched instead, so mates are still seen
+    """
+    def quiescence(self, gs, ply, alpha, beta, turnMultiplier):
+        self.nodes += 1
+        self.qnodes += 1
+        if self.nodes >= self.nextCheck:
+            self.checkLimits()
+
+        inCheck = gs.inCheck()
+        if inCheck:
+            moves = gs.getValidMoves()
+            if len(moves) == 0:
+                return -CHECKMATE + ply
+            bestScore = -CHECKMATE
+            standPat = None
+        else:
+            standPat = turnMultiplier * self.evaluate(gs)
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            moves = gs.getValidMoves(capturesOnly=True)
+            bestScore = standPat
+
+        self.orderMoves(moves, ply, None)
+        for move in moves:
+            if standPat is not None:
+                gain = PIECE_SCORE[move.pieceCaptured[1]]
+                if move.isPawnPromotion:
+                    gain += PIECE_SCORE[move.promotionChoice] - PIECE_SCORE["p"]
+                if standPat + gain + DELTA_MARGIN <= alpha:
+                    # compté à son estimation optimiste : le score renvoyé reste une borne sûre (fenêtres nulles)
+                    bestScore = max(bestScore, standPat + gain + DELTA_MARGIN)
+                    continue
+            gs.makeMove(move)
+            score = -self.quiescence(gs, ply + 1, -beta, -alpha, -turnMultiplier)
+            gs.undoMove()
+            if score > bestScore:
+                bestScore = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return bestScore
+
+
+POSITION_BUFFER_SIZE = 1 << 18  # octets partagés pour la position racine ; au-delà, elle part avec chaque tâche
+POSITION_HEADER = struct.Struct("qq")  # en tête du tampon : numéro de la recherche, taille de la position
+
+workerSearch = None  # Search d'un processus de ParallelSearch, gardée d'une tâche à l'autre (table, historique)
+workerRootKey = None
+workerPosition = None  # (searchID, GameState) : position racine de la recherche en cours, lue une seule fois
+workerActiveSearch = None  # valeurs partagées avec ParallelSearch, reçues par initWorker
+workerPositionBuffer = None
+
+
+"""
+Pool initializer of ParallelSearch: activeSearch holds the number of the running search (0: none), positionBuffer
+its pickled root position
+"""
+def initWorker(activeSearch, positionBuffer):
+    global workerActiveSearch, workerPositionBuffer
+    workerActiveSearch = activeSearch
+    workerPositionBuffer = positionBuffer
+
+
+"""
+Pickled root position of search searchID from the shared buffer, or None if the buffer holds another search's
+"""
+def readSharedPosition(searchID):
+    with workerPositionBuffer.get_lock():
+        buffer = workerPositionBuffer.get_obj()
+        positionID, length = POSITION_HEADER.unpack_from(buffer)
+        if positionID != searchID:
+            return None
+        return buffer[POSITION_HEADER.size:POSITION_HEADER.size + length]
+
+
+"""
+Worker side of ParallelSearch: searches one root move of the root position of search searchID.
+The position is read once per search from the shared buffer, unless it came too big for it and is sent with the
+task (gsData). The task is aborted as soon as searchID is no longer the active search (stopped or finished), so no
+worker keeps searching for a search nobody waits for.
+deadline is a wall-clock time (time.time()), shared by all the processes, so a task that waited in the queue
+does not get a fresh budget. Returns (moveID, score, pv as moveIDs, nodes, SearchStats); score is None when the
+search was stopped or the time or node budget ran out
+"""
+def searchRootMoveTask(searchID, gsData, moveID, depth, alpha, beta, deadline, maxNodes, profile=False, features=None):
+    global workerSearch, workerRootKey, workerPosition
+    if workerActiveSearch.value != searchID:  # tâche restée dans la file d'une recherche déjà finie
+        return moveID, None, [], 0, SearchStats()
+    if workerPosition is None or workerPosition[0] != searchID:
+        if gsData is None:
+            gsData = readSharedPosition(searchID)
+            if gsData is None:
+                return moveID, None, [], 0, SearchStats()
+        workerPosition = (searchID, pickle.loads(gsData))
+    gs = workerPosition[1]
+    rootLength = len(gs.moveLog)
+    if workerSearch is None:
+        workerSearch = Search()
+    search = workerSearch
+    for name, enabled in (features or {}).items():
+        setattr(search, name, enabled)
+    if gs.zobristKey != workerRootKey:  # nouvelle position racine
+        workerRootKey = gs.zobristKey
+        search.tt.newSearch()
+        search.killers = [[None, None] for _ in range(MAX_PLY)]
+        search.ageHistory()
+    search.shouldStop = lambda: workerActiveSearch.value != searchID
+    search.resetCounters()
+    search.setLimits(deadline - time.time() if deadline is not None else None, maxNodes)
+    search.pvTable = [[] for _ in range(depth + 1)]
+    move = next(m for m in gs.getValidMoves() if m.moveID == moveID)
+    startTime = time.perf_counter()
+    if profile:
+        search.startProfiling(gs)
+    try:
+        score = search.searchRootMove(gs, move, depth, alpha, beta)
+        pvIDs = [m.moveID for m in search.pvTable[1]]
+    except SearchAborted:
+        while len(gs.moveLog) > rootLength:  # la position reste celle de la racine pour les tâches suivantes
+            gs.undoMove()
+        score, pvIDs = None, []
+    finally:
+        if profile:
+            search.stopProfiling(gs)
+    return moveID, score, pvIDs, search.nodes, search.searchStats(time.perf_counter() - startTime)
+
+
+class ParallelSearch:
+    """
+    Iterative deepening whose root moves are shared out over a pool of worker processes.
+    At each depth the first (previous best) move is searched alone with a full window; its score then serves as
+    alpha for all the other root moves, searched in parallel. The results are combined in root move order, the
+    earliest move winning ties, so the chosen move and score do not depend on which worker finished first.
+    Each worker keeps its own transposition table and history between tasks. The root position is written once per
+    search in a buffer shared with the workers, each reading it once. A shared value holds the number of the running
+    search: when the search stops or returns, the tasks still running or queued abort at once.
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.activeSearch = multiprocessing.Value("q", 0, lock=False)  # écrit par ce seul processus
+        self.positionBuffer = multiprocessing.Array("c", POSITION_BUFFER_SIZE)
+        self.pool = multiprocessing.Pool(self.workers, initWorker, (self.activeSearch, self.positionBuffer))
+        self.searchID = 0
+        self.taskPosition = None  # position envoyée avec chaque tâche quand elle ne tient pas dans le tampon
+        self.shouldStop = None  # comme Search.shouldStop, vérifié en attendant les résultats des processus
+        self.onIteration = None  # comme Search.onIteration
+        self.profile = False  # comme Search.profile, dans chaque processus
+        self.nullMove = True  # comme les options de Search du même nom, transmises à chaque processus
+        self.lateMoveReductions = True
+        self.principalVariationSearch = True
+        self.useStore = True
+
+    """
+    Result of an asynchronous task, or None if the search was told to stop while waiting
+    """
+    def waitFor(self, task):
+        while self.shouldStop is not None:
+            try:
+                return task.get(timeout=0.05)
+            except multiprocessing.TimeoutError:
+                if self.shouldStop():
+                    return None
+        return task.get()
+
+    """
+    Searches one root move of the current search in the pool
+    """
+    def submit(self, moveID, depth, alpha, deadline, nodesLeft, features):
+        return self.pool.apply_async(searchRootMoveTask, (self.searchID, self.taskPosition, moveID, depth, alpha,
+                                                          CHECKMATE, deadline, nodesLeft, self.profile, features))
+
+    """
+    Makes the pickled root position of the current search readable by the workers: in the shared buffer, or with
+    every task if it does not fit
+    """
+    def sharePosition(self, gsData):
+        fits = POSITION_HEADER.size + len(gsData) <= POSITION_BUFFER_SIZE
+        with self.positionBuffer.get_lock():
+            buffer = self.positionBuffer.get_obj()
+            POSITION_HEADER.pack_into(buffer, 0, self.searchID if fits else 0, len(gsData) if fits else 0)
+            if fits:
+                buffer[POSITION_HEADER.size:POSITION_HEADER.size + len(gsData)] = gsData
+        self.taskPosition = None if fits else gsData
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def iterativeDeepening(self, gs, validMoves, maxTime=None, maxNodes=None, maxDepth=MAX_DEPTH):
+        startTime = time.perf_counter()
+        if gs.materialTable is None:
+            gs.setEvaluationTables(PIECE_SCORE, PIECE_POSITION_SCORES)
+        rootMoves = list(validMoves)
+        result = SearchResult(rootMoves[0] if rootMoves else None, 0, 0, rootMoves[:1], 0, 0.0)
+        if not rootMoves:
+            return result
+        rootResult = probeTablebaseRoot(gs, rootMoves, startTime)
+        if rootResult is None and self.useStore:
+            rootResult = probeStoreRoot(gs, rootMoves, maxDepth, startTime, storeTag(self))
+        if rootResult is not None:
+            if self.onIteration is not None:
+                self.onIteration(rootResult)
+            return rootResult
+        stats = SearchStats()
+        features = {name: getattr(self, name) for name in SEARCH_FEATURES}
+        self.searchID += 1
+        self.sharePosition(pickle.dumps(gs))
+        self.activeSearch.value = self.searchID
+        try:
+            result = self.deepen(gs, rootMoves, result, stats, features, startTime, maxTime, maxNodes, maxDepth)
+        finally:
+            self.activeSearch.value = 0  # les tâches encore en cours ou en file s'arrêtent
+        result.elapsed = time.perf_counter() - startTime
+        stats.elapsed = result.elapsed
+        result.stats = stats
+        if self.useStore:
+            recordStoreRoot(gs, result, storeTag(self))
+        return result
+
+    """
+    Iterations of iterativeDeepening: the result of the last completed one (result if none completed)
+    """
+    def deepen(self, gs, rootMoves, result, stats, features, startTime, maxTime, maxNodes, maxDepth):
+        nodes = 0
+        wallDeadline = time.time() + maxTime if maxTime is not None else None
+        for depth in range(1, maxDepth + 1):
+            deadline = nodesLeft = None
+            if depth > 1:  # depth 1 has no time or node limit: only a stop leaves the first root move as result
+                deadline = wallDeadline
+                if maxNodes is not None:
+                    nodesLeft = maxNodes - nodes
+                    if nodesLeft <= 0:
+                        break
+
+            first = self.waitFor(self.submit(rootMoves[0].moveID, depth, -CHECKMATE, deadline, nodesLeft, features))
+            if first is None:
+                break
+            nodes += first[3]
+            stats.add(first[4])
+            if first[1] is None:
+                break
+            alpha = first[1]
+            if nodesLeft is not None:
+                nodesLeft = max(1, (maxNodes - nodes) // max(1, len(rootMoves) - 1))
+            pending = [self.submit(move.moveID, depth, alpha, deadline, nodesLeft, features) for move in rootMoves[1:]]
+            outcomes = [first]
+            for task in pending:
+                outcome = self.waitFor(task)
+                if outcome is None:
+                    break
+                outcomes.append(outcome)
+            nodes += sum(outcome[3] for outcome in outcomes[1:])
+            for outcome in outcomes[1:]:
+                stats.add(outcome[4])
+            if len(outcomes) < len(rootMoves) or any(outcome[1] is None for outcome in outcomes):
+                break  # itération incomplète : on garde la précédente
+            stats.iterationNodes.append(nodes)
+
+            bestIndex = 0
+            for index in range(1, len(outcomes)):
+                if outcomes[index][1] > outcomes[bestIndex][1]:
+                    bestIndex = index
+            bestMove = rootMoves[bestIndex]
+            bestScore = outcomes[bestIndex][1]
+            rootMoves.insert(0, rootMoves.pop(bestIndex))
+            result = SearchResult(bestMove, bestScore, depth, self.rebuildPV(gs, bestMove, outcomes[bestIndex][2]),
+                                  nodes, time.perf_counter() - startTime)
+            if self.onIteration is not None:
+                self.onIteration(result)
+            if abs(bestScore) >= MATE_THRESHOLD or len(rootMoves) == 1:
+                break
+            if maxTime is not None and time.perf_counter() - startTime > maxTime / 2:
+                break
+
+        result.nodes = nodes
+        return result
+
+    """
+    Turns the moveIDs returned by a worker back into moves, by replaying them on the position
+    """
+    def rebuildPV(self, gs, firstMove, moveIDs):
+        pv = [firstMove]
+        gs.makeMove(firstMove)
+        for moveID in moveIDs:
+            move = next((m for m in gs.getValidMoves() if m.moveID == moveID), None)
+            if move is None:
+                break
+            pv.append(move)
+            gs.makeMove(move)
+        for _ in pv:
+            gs.undoMove()
+        gs.getValidMoves()  # rétablit checkmate/stalemate pour la position racine
+        return pv
+
+
+"""
+Search score (side to move's point of view) of a tablebase value found ply plies from the root:
+mates keep their distance, so the search prefers the fastest win and the slowest loss
+"""
+def tablebaseScore(value, ply):
+    if value > 0:
+        return CHECKMATE - ply - value
+    if value < 0:
+        return -CHECKMATE + ply - value - 1
+    return STALEMATE
+
+
+"""
+When the root position is in the tablebases, the best move is read from the tables of its children, without
+searching. Returns a SearchResult, or None if the position (or one of its children) is not covered
+"""
+def probeTablebaseRoot(gs, rootMoves, startTime):
+    if gs.pieceCount > ChessTablebase.MAX_PIECES or not tablebases.available or tablebases.probe(gs) is None:
+        return None
+    bestMove, bestScore = None, -CHECKMATE - 1
+    for move in rootMoves:
+        gs.makeMove(move)
+        value = tablebases.probe(gs)
+        gs.undoMove()
+        if value is None:
+            return None
+        score = -tablebaseScore(value, 1)
+        if score > bestScore:
+            bestMove, bestScore = move, score
+    gs.getValidMoves()  # rétablit checkmate/stalemate pour la position racine
+    return SearchResult(bestMove, bestScore, 1, [bestMove], len(rootMoves), time.perf_counter() - startTime)
+
+
+"""
+Key of the root position in positionStore: its Zobrist key mixed with the positions played since the last capture
+or pawn move, which decide repetition draws and the fifty-move rule inside the search.
+A stored result is thus only reused for the same position reached the same way since then
+"""
+def storeKey(gs):
+    ply = len(gs.moveLog)
+    history = gs.zobristLog[max(ply - gs.halfmoveClock, 0):ply + 1]
+    digest = hashlib.blake2b(",".join(map(str, history)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+"""
+Tag of the results of search in positionStore: evaluation tables, search options and STORE_VERSION.
+Results of a re-tuned evaluation or of other options are never reused
+"""
+def storeTag(search):
+    options = (STORE_VERSION, PIECE_SCORE, PIECE_POSITION_SCORES,
+               [getattr(search, name) for name in SEARCH_FEATURES])
+    return int.from_bytes(hashlib.blake2b(repr(options).encode(), digest_size=8).digest(), "big")
+
+
+"""
+Root position looked up in positionStore. A result at least maxDepth deep (STORE_MIN_DEPTH for a search limited
+by time or nodes) is returned as the search result; a shallower one only moves its best move to the front of
+rootMoves. Returns None when the position has to be searched.
+A stored result is always played the same way: the opening book, not the store, gives variety
+"""
+def probeStoreRoot(gs, rootMoves, maxDepth, startTime, tag):
+    if positionStore is None or not positionStore.available:
+        return None
+    stored = positionStore.probe(storeKey(gs), tag)
+    if stored is None:
+        return None
+    depth, score, moveID = stored
+    move = next((m for m in rootMoves if m.moveID == moveID), None)
+    if move is None:  # collision de clés
+        return None
+    if depth >= (maxDepth if maxDepth < MAX_DEPTH else STORE_MIN_DEPTH):
+        return SearchResult(move, score, depth, [move], 0, time.perf_counter() - startTime)
+    rootMoves.remove(move)
+    rootMoves.insert(0, move)
+    return None
+
+
+"""
+Keeps the outcome of a search of the root position in positionStore, if it went deep enough
+"""
+def recordStoreRoot(gs, result, tag):
+    if (positionStore is not None and positionStore.available and result.depth >= STORE_MIN_DEPTH
+            and result.bestMove is not None):
+        positionStore.store(storeKey(gs), tag, result.depth, result.score, result.bestMove.moveID)
+
+
+"""
+True when the side to move has a knight, bishop, rook or queen: without one, zugzwang is likely and a null move
+would prove nothing
+"""
+def hasNonPawnMaterial(gs):
+    color = 'w' if gs.whiteToMove else 'b'
+    for row in gs.board:
+        for piece in row:
+            if piece[0] == color and piece[1] in "NBRQ":
+                return True
+    return False
+
+
+"""
+Mate scores count plies from the root; the transposition table stores them counted from the position itself
+"""
+def scoreToTT(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def scoreFromTT(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+"""
+A positive score is good for white, a negative score is good for black.
+When the position carries evaluation tables (GameState.setEvaluationTables), the running totals kept by
+makeMove/undoMove are used directly instead of walking the board
+"""
+def scoreBoard(gs):
+    if gs.checkmate:
+        if gs.whiteToMove:
+            return -CHECKMATE
+        else:
+            return CHECKMATE
+    elif gs.stalemate:
+        return STALEMATE
+
+    if gs.materialTable is not None:
+        return (gs.materialScore + gs.positionScore) / 100  # centipions -> pions
+
+    score = 0
+    for row in range(len(gs.board)):
+        for col in range(len(gs.board[row])):
+            piece = gs.board[row][col]
+            if piece != "--":
+                # score it by position
+                piecePositionScore = 0
+                if piece[1] != "K":
+                    piecePositionScore = PIECE_POSITION_SCORES[piece][row][col]
+
+                # score it by material
+                if piece[0] == 'w':
+                    score += PIECE_SCORE[piece[1]] + piecePositionScore
+                elif piece[0] == 'b':
+                    score -= PIECE_SCORE[piece[1]] + piecePositionScore
+
+    return score
@@ -0,0 +1,175 @@
+"""
+Batch analysis of an EPD/FEN file over a pool of worker processes.
+
+Positions are read one line at a time and handed to the workers through a bounded window (a few tasks per
+worker), and each result is written as soon as it is ready, so memory stays flat whatever the size of the file.
+Results come out in completion order, as EPD lines carrying the standard analysis opcodes:
+    <position> bm <best move>; ce <centipawns> (or dm <moves to mate>); acd <depth>; acn <nodes>; acs <seconds>;
+    pv <moves>; id "<id of the input line, or its line number>";
+Moves are written in coordinate notation (e2e4, e7e8q).
+
+Usage:
+    python ChessAnalyse.py positions.epd --out results.epd --workers 4 --movetime 1.0
+    python ChessAnalyse.py positions.epd --depth 6            # or --nodes 100000
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import ChessAI
+import ChessEngine
+
+TASKS_PER_WORKER = 4  # positions en attente par processus : assez pour ne jamais les laisser sans travail
+
+workerSearch = None  # Search de chaque processus, gardée d'une position à l'autre
+
+
+"""
+Operations of an EPD line, split at the semicolons outside double quotes (id "a;b" is one operation)
+"""
+def splitOperations(text):
+    operations = []
+    start = 0
+    quoted = False
+    for index, char in enumerate(text):
+        if char == '"':
+            quoted = not quoted
+        elif char == ";" and not quoted:
+            operations.append(text[start:index])
+            start = index + 1
+    operations.append(text[start:])
+    return operations
+
+
+"""
+Splits an EPD or FEN line into the FEN of the position and its operations ({"id": ..., "bm": ...}).
+A FEN line has its two counters after the 4 position fields; an EPD line has operations there
+"""
+def parseEPD(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("invalid EPD line: " + line.strip())
+    rest = fields[4] if len(fields) > 4 else ""
+    counters = rest.split()[:2]
+    if len(counters) == 2 and counters[0].isdigit() and counters[1].isdigit():
+        return " ".join(fields[:4] + counters), {}
+    operations = {}
+    for operation in splitOperations(rest):
+        operation = operation.strip()
+        if operation:
+            opcode, _, operand = operation.partition(" ")
+            operations[opcode] = operand.strip().strip('"')
+    return " ".join(fields[:4]), operations
+
+
+"""
+Worker side: searches one position and returns its result line (or an error comment)
+"""
+def analysePosition(lineNumber, fen, positionID, maxTime, maxNodes, maxDepth, backend):
+    global workerSearch
+    if workerSearch is None:
+        workerSearch = ChessAI.Search()
+        workerSearch.useStore = False  # une analyse rapporte une vraie recherche (acd, acn), jamais un résultat gardé
+    try:
+        gs = ChessEngine.GameState(backend, fen)
+    except (ValueError, IndexError, KeyError) as error:
+        return lineNumber, 0, '%s c0 "invalid position: %s"; id "%s";' % (fen, error, positionID)
+    epd = gs.getFEN(counters=False)
+    validMoves = gs.getValidMoves()
+    if not validMoves:
+        return lineNumber, 0, '%s c0 "%s"; id "%s";' % (epd, "checkmate" if gs.checkmate else "stalemate", positionID)
+    result = workerSearch.iterativeDeepening(gs, validMoves, maxTime, maxNodes, maxDepth)
+    if abs(result.score) >= ChessAI.MATE_THRESHOLD:
+        moves = (ChessAI.CHECKMATE - abs(result.score) + 1) // 2
+        score = "dm %d" % (moves if result.score > 0 else -moves)
+    else:
+        score = "ce %d" % round(result.score * 100)
+    line = '%s bm %s; %s; acd %d; acn %d; acs %.2f; pv %s; id "%s";' % (
+        epd, result.bestMove.getChessNotation(), score, result.depth, result.nodes, result.elapsed,
+        " ".join(move.getChessNotation() for move in result.pv), positionID)
+    return lineNumber, result.nodes, line
+
+
+"""
+Streams the positions of inputStream through a pool of workers and writes a result line per position to out.
+Returns (positions analysed, total nodes)
+"""
+def analyseStream(inputStream, out, workers=None, maxTime=ChessAI.MOVE_TIME, maxNodes=None,
+                  maxDepth=ChessAI.MAX_DEPTH, backend="mailbox", log=sys.stderr):
+    workers = workers or os.cpu_count() or 1
+    window = threading.BoundedSemaphore(workers * TASKS_PER_WORKER)
+    totals = {"positions": 0, "nodes": 0}
+    errors = []
+    startTime = time.perf_counter()
+
+    def onResult(outcome):
+        _, nodes, line = outcome
+        out.write(line + "\n")
+        out.flush()
+        totals["positions"] += 1
+        totals["nodes"] += nodes
+        window.release()
+
+    def onError(error):
+        errors.append(error)
+        window.release()
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for lineNumber, line in enumerate(inputStream, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            try:
+                fen, operations = parseEPD(line)
+            except ValueError as error:
+                print("line %d: %s" % (lineNumber, error), file=log)
+                continue
+            window.acquire()  # attend qu'une place se libère : l'entrée n'est lue qu'au rythme de l'analyse
+            pool.apply_async(analysePosition, (lineNumber, fen, operations.get("id", "line %d" % lineNumber),
+                                               maxTime, maxNodes, maxDepth, backend),
+                             callback=onResult, error_callback=onError)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+    for error in errors:
+        print("worker error: %r" % error, file=log)
+    elapsed = time.perf_counter() - startTime
+    print("%d positions, %d nodes in %.1fs (%.0f nodes/s)" % (totals["positions"], totals["nodes"], elapsed,
+                                                             totals["nodes"] / max(elapsed, 1e-9)), file=log)
+    return totals["positions"], totals["nodes"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse every position of an EPD/FEN file")
+    parser.add_argument("positions", help="EPD or FEN file, one position per line ('-' for stdin)")
+    parser.add_argument("--out", default="-", help="result file ('-' for stdout)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per core)")
+    parser.add_argument("--movetime", type=float, default=None, help="seconds per position")
+    parser.add_argument("--nodes", type=int, default=None)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--backend", default="mailbox", choices=("mailbox", "bitboard"))
+    args = parser.parse_args(argv)
+
+    maxTime = args.movetime
+    if maxTime is None and args.nodes is None and args.depth is None:
+        maxTime = ChessAI.MOVE_TIME
+    inputStream = sys.stdin if args.positions == "-" else open(args.positions)
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        analyseStream(inputStream, out, args.workers, maxTime, args.nodes, args.depth or ChessAI.MAX_DEPTH,
+                      args.backend)
+    finally:
+        if inputStream is not sys.stdin:
+            inputStream.close()
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Bitboard backend for GameState.
+Each piece type and colour is a 64-bit int, bit (row * 8 + col) being set when the piece stands on that square.
+Knight, king and pawn attacks and the slider rays are precomputed once, at import time.
+The 8x8 list-of-strings board is still kept up to date by GameState.makeMove/undoMove, as a view for rendering.
+"""
+
+import ChessEngine
+
+PIECES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+FULL_BOARD = (1 << 64) - 1
+
+
+def squareBit(r, c):
+    return 1 << (r * 8 + c)
+
+
+def _buildStepAttacks(steps):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in steps:
+            if 0 <= r + dr <= 7 and 0 <= c + dc <= 7:
+                attacks |= squareBit(r + dr, c + dc)
+        table.append(attacks)
+    return table
+
+
+def _buildRays(direction):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        ray = 0
+        for i in range(1, 8):
+            endRow, endCol = r + direction[0] * i, c + direction[1] * i
+            if not (0 <= endRow <= 7 and 0 <= endCol <= 7):
+                break
+            ray |= squareBit(endRow, endCol)
+        table.append(ray)
+    return table
+
+
+KNIGHT_ATTACKS = _buildStepAttacks(ChessEngine.KNIGHT_DIRECTIONS)
+KING_ATTACKS = _buildStepAttacks(ChessEngine.KING_DIRECTIONS)
+PAWN_ATTACKS = {"w": _buildStepAttacks(((-1, -1), (-1, 1))),  # les pions blancs montent (row - 1)
+                "b": _buildStepAttacks(((1, -1), (1, 1)))}
+
+# a ray direction is "positive" when the square index grows along it: its first blocker is the lowest set bit
+RAYS = {direction: _buildRays(direction) for direction in ChessEngine.KING_DIRECTIONS}
+POSITIVE_DIRECTIONS = {direction for direction in ChessEngine.KING_DIRECTIONS if direction[0] * 8 + direction[1] > 0}
+
+
+def rayAttacks(direction, sq, occupied):
+    ray = RAYS[direction][sq]
+    blockers = ray & occupied
+    if blockers:
+        if direction in POSITIVE_DIRECTIONS:
+            blocker = (blockers & -blockers).bit_length() - 1
+        else:
+            blocker = blockers.bit_length() - 1
+        ray ^= RAYS[direction][blocker]
+    return ray
+
+
+def rookAttacks(sq, occupied):
+    return (rayAttacks((-1, 0), sq, occupied) | rayAttacks((0, -1), sq, occupied) |
+            rayAttacks((1, 0), sq, occupied) | rayAttacks((0, 1), sq, occupied))
+
+
+def bishopAttacks(sq, occupied):
+    return (rayAttacks((-1, -1), sq, occupied) | rayAttacks((-1, 1), sq, occupied) |
+            rayAttacks((1, 1), sq, occupied) | rayAttacks((1, -1), sq, occupied))
+
+
+def iterSquares(bitboard):
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+class BitboardGameState(ChessEngine.GameState):
+    """
+    Same makeMove/undoMove/getValidMoves API as GameState, with move generation and attack detection done on bitboards.
+    Built with ChessEngine.GameState(backend="bitboard").
+    """
+    def __init__(self, backend="bitboard", fen=None):
+        ChessEngine.GameState.__init__(self, backend, fen)
+        self.initBitboards()
+
+    def loadFEN(self, fen):
+        ChessEngine.GameState.loadFEN(self, fen)
+        self.initBitboards()
+
+    """
+    Rebuilds every bitboard from the list-of-strings board
+    """
+    def initBitboards(self):
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        self.colorBitboards = {"w": 0, "b": 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.bitboards[piece] |= squareBit(r, c)
+                    self.colorBitboards[piece[0]] |= squareBit(r, c)
+
+    """
+    Toggles the bits touched by a move. XOR is its own inverse, so the same call both makes and unmakes the move
+    """
+    def toggleMoveBits(self, move, pieceLanded):
+        bitboards = self.bitboards
+        colors = self.colorBitboards
+        color = move.pieceMoved[0]
+        startBit = squareBit(move.startRow, move.startCol)
+        endBit = squareBit(move.endRow, move.endCol)
+        bitboards[move.pieceMoved] ^= startBit
+        bitboards[pieceLanded] ^= endBit
+        colors[color] ^= startBit | endBit
+        if move.isCapture:
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            captureBit = squareBit(captureRow, move.endCol)
+            bitboards[move.pieceCaptured] ^= captureBit
+            colors[move.pieceCaptured[0]] ^= captureBit
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2:  # king side
+                rookBits = squareBit(move.endRow, move.endCol + 1) | squareBit(move.endRow, move.endCol - 1)
+            else:  # queen side
+                rookBits = squareBit(move.endRow, move.endCol - 2) | squareBit(move.endRow, move.endCol + 1)
+            bitboards[color + 'R'] ^= rookBits
+            colors[color] ^= rookBits
+
+    def makeMove(self, move):
+        ChessEngine.GameState.makeMove(self, move)
+        self.toggleMoveBits(move, self.board[move.endRow][move.endCol])  # la pièce posée (promotion comprise)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            if move is not None:  # un coup nul ne change aucun bitboard
+                self.toggleMoveBits(move, self.board[move.endRow][move.endCol])
+            ChessEngine.GameState.undoMove(self)
+
+    """
+    Bitboard of the pieces of enemyColor attacking square sq, given the occupancy
+    """
+    def attackersTo(self, sq, enemyColor, occupied):
+        bitboards = self.bitboards
+        allyColor = "b" if enemyColor == "w" else "w"
+        queens = bitboards[enemyColor + 'Q']
+        return ((KNIGHT_ATTACKS[sq] & bitboards[enemyColor + 'N']) |
+                (KING_ATTACKS[sq] & bitboards[enemyColor + 'K']) |
+                (PAWN_ATTACKS[allyColor][sq] & bitboards[enemyColor + 'p']) |
+                (rookAttacks(sq, occupied) & (bitboards[enemyColor + 'R'] | queens)) |
+                (bishopAttacks(sq, occupied) & (bitboards[enemyColor + 'B'] | queens)))
+
+    def squareUnderAttack(self, r, c):
+        enemyColor = "b" if self.whiteToMove else "w"
+        occupied = self.colorBitboards["w"] | self.colorBitboards["b"]
+        return self.attackersTo(r * 8 + c, enemyColor, occupied) != 0
+
+    """
+    Finds the allied pieces pinned to the king on square kingSq.
+    Returns a dict square -> bitboard of the squares that piece may still move to (its pin line, pinner included)
+    """
+    def getPinMasks(self, kingSq, allyColor, enemyColor, occupied):
+        pinMasks = {}
+        allies = self.colorBitboards[allyColor]
+        queens = self.bitboards[enemyColor + 'Q']
+        rooks = self.bitboards[enemyColor + 'R'] | queens
+        bishops = self.bitboards[enemyColor + 'B'] | queens
+        for direction in ChessEngine.KING_DIRECTIONS:
+            sliders = rooks if direction in ChessEngine.ROOK_DIRECTIONS else bishops
+            if not RAYS[direction][kingSq] & sliders:
+                continue
+            firstHit = rayAttacks(direction, kingSq, occupied) & occupied
+            if not firstHit & allies:
+                continue
+            pinnedSq = firstHit.bit_length() - 1
+            pinner = rayAttacks(direction, pinnedSq, occupied) & occupied & sliders
+            if pinner:
+                pinnerSq = pinner.bit_length() - 1
+                pinMasks[pinnedSq] = RAYS[direction][kingSq] & ~RAYS[direction][pinnerSq]
+        return pinMasks
+
+    """
+    All moves, considering checks.
+    Checkers and pinned pieces are found once; every piece then only emits moves landing on its allowed squares.
+    With capturesOnly the allowed squares are restricted to enemy pieces (see GameState.getValidMoves)
+    """
+    def getValidMoves(self, capturesOnly=False):
+        moves = []
+        board = self.board
+        bitboards = self.bitboards
+        if self.whiteToMove:
+            allyColor, enemyColor, forward, startRow = "w", "b", -8, 6
+        else:
+            allyColor, enemyColor, forward, startRow = "b", "w", 8, 1
+        allies = self.colorBitboards[allyColor]
+        enemies = self.colorBitboards[enemyColor]
+        occupied = allies | enemies
+        kingSq = bitboards[allyColor + 'K'].bit_length() - 1
+
+        checkers = self.attackersTo(kingSq, enemyColor, occupied)
+        inCheck = checkers != 0
+
+        # king moves: the king is lifted from the board so it cannot hide behind itself along a checking ray
+        kingRow, kingCol = divmod(kingSq, 8)
+        occupiedWithoutKing = occupied ^ (1 << kingSq)
+        landingMask = enemies if capturesOnly else ~allies
+        for sq in iterSquares(KING_ATTACKS[kingSq] & landingMask):
+            if not self.attackersTo(sq, enemyColor, occupiedWithoutKing):
+                moves.append(ChessEngine.Move((kingRow, kingCol), divmod(sq, 8), board))
+
+        if checkers & (checkers - 1) == 0:  # pas d'échec double
+            if inCheck:
+                checkerSq = checkers.bit_length() - 1
+                targetMask = checkers | self.getBetweenMask(kingSq, checkerSq)
+            else:
+                targetMask = FULL_BOARD
+            if capturesOnly:
+                targetMask &= enemies
+            pinMasks = self.getPinMasks(kingSq, allyColor, enemyColor, occupied)
+            self.getBitboardPawnMoves(moves, allyColor, enemyColor, forward, startRow, occupied, enemies,
+                                      targetMask, pinMasks, kingSq, capturesOnly)
+            for piece, attacks in (('N', None), ('B', bishopAttacks), ('R', rookAttacks), ('Q', None)):
+                for sq in iterSquares(bitboards[allyColor + piece]):
+                    if piece == 'N':
+                        if sq in pinMasks:
+                            continue
+                        targets = KNIGHT_ATTACKS[sq]
+                    elif piece == 'Q':
+                        targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                    else:
+                        targets = attacks(sq, occupied)
+                    targets &= ~allies & targetMask & pinMasks.get(sq, FULL_BOARD)
+                    start = divmod(sq, 8)
+                    for endSq in iterSquares(targets):
+                        moves.append(ChessEngine.Move(start, divmod(endSq, 8), board))
+            if not inCheck and not capturesOnly:
+                self.getCastleMoves(kingRow, kingCol, moves)
+
+        if len(moves) == 0 and not capturesOnly:
+            if inCheck:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    """
+    Squares strictly between two squares on the same line (the checker and the king), 0 if they are not aligned
+    """
+    def getBetweenMask(self, fromSq, toSq):
+        for direction in ChessEngine.KING_DIRECTIONS:
+            if RAYS[direction][fromSq] & (1 << toSq):
+                return RAYS[direction][fromSq] & ~RAYS[direction][toSq] & ~(1 << toSq)
+        return 0
+
+    def getBitboardPawnMoves(self, moves, allyColor, enemyColor, forward, startRow, occupied, enemies,
+                             targetMask, pinMasks, kingSq, capturesOnly=False):
+        board = self.board
+        for sq in iterSquares(self.bitboards[allyColor + 'p']):
+            allowed = targetMask & pinMasks.get(sq, FULL_BOARD)
+            start = divmod(sq, 8)
+            oneStep = sq + forward
+            if not occupied & (1 << oneStep) and not capturesOnly:
+                if allowed & (1 << oneStep):
+                    self.appendPawnMove(moves, ChessEngine.Move(start, divmod(oneStep, 8), board))
+                twoSteps = oneStep + forward
+                if start[0] == startRow and not occupied & (1 << twoSteps) and allowed & (1 << twoSteps):
+                    moves.append(ChessEngine.Move(start, divmod(twoSteps, 8), board))
+            attacks = PAWN_ATTACKS[allyColor][sq]
+            for endSq in iterSquares(attacks & enemies & allowed):
+                self.appendPawnMove(moves, ChessEngine.Move(start, divmod(endSq, 8), board))
+
+            if self.enpassantPossible != ():
+                epSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+                if attacks & (1 << epSq):
+                    capturedBit = 1 << (epSq - forward)
+                    # deux pions quittent la même rangée : on vérifie le roi avec l'occupation finale
+                    after = occupied ^ (1 << sq) ^ (1 << epSq) ^ capturedBit
+                    if not self.attackersTo(kingSq, enemyColor, after) & ~capturedBit:
+                        moves.append(ChessEngine.Move(start, divmod(epSq, 8), board, isEnpassantMove=True))
@@ -0,0 +1,169 @@
+"""
+Opening book: a sorted binary file of (position key, move, weight) entries, read through mmap.
+
+The entry layout follows Polyglot: 16 bytes, big-endian, key (8 bytes), move (2), weight (2), learn (4),
+sorted by key. Keys are this engine's Zobrist keys (ChessEngine.ZOBRIST_*) and moves are Move.moveID values,
+so Polyglot books from other engines cannot be read, but the file is built and searched the same way.
+A lookup is a binary search over the mapped file: nothing is loaded into memory, and every engine process
+opening the same book shares its pages through the OS page cache.
+
+Usage:
+    python ChessBook.py build games.pgn [more.pgn ...] --out book.bin --max-ply 20
+    python ChessBook.py probe book.bin [--fen "<fen>"]
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from collections import defaultdict
+
+import ChessEngine
+import ChessPGN
+
+ENTRY = struct.Struct(">QHHI")  # clé, coup, poids, apprentissage (inutilisé)
+MAX_WEIGHT = 0xFFFF
+DEFAULT_BOOK = "book.bin"
+RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}  # (blancs, noirs) ; partie sans résultat : nulle
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file. probe() returns a book move of the position, or None
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // ENTRY.size
+        # un fichier vide ne peut pas être projeté en mémoire
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+
+    def keyAt(self, index):
+        return ENTRY.unpack_from(self.data, index * ENTRY.size)[0]
+
+    """
+    (moveID, weight) of every entry of the position key: binary search for the first one, then a forward scan
+    """
+    def findEntries(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.count:
+            entryKey, moveID, weight, _ = ENTRY.unpack_from(self.data, low * ENTRY.size)
+            if entryKey != key:
+                break
+            entries.append((moveID, weight))
+            low += 1
+        return entries
+
+    """
+    A legal book move for gs, picked at random in proportion to the weights (the heaviest with randomChoice=False)
+    """
+    def probe(self, gs, validMoves=None, randomChoice=True):
+        entries = self.findEntries(gs.zobristKey)
+        if not entries:
+            return None
+        movesByID = {move.moveID: move for move in (validMoves if validMoves is not None else gs.getValidMoves())}
+        candidates = [(movesByID[moveID], weight) for moveID, weight in entries if moveID in movesByID and weight > 0]
+        if not candidates:
+            return None
+        if not randomChoice:
+            return max(candidates, key=lambda candidate: candidate[1])[0]
+        return random.choices([move for move, _ in candidates], weights=[weight for _, weight in candidates])[0]
+
+    def close(self):
+        if self.count:
+            self.data.close()
+        self.file.close()
+
+
+"""
+The book at path, or None if there is no such file
+"""
+def openBook(path=DEFAULT_BOOK):
+    if path is None or not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+"""
+Counts the moves played in the first maxPly plies of the games of PGN files. As in Polyglot, a move scores
+2 per game won by the side playing it and 1 per draw (games lost are skipped unless every result counts)
+"""
+def collectMoves(paths, maxPly=20, onlyResults=True, log=sys.stdout):
+    weights = defaultdict(int)  # (clé, moveID) -> poids
+    games = skipped = 0
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as stream:
+            for game in ChessPGN.readGames(stream):
+                games += 1
+                gs = ChessEngine.GameState(fen=game.tags.get("FEN"))
+                gs.underpromotions = True
+                points = RESULT_POINTS.get(game.result, (1, 1))
+                try:
+                    for san in game.moves[:maxPly]:
+                        move = ChessPGN.parseSAN(gs, san)
+                        score = points[0] if gs.whiteToMove else points[1]
+                        if score or not onlyResults:
+                            weights[(gs.zobristKey, move.moveID)] += score or 1
+                        gs.makeMove(move)
+                except ValueError:
+                    skipped += 1  # coup illisible : on garde les coups précédents de la partie
+    print("%d games read, %d with an unreadable move" % (games, skipped), file=log)
+    return weights
+
+
+"""
+Writes the entries sorted by key (heaviest move first), weights scaled down to fit in 16 bits
+"""
+def writeBook(weights, path, minWeight=1):
+    entries = [(key, moveID, weight) for (key, moveID), weight in weights.items() if weight >= minWeight]
+    entries.sort(key=lambda entry: (entry[0], -entry[2]))
+    scale = max(1.0, max((entry[2] for entry in entries), default=0) / MAX_WEIGHT)
+    with open(path, "wb") as out:
+        for key, moveID, weight in entries:
+            out.write(ENTRY.pack(key, moveID, max(1, int(weight / scale)), 0))
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--out", default=DEFAULT_BOOK)
+    build.add_argument("--max-ply", type=int, default=20)
+    build.add_argument("--min-weight", type=int, default=1)
+    build.add_argument("--all-results", action="store_true", help="also count the moves of the losing side")
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        weights = collectMoves(args.pgn, args.max_ply, not args.all_results)
+        count = writeBook(weights, args.out, args.min_weight)
+        print("%d entries written to %s" % (count, args.out))
+        return 0
+
+    book = OpeningBook(args.book)
+    gs = ChessEngine.GameState(fen=args.fen)
+    gs.underpromotions = True
+    movesByID = {move.moveID: move for move in gs.getValidMoves()}
+    for moveID, weight in book.findEntries(gs.zobristKey):
+        move = movesByID.get(moveID)
+        print("%-8s %d" % (move.getChessNotation() if move else "?%d" % moveID, weight))
+    book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,13 +4,67 @@ Cette classe est responsable de stocker toutes les informations sur l'état actu
 Elle valide les mouvements valides et conserve un journal des coups.
 """
 
+import random
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))  # Haut, gauche, bas, droite
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, 1), (1, -1))  # diagonals: up/left up/right down/right down/left
+KING_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+KNIGHT_DIRECTIONS = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2))
+
+"""
+Zobrist keys: one random 64-bit number per (piece, square), for the side to move, for each of the 16 castling
+rights combinations and for each en passant file. A position's key is the XOR of the numbers describing it.
+The generator is seeded so every process (and every run) computes the same keys.
+"""
+_zobristRandom = random.Random(20240611)
+ZOBRIST_PIECES = {color + piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                  for color in "wb" for piece in "pNBRQK"}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [_zobristRandom.getrandbits(64) for _ in range(16)]
+ZOBRIST_ENPASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)]
+
+SQUARES = tuple(tuple((r, c) for c in range(8)) for r in range(8))  # tuples (ligne, colonne) partagés, créés une fois
+
+"""
+Castling rights are 4 bits, in the order of CastleRights.index(). A move keeps the rights allowed by the masks
+of its start and end squares: moving the king or a rook, or capturing a rook on its corner, clears them.
+"""
+CASTLE_WKS, CASTLE_BKS, CASTLE_WQS, CASTLE_BQS = 1, 2, 4, 8
+ALL_CASTLING = CASTLE_WKS | CASTLE_BKS | CASTLE_WQS | CASTLE_BQS
+CASTLING_MASKS = [[ALL_CASTLING] * 8 for _ in range(8)]
+CASTLING_MASKS[7][4] = ALL_CASTLING & ~(CASTLE_WKS | CASTLE_WQS)
+CASTLING_MASKS[7][7] = ALL_CASTLING & ~CASTLE_WKS
+CASTLING_MASKS[7][0] = ALL_CASTLING & ~CASTLE_WQS
+CASTLING_MASKS[0][4] = ALL_CASTLING & ~(CASTLE_BKS | CASTLE_BQS)
+CASTLING_MASKS[0][7] = ALL_CASTLING & ~CASTLE_BKS
+CASTLING_MASKS[0][0] = ALL_CASTLING & ~CASTLE_BQS
+
+"""
+Undo stack: for each ply, the irreversible state of the position is packed in one int
+(castling bits | en passant file + 1 << 4 | halfmove clock << 8) and its Zobrist key stored beside it.
+Both lists are preallocated and written by index, so makeMove/undoMove allocate nothing.
+"""
+STATE_STACK_SIZE = 512
+
+
 class GameState:
-    def __init__(self):
+    """
+    backend selects the move generator: "mailbox" (this class, 8x8 list of strings)
+    or "bitboard" (ChessBitboard.BitboardGameState, which keeps self.board as a view).
+    """
+    def __new__(cls, backend="mailbox", fen=None):
+        if cls is GameState and backend == "bitboard":
+            import ChessBitboard  # import local : ChessBitboard importe ChessEngine
+            cls = ChessBitboard.BitboardGameState
+        return object.__new__(cls)
+
+    def __init__(self, backend="mailbox", fen=None):
         """
         Board is a 8x8 2d list, each element in list has 2 characters.
         The first character represents the color of the piece: 'b' or 'w'.
         The second character represents the type of the piece: 'R', 'N', 'B', 'Q', 'K' or 'p'.
         "--" represents an empty space with no piece.
+        fen, when given, replaces the starting position (see loadFEN).
         """
         self.board = [
             ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
@@ -32,14 +86,204 @@ class GameState:
         self.whiteKingLocation = (7, 4) #position du roi blanc
         self.blackKingLocation = (0, 4) #position du roi noir
         self.enpassantPossible = () #stocke une case ou un coup en passant est possible
-        self.enpassantPossibleLog = [self.enpassantPossible]
         self.whiteToMove = True #tour des blanc
         self.checkmate = False #si c'est un echec et mat
         self.stalemate = False #si c'est un echec
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        self.castlingRights = ALL_CASTLING #droits de roque, voir CASTLE_WKS...
+        self.halfmoveClock = 0 #demi-coups depuis la dernière prise ou le dernier coup de pion (règle des 50 coups)
+        self.fullmoveNumber = 1 #numéro du coup, augmenté après chaque coup noir
+        self.pieceCount = 32 #nombre de pièces sur l'échiquier, rois compris (sondage des tables de finales)
+        self.backend = backend
+        self.resetLogs() #journal des coups et pile d'annulation
+        self.pins = {} #pièces clouées pendant getValidMoves : case -> direction du clouage
+        self.capturesOnly = False #vrai pendant getValidMoves(capturesOnly=True) : les coups calmes ne sont pas générés
+        self.underpromotions = False #si vrai, les promotions en tour, fou et cavalier sont aussi générées
+        self.materialTable = None #valeur de chaque pièce en centipions, voir setEvaluationTables
+        self.positionTable = None #bonus de position par pièce et par case, en centipions
+        self.materialScore = 0 #somme du matériel (positif : avantage blanc), tenue à jour par makeMove/undoMove
+        self.positionScore = 0 #somme des bonus de position
+        if fen is not None:
+            self.loadFEN(fen)
+
+    """
+    Sets up the position described by a FEN string (board, side to move, castling rights, en passant square,
+    halfmove clock and fullmove number). The counters are optional, so an EPD position (4 fields) loads too.
+    The move log is cleared: the loaded position becomes the start of the game.
+    """
+    def loadFEN(self, fen):
+        fields = fen.split()
+        self.board = []
+        for rankText in fields[0].split("/"):
+            row = []
+            for char in rankText:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                else:
+                    row.append(("w" if char.isupper() else "b") + (char.upper() if char.lower() != 'p' else 'p'))
+            if len(row) != 8:
+                raise ValueError("invalid FEN rank: " + rankText)
+            self.board.append(row)
+        if len(self.board) != 8:
+            raise ValueError("invalid FEN board: " + fields[0])
+        self.pieceCount = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] == "wK":
+                    self.whiteKingLocation = (r, c)
+                elif self.board[r][c] == "bK":
+                    self.blackKingLocation = (r, c)
+                if self.board[r][c] != "--":
+                    self.pieceCount += 1
+
+        if len(fields) > 1 and fields[1] not in ("w", "b"):
+            raise ValueError("invalid FEN side to move: " + fields[1])
+        self.whiteToMove = len(fields) < 2 or fields[1] == "w"
+        castling = fields[2] if len(fields) > 2 else "-"
+        self.castlingRights = CastleRights("K" in castling, "k" in castling, "Q" in castling, "q" in castling).index()
+        enpassant = fields[3] if len(fields) > 3 else "-"
+        if enpassant == "-":
+            self.enpassantPossible = ()
+        else:
+            self.enpassantPossible = SQUARES[Move.ranksToRows[enpassant[1]]][Move.filesToCols[enpassant[0]]]
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 and fields[4].isdigit() else 0
+        self.fullmoveNumber = int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 1
+        self.checkmate = False
+        self.stalemate = False
+        self.resetLogs()
+        if self.materialTable is not None:
+            self.computeEvaluation()
+
+    """
+    FEN string of the current position. With counters=False only the 4 position fields are written (EPD)
+    """
+    def getFEN(self, counters=True):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == "w" else piece[1].lower()
+            ranks.append(rank + (str(empty) if empty else ""))
+        castling = "".join(letter for bit, letter in ((CASTLE_WKS, "K"), (CASTLE_WQS, "Q"), (CASTLE_BKS, "k"),
+                                                      (CASTLE_BQS, "q")) if self.castlingRights & bit) or "-"
+        enpassant = self.enpassantPossible
+        fields = ["/".join(ranks), "w" if self.whiteToMove else "b", castling,
+                  Move.colsToFiles[enpassant[1]] + Move.rowsToRanks[enpassant[0]] if enpassant != () else "-"]
+        if counters:
+            fields += [str(self.halfmoveClock), str(self.fullmoveNumber)]
+        return " ".join(fields)
+
+    """
+    Empties the move log and restarts the undo stack from the current position
+    """
+    def resetLogs(self):
         self.moveLog = [] #liste des coups joués
+        self.stateLog = [0] * STATE_STACK_SIZE #état irréversible après chaque coup, voir STATE_STACK_SIZE
+        self.zobristLog = [0] * STATE_STACK_SIZE #clé de la position après chaque coup (répétitions)
+        self.zobristKey = self.computeZobristKey() #hash de la position, mis à jour à chaque coup
+        self.saveState(0)
+
+    """
+    Stores the irreversible state and the key of the current position at index ply of the undo stack
+    """
+    def saveState(self, ply):
+        if ply == len(self.stateLog):  # partie plus longue que la pile : on double sa taille
+            self.stateLog.extend([0] * ply)
+            self.zobristLog.extend([0] * ply)
+        enpassantCode = self.enpassantPossible[1] + 1 if self.enpassantPossible != () else 0
+        self.stateLog[ply] = self.castlingRights | enpassantCode << 4 | self.halfmoveClock << 8
+        self.zobristLog[ply] = self.zobristKey
+
+    """
+    Castling rights as a CastleRights object (read only: they are kept in self.castlingRights)
+    """
+    @property
+    def currentCastlingRight(self):
+        rights = self.castlingRights
+        return CastleRights(bool(rights & CASTLE_WKS), bool(rights & CASTLE_BKS),
+                            bool(rights & CASTLE_WQS), bool(rights & CASTLE_BQS))
+
+    """
+    True if the current position already occurred since the last capture or pawn move, with the same side to move.
+    count=3 asks for a threefold repetition; the search treats the first repetition as a draw
+    """
+    def isRepetition(self, count=2):
+        ply = len(self.moveLog)
+        key = self.zobristKey
+        seen = 1
+        for i in range(ply - 4, max(ply - self.halfmoveClock, 0) - 1, -2):
+            if self.zobristLog[i] == key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    """
+    True once 50 moves per side were played without a capture or a pawn move
+    """
+    def isFiftyMoveDraw(self):
+        return self.halfmoveClock >= 100
+
+    """
+    Attaches the evaluation tables: pieceValues maps a piece type ('p', 'N', ...) to its material value,
+    squareValues maps a piece ('wp', 'bN', ...) to its 8x8 position bonuses (pieces without a table get none).
+    Values are stored in centipawns, signed from white's point of view, so makeMove/undoMove can keep
+    materialScore and positionScore up to date with integer deltas
+    """
+    def setEvaluationTables(self, pieceValues, squareValues):
+        self.materialTable = {}
+        self.positionTable = {}
+        for color, sign in (("w", 1), ("b", -1)):
+            for pieceType in "pNBRQK":
+                piece = color + pieceType
+                self.materialTable[piece] = sign * round(pieceValues[pieceType] * 100)
+                table = squareValues.get(piece)
+                self.positionTable[piece] = [sign * round(table[sq // 8][sq % 8] * 100) if table else 0
+                                             for sq in range(64)]
+        self.computeEvaluation()
+
+    """
+    Recomputes materialScore and positionScore from the board
+    """
+    def computeEvaluation(self):
+        self.materialScore = 0
+        self.positionScore = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.materialScore += self.materialTable[piece]
+                    self.positionScore += self.positionTable[piece][r * 8 + c]
+
+    """
+    Change of (materialScore, positionScore) caused by a move; pieceLanded is the piece standing on the end square
+    after the move (the new piece for a promotion). makeMove adds it, undoMove subtracts it
+    """
+    def getEvaluationDelta(self, move, pieceLanded):
+        positionTable = self.positionTable
+        materialDelta = 0
+        positionDelta = positionTable[pieceLanded][move.endRow * 8 + move.endCol] - \
+            positionTable[move.pieceMoved][move.startRow * 8 + move.startCol]
+        if move.isCapture:
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            materialDelta -= self.materialTable[move.pieceCaptured]
+            positionDelta -= positionTable[move.pieceCaptured][captureRow * 8 + move.endCol]
+        if move.isPawnPromotion:
+            materialDelta += self.materialTable[pieceLanded] - self.materialTable[move.pieceMoved]
+        if move.isCastleMove:
+            rookTable = positionTable[move.pieceMoved[0] + 'R']
+            rowStart = move.endRow * 8
+            if move.endCol - move.startCol == 2:  # king side
+                positionDelta += rookTable[rowStart + 5] - rookTable[rowStart + 7]
+            else:  # queen side
+                positionDelta += rookTable[rowStart + 3] - rookTable[rowStart]
+        return materialDelta, positionDelta
 
     """
     Applique un mouvement sur l'échiquier, en mettant à jour les variables liées à l'état du jeu.
@@ -51,13 +295,13 @@ class GameState:
         self.whiteToMove = not self.whiteToMove  # Change le tour
 
         if move.pieceMoved == 'wK':
-            self.whiteKingLocation = (move.endRow, move.endCol)  # Met à jour la position du roi blanc
+            self.whiteKingLocation = SQUARES[move.endRow][move.endCol]  # Met à jour la position du roi blanc
         elif move.pieceMoved == 'bK':
-            self.blackKingLocation = (move.endRow, move.endCol)  # Met à jour la position du roi noir
+            self.blackKingLocation = SQUARES[move.endRow][move.endCol]  # Met à jour la position du roi noir
 
         # pawn promotion
         if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q' #Promotion automatique des pions en reines.
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice #Promotion (en reine par défaut).
 
         # if enpassant move, capture pawn
         if move.isEnpassantMove:
@@ -65,11 +309,21 @@ class GameState:
             #Gère les captures en passant.
 
         # Définit si un coup en passant est possible après un déplacement de pion de deux cases.
+        previousEnpassant = self.enpassantPossible
         if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:  # only on 2-square pawn advances
-            self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol)
+            self.enpassantPossible = SQUARES[(move.startRow + move.endRow) // 2][move.startCol]
         else:
             self.enpassantPossible = ()
 
+        if move.pieceMoved[1] == 'p' or move.isCapture:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if move.isCapture:
+            self.pieceCount -= 1
+        if self.whiteToMove:  # les noirs viennent de jouer
+            self.fullmoveNumber += 1
+
         # make castle move
         if move.isCastleMove:
             if move.endCol - move.startCol == 2:  # king side
@@ -79,11 +333,52 @@ class GameState:
                 self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]
                 self.board[move.endRow][move.endCol - 2] = '--'
 
-        self.enpassantPossibleLog.append(self.enpassantPossible)  # Sauvegarde l'état du coup en passant
+        oldCastleIndex = self.castlingRights
         self.updateCastleRights(move)  # Met à jour les droits de roque
-        self.castleRightsLog.append(CastleRights(
-            self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-            self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+
+        # incremental Zobrist update: XOR out what left a square, XOR in what arrived
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow * 8 + move.startCol]
+        key ^= ZOBRIST_PIECES[self.board[move.endRow][move.endCol]][move.endRow * 8 + move.endCol]
+        if move.isCapture:
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][captureRow * 8 + move.endCol]
+        if move.isCastleMove:
+            rook = move.pieceMoved[0] + 'R'
+            if move.endCol - move.startCol == 2:  # king side
+                key ^= ZOBRIST_PIECES[rook][move.endRow * 8 + 7] ^ ZOBRIST_PIECES[rook][move.endRow * 8 + 5]
+            else:  # queen side
+                key ^= ZOBRIST_PIECES[rook][move.endRow * 8] ^ ZOBRIST_PIECES[rook][move.endRow * 8 + 3]
+        if previousEnpassant != ():
+            key ^= ZOBRIST_ENPASSANT[previousEnpassant[1]]
+        if self.enpassantPossible != ():
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        key ^= ZOBRIST_CASTLING[oldCastleIndex] ^ ZOBRIST_CASTLING[self.castlingRights]
+        self.zobristKey = key
+        self.saveState(len(self.moveLog))  # Sauvegarde l'état irréversible (roque, en passant, 50 coups)
+
+        if self.materialTable is not None:
+            materialDelta, positionDelta = self.getEvaluationDelta(move, self.board[move.endRow][move.endCol])
+            self.materialScore += materialDelta
+            self.positionScore += positionDelta
+
+    """
+    Passes the turn without moving (null move, for the search's null move pruning): the side to move changes and
+    the en passant square is cleared. None is logged as the move, so undoMove takes it back like any other.
+    The halfmove clock restarts, so no repetition is looked for across the null move
+    """
+    def makeNullMove(self):
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        if self.enpassantPossible != ():
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+            self.enpassantPossible = ()
+        self.zobristKey = key
+        self.moveLog.append(None)
+        self.whiteToMove = not self.whiteToMove
+        if self.whiteToMove:
+            self.fullmoveNumber += 1
+        self.halfmoveClock = 0
+        self.saveState(len(self.moveLog))
 
     """
     Undo the last move
@@ -91,26 +386,37 @@ class GameState:
     def undoMove(self):
         if len(self.moveLog) != 0:  # Vérifie si des coups ont été joués
             move = self.moveLog.pop()  # Récupère le dernier mouvement
+            if move is None:  # coup nul (makeNullMove)
+                self.whiteToMove = not self.whiteToMove
+                if not self.whiteToMove:
+                    self.fullmoveNumber -= 1
+                self.restoreState(len(self.moveLog))
+                self.checkmate = False
+                self.stalemate = False
+                return
+            if self.materialTable is not None:
+                materialDelta, positionDelta = self.getEvaluationDelta(move, self.board[move.endRow][move.endCol])
+                self.materialScore -= materialDelta
+                self.positionScore -= positionDelta
             self.board[move.startRow][move.startCol] = move.pieceMoved  # Replace la pièce déplacée
             self.board[move.endRow][move.endCol] = move.pieceCaptured  # Replace la pièce capturée (ou "--" si aucune)
+            if move.isCapture:
+                self.pieceCount += 1
             self.whiteToMove = not self.whiteToMove  # Change le tour
+            if not self.whiteToMove:  # coup noir annulé
+                self.fullmoveNumber -= 1
 
             # update king's position
             if move.pieceMoved == "wK":
-                self.whiteKingLocation = (move.startRow, move.startCol)
+                self.whiteKingLocation = SQUARES[move.startRow][move.startCol]
             elif move.pieceMoved == "bK":
-                self.blackKingLocation = (move.startRow, move.startCol)
+                self.blackKingLocation = SQUARES[move.startRow][move.startCol]
 
             if move.isEnpassantMove:  # Gère l'annulation des captures en passant
                 self.board[move.endRow][move.endCol] = '--'
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-            self.enpassantPossibleLog.pop()  # Supprime l'état en passant actuel
-            self.enpassantPossible = self.enpassantPossibleLog[-1]  # Rétablit le précédent
-
-            self.castleRightsLog.pop()  # Supprime l'état actuel des droits de roque
-            self.currentCastlingRight = CastleRights(
-                self.castleRightsLog[-1].wks, self.castleRightsLog[-1].bks,
-                self.castleRightsLog[-1].wqs, self.castleRightsLog[-1].bqs)
+            # Rétablit l'état irréversible de la position précédente (roque, en passant, 50 coups)
+            self.restoreState(len(self.moveLog))
 
             # undo castle move
             if move.isCastleMove: #annule les mouvements de roque
@@ -126,33 +432,77 @@ class GameState:
             self.stalemate = False
 
     """
-    All moves, considering checks.
-    1. Generates all possible moves
-    2. For each move, makes the move
-    3. Generates all opponent's moves
-    4. For each opponent move, check if your king is attacked
+    Restores the castling rights, en passant square, halfmove clock and Zobrist key saved for ply
+    (whiteToMove must already be the side to move at that ply)
+    """
+    def restoreState(self, ply):
+        state = self.stateLog[ply]
+        self.castlingRights = state & ALL_CASTLING
+        enpassantCode = state >> 4 & 15
+        if enpassantCode:  # la case en passant est derrière le pion adverse qui vient d'avancer de deux cases
+            self.enpassantPossible = SQUARES[2 if self.whiteToMove else 5][enpassantCode - 1]
+        else:
+            self.enpassantPossible = ()
+        self.halfmoveClock = state >> 8
+        self.zobristKey = self.zobristLog[ply]
+
     """
-    def getValidMoves(self):
-        tempEnpassantePossible = self.enpassantPossible # Sauvegarde l'état actuel
-        tempCurrentCastleRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                               self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
-        moves = self.getAllPossibleMoves() # Récupère tous les mouvements possibles
+    Computes the Zobrist key of the current position from scratch (makeMove/undoMove keep it up to date afterwards)
+    """
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[piece][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        if self.enpassantPossible != ():
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        return key ^ ZOBRIST_CASTLING[self.castlingRights]
 
+    """
+    All moves, considering checks.
+    1. Finds the pieces checking our king and the pieces pinned to it (one scan from the king)
+    2. Generates the moves of every piece, pinned pieces only along their pin line
+    3. In check: keeps king moves, and captures/blocks of a single checker
+    4. King moves and en passant are checked directly on the board, without makeMove/undoMove
+    With capturesOnly, quiet moves (and castling) are never generated, for the quiescence search.
+    An empty list then says nothing about checkmate or stalemate, so both flags are left False
+    """
+    def getValidMoves(self, capturesOnly=False):
         if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        inCheck, self.pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        self.capturesOnly = capturesOnly
+
+        if len(checks) > 1:  # échec double : seul le roi peut bouger
+            moves = []
+            self.getKingMoves(kingRow, kingCol, moves)
         else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-        for i in range(len(moves) - 1, -1, -1):  # Parcourt les mouvements en sens inverse
-            self.makeMove(moves[i])  # Simule chaque mouvement
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():  # Supprime les mouvements qui laissent le roi en échec
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()  # Annule le mouvement simulé
-
-
-        if len(moves) == 0:  # Vérifie si aucun mouvement n'est possible
-            if self.inCheck():
+            moves = self.getAllPossibleMoves()  # Mouvements des pièces, clouages compris
+            if not inCheck and not capturesOnly:
+                self.getCastleMoves(kingRow, kingCol, moves)
+        self.pins = {}
+        self.capturesOnly = False
+
+        blockSquares = self.getBlockSquares(kingRow, kingCol, checks[0]) if inCheck else None
+        validMoves = []
+        for move in moves:
+            if move.pieceMoved[1] == 'K':
+                if move.isCastleMove or self.isKingMoveSafe(move):
+                    validMoves.append(move)
+            elif move.isEnpassantMove:
+                if self.isEnpassantSafe(move, kingRow, kingCol):
+                    validMoves.append(move)
+            elif blockSquares is None or (move.endRow, move.endCol) in blockSquares:
+                validMoves.append(move)  # Capture ou interpose la pièce qui donne échec
+
+        if len(validMoves) == 0 and not capturesOnly:  # Vérifie si aucun mouvement n'est possible
+            if inCheck:
                 self.checkmate = True  # Si le joueur est en échec, c'est un mat
             else:
                 self.stalemate = True  # Sinon, c'est un pat
@@ -160,10 +510,93 @@ class GameState:
             self.checkmate = False
             self.stalemate = False
 
+        return validMoves #retourne la liste de mouvements valides
 
-        self.enpassantPossible = tempEnpassantePossible  # Restaure l'état initial
-        self.currentCastlingRight = tempCurrentCastleRights
-        return moves #retourne la liste de mouvements valides
+    """
+    Scans outward from the king at (r, c).
+    Returns (inCheck, pins, checks): pins maps the square of a pinned allied piece to the direction of its pin,
+    checks lists (row, col, direction) for every enemy piece giving check (direction is None for knights and pawns).
+    """
+    def checkForPinsAndChecks(self, r, c):
+        pins = {}
+        checks = []
+        if self.whiteToMove:
+            enemyColor, allyColor = "b", "w"
+        else:
+            enemyColor, allyColor = "w", "b"
+
+        for direction in KING_DIRECTIONS:
+            possiblePin = None
+            for i in range(1, 8):
+                endRow = r + direction[0] * i
+                endCol = c + direction[1] * i
+                if not (0 <= endRow <= 7 and 0 <= endCol <= 7):
+                    break
+                endPiece = self.board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == allyColor:
+                    if possiblePin is not None:  # deuxième pièce alliée : pas de clouage dans cette direction
+                        break
+                    possiblePin = (endRow, endCol)
+                    continue
+                pieceType = endPiece[1]
+                if pieceType == 'Q' or (pieceType == 'R' and direction in ROOK_DIRECTIONS) or \
+                        (pieceType == 'B' and direction in BISHOP_DIRECTIONS):
+                    if possiblePin is None:
+                        checks.append((endRow, endCol, direction))
+                    else:
+                        pins[possiblePin] = direction
+                elif i == 1 and pieceType == 'p' and possiblePin is None and direction[1] != 0 and \
+                        direction[0] == (-1 if enemyColor == "b" else 1):
+                    checks.append((endRow, endCol, None))  # pion adverse en diagonale
+                break
+
+        for move in KNIGHT_DIRECTIONS:
+            endRow = r + move[0]
+            endCol = c + move[1]
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7 and self.board[endRow][endCol] == enemyColor + 'N':
+                checks.append((endRow, endCol, None))
+
+        return len(checks) > 0, pins, checks
+
+    """
+    Squares a non-king piece can move to in order to answer a single check: the checker and, for sliders, the squares in between
+    """
+    def getBlockSquares(self, kingRow, kingCol, check):
+        checkRow, checkCol, direction = check
+        if direction is None:  # cavalier ou pion : il faut le capturer
+            return {(checkRow, checkCol)}
+        blockSquares = set()
+        for i in range(1, 8):
+            square = (kingRow + direction[0] * i, kingCol + direction[1] * i)
+            blockSquares.add(square)
+            if square == (checkRow, checkCol):
+                break
+        return blockSquares
+
+    """
+    Determines if the king can go to move.end without being attacked, the king being lifted from its square first
+    """
+    def isKingMoveSafe(self, move):
+        self.board[move.startRow][move.startCol] = "--"
+        attacked = self.squareUnderAttack(move.endRow, move.endCol)
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        return not attacked
+
+    """
+    En passant removes two pawns from the same rank, which can expose the king in ways a pin scan misses:
+    the board is updated in place and the king's square checked directly
+    """
+    def isEnpassantSafe(self, move, kingRow, kingCol):
+        self.board[move.startRow][move.startCol] = "--"
+        self.board[move.startRow][move.endCol] = "--"
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        attacked = self.squareUnderAttack(kingRow, kingCol)
+        self.board[move.endRow][move.endCol] = "--"
+        self.board[move.startRow][move.endCol] = move.pieceCaptured
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        return not attacked
 
     """
     Determines if the current player is in check
@@ -175,16 +608,39 @@ class GameState:
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
 
     """
-    Determines if the enemy can attack square at row and column
+    Determines if the enemy can attack square at row and column.
+    Looks outward from the square for enemy pawns, knights, kings and sliders instead of generating the enemy moves
     """
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove  # Simule le tour de l'adversaire
-        oppMoves = self.getAllPossibleMoves()  # Récupère tous ses mouvements
-        self.whiteToMove = not self.whiteToMove
+        board = self.board
+        enemyColor = "b" if self.whiteToMove else "w"
+
+        pawnRow = r - 1 if enemyColor == "b" else r + 1  # les pions noirs attaquent vers le bas
+        if 0 <= pawnRow <= 7:
+            if c - 1 >= 0 and board[pawnRow][c - 1] == enemyColor + 'p':
+                return True
+            if c + 1 <= 7 and board[pawnRow][c + 1] == enemyColor + 'p':
+                return True
 
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:
-                return True  # Si une pièce adverse peut atteindre cette case, elle est attaquée
+        for move in KNIGHT_DIRECTIONS:
+            endRow = r + move[0]
+            endCol = c + move[1]
+            if 0 <= endRow <= 7 and 0 <= endCol <= 7 and board[endRow][endCol] == enemyColor + 'N':
+                return True
+
+        for direction in KING_DIRECTIONS:
+            sliders = ('R', 'Q') if direction in ROOK_DIRECTIONS else ('B', 'Q')
+            for i in range(1, 8):
+                endRow = r + direction[0] * i
+                endCol = c + direction[1] * i
+                if not (0 <= endRow <= 7 and 0 <= endCol <= 7):
+                    break
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == enemyColor and (endPiece[1] in sliders or (i == 1 and endPiece[1] == 'K')):
+                    return True
+                break
 
         return False
 
@@ -206,53 +662,54 @@ class GameState:
     Get all the pawn moves for the pawn located at row, col and add moves to the list
     """
     def getPawnMoves(self, r, c, moves):
+        pinDirection = self.pins.get((r, c))
         if self.whiteToMove:
-            if self.board[r - 1][c] == "--":  # vérifie si 1 case devant est vide
-                moves.append(Move((r, c), (r - 1, c), self.board))#avance d'une case
-                if r == 6 and self.board[r - 2][c] == "--":  #  vérifie si 2 case devant est vide
-                    moves.append(Move((r, c), (r - 2, c), self.board))#avance de 2 case
-            if c - 1 >= 0:  # left capture
-                if self.board[r - 1][c - 1][0] == "b": #regarde si c'est une piece noire
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
-                elif (r - 1, c - 1) == self.enpassantPossible:  # left enpassante
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board, isEnpassantMove=True))
-            if c + 1 <= 7:  # right capture
-                if self.board[r - 1][c + 1][0] == "b": #regarde si c'est une piece noir
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
-                elif (r - 1, c + 1) == self.enpassantPossible:  # right enpassante
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board, isEnpassantMove=True))
-
+            moveAmount, startRow, enemyColor = -1, 6, "b"
         else:
-            if self.board[r + 1][c] == "--":  # 1 square pawn advance
-                moves.append(Move((r, c), (r + 1, c), self.board))
-                if r == 1 and self.board[r + 2][c] == "--":  # 2 square pawn advance
-                    moves.append(Move((r, c), (r + 2, c), self.board))
-            if c - 1 >= 0:  # right capture
-                if self.board[r + 1][c - 1][0] == "w":
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
-                elif (r + 1, c - 1) == self.enpassantPossible:  # right enpassante
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, isEnpassantMove=True))
-            if c + 1 <= 7:  # left capture
-                if self.board[r + 1][c + 1][0] == "w":
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
-                elif (r + 1, c + 1) == self.enpassantPossible:  # left enpassante
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, isEnpassantMove=True))
+            moveAmount, startRow, enemyColor = 1, 1, "w"
+
+        if self.board[r + moveAmount][c] == "--" and not self.capturesOnly:  # vérifie si 1 case devant est vide
+            if pinDirection is None or pinDirection[1] == 0:
+                self.appendPawnMove(moves, Move((r, c), (r + moveAmount, c), self.board))#avance d'une case
+                if r == startRow and self.board[r + 2 * moveAmount][c] == "--":  # vérifie si 2 case devant est vide
+                    moves.append(Move((r, c), (r + 2 * moveAmount, c), self.board))#avance de 2 case
+        for dc in (-1, 1):  # left capture, right capture
+            if 0 <= c + dc <= 7:
+                if pinDirection is not None and pinDirection != (moveAmount, dc) and pinDirection != (-moveAmount, -dc):
+                    continue  # clouée sur une autre ligne
+                if self.board[r + moveAmount][c + dc][0] == enemyColor: #regarde si c'est une piece adverse
+                    self.appendPawnMove(moves, Move((r, c), (r + moveAmount, c + dc), self.board))
+                elif (r + moveAmount, c + dc) == self.enpassantPossible:  # enpassante
+                    moves.append(Move((r, c), (r + moveAmount, c + dc), self.board, isEnpassantMove=True))
+
+    """
+    Adds a pawn move to the list, with its under-promotions when they are enabled
+    """
+    def appendPawnMove(self, moves, move):
+        moves.append(move)
+        if move.isPawnPromotion and self.underpromotions:
+            startSq, endSq = (move.startRow, move.startCol), (move.endRow, move.endCol)
+            for piece in ('R', 'B', 'N'):
+                moves.append(Move(startSq, endSq, self.board, promotionChoice=piece))
 
     """
     Get all the rook moves for the rook located at row, col and add moves to the list
     """
     def getRookMoves(self, r, c, moves):
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))  # Haut, gauche, bas, droite
+        pinDirection = self.pins.get((r, c))
         enemyColor = "b" if self.whiteToMove else "w"  # Couleur de l'adversaire
 
-        for direction in directions:
+        for direction in ROOK_DIRECTIONS:
+            if pinDirection is not None and direction != pinDirection and direction != (-pinDirection[0], -pinDirection[1]):
+                continue  # une pièce clouée ne quitte pas la ligne du clouage
             for i in range(1, 8):  # Une tour peut se déplacer jusqu'à 7 cases
                 endRow = r + direction[0] * i
                 endCol = c + direction[1] * i
                 if 0 <= endRow <= 7 and 0 <= endCol <= 7:  # Reste dans les limites de l'échiquier
                     endPiece = self.board[endRow][endCol]
                     if endPiece == "--":  # Case vide
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if not self.capturesOnly:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColor:  # Capture une pièce ennemie
                         moves.append(Move((r, c), (endRow, endCol), self.board))
                         break
@@ -266,25 +723,29 @@ class GameState:
     Get all the knight moves for the knight located at row, col and add moves to the list
     """
     def getKnightMoves(self, r, c, moves):
-        directions = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2))
+        if (r, c) in self.pins:  # un cavalier cloué ne peut jamais bouger
+            return
         allyColor = "w" if self.whiteToMove else "b"  # Couleur alliée
 
-        for move in directions:
+        for move in KNIGHT_DIRECTIONS:
             endRow = r + move[0]
             endCol = c + move[1]
             if 0 <= endRow <= 7 and 0 <= endCol <= 7:  # Vérifie les limites
                 endPiece = self.board[endRow][endCol]
                 if endPiece[0] != allyColor:  # Peut capturer une pièce ennemie ou se déplacer sur une case vide
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+                    if endPiece != "--" or not self.capturesOnly:
+                        moves.append(Move((r, c), (endRow, endCol), self.board))
 
     """
     Get all the bishop moves for the bishop located at row, col and add moves to the list
     """
     def getBishopMoves(self, r, c, moves):
-        directions = ((-1, -1), (-1, 1), (1, 1), (1, -1))  # diagonals: up/left up/right down/right down/left
+        pinDirection = self.pins.get((r, c))
         enemyColor = "b" if self.whiteToMove else "w"
 
-        for direction in directions:
+        for direction in BISHOP_DIRECTIONS:
+            if pinDirection is not None and direction != pinDirection and direction != (-pinDirection[0], -pinDirection[1]):
+                continue
             for i in range(1, 8):
                 endRow = r + direction[0] * i
                 endCol = c + direction[1] * i
@@ -293,7 +754,8 @@ class GameState:
                     endPiece = self.board[endRow][endCol]
 
                     if endPiece == "--":  # empty space is valid
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if not self.capturesOnly:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColor:  # capture enemy piece
                         moves.append(Move((r, c), (endRow, endCol), self.board))
                         break
@@ -324,38 +786,15 @@ class GameState:
             if 0 <= endRow <= 7 and 0 <= endCol <= 7:
                 endPiece = self.board[endRow][endCol]
                 if endPiece[0] != allyColor: #déplacement si différent de la couleur du roi
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+                    if endPiece != "--" or not self.capturesOnly:
+                        moves.append(Move((r, c), (endRow, endCol), self.board))
 
     """
     Update the castle rights given the move
     """
     def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wqs = False
-            self.currentCastlingRight.wks = False
-        elif move.pieceMoved == 'bK':
-            self.currentCastlingRight.bqs = False
-            self.currentCastlingRight.bks = False
-        elif move.pieceMoved == 'wR':
-            if move.startRow == 7:
-                if move.startCol == 0:  # left rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7:  # right rook
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == 'bR':
-            if move.startRow == 0:
-                if move.startCol == 0:  # right rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7:  # left rook
-                    self.currentCastlingRight.bks = False
-
-        if move.pieceCaptured == 'wR':
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRight.wqs = False
-                    self.currentCastlingRight.qks = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.bks = False
+        # a king or rook leaving its square, or a rook captured on its corner, takes the castling rights with it
+        self.castlingRights &= CASTLING_MASKS[move.startRow][move.startCol] & CASTLING_MASKS[move.endRow][move.endCol]
 
     """
     Generate all valid castle moves for the king at (r, c) and add them to the list
@@ -364,11 +803,9 @@ class GameState:
     def getCastleMoves(self, r, c, moves):
         if self.squareUnderAttack(r, c):
             return
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (
-                not self.whiteToMove and self.currentCastlingRight.bks):
+        if self.castlingRights & (CASTLE_WKS if self.whiteToMove else CASTLE_BKS):
             self.getKingSideCastleMoves(r, c, moves)
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (
-                not self.whiteToMove and self.currentCastlingRight.bqs):
+        if self.castlingRights & (CASTLE_WQS if self.whiteToMove else CASTLE_BQS):
             self.getQueenSideCastleMoves(r, c, moves)
 
     def getKingSideCastleMoves(self, r, c, moves):
@@ -389,6 +826,12 @@ class CastleRights:
         self.wqs = wqs  # Roque côté dame pour les blancs
         self.bqs = bqs  # Roque côté dame pour les noirs
 
+    """
+    The four rights packed in 4 bits (wks, bks, wqs, bqs), used to index ZOBRIST_CASTLING
+    """
+    def index(self):
+        return self.wks | self.bks << 1 | self.wqs << 2 | self.bqs << 3
+
 class Move:
     """
     In chess, fields on the board are described by two symbols, one of them being number between 1-8 (which is corresponding to rows)
@@ -400,21 +843,38 @@ class Move:
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-        self.isPawnPromotion = (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7)
+    promotionIndex = {'Q': 0, 'R': 1, 'B': 2, 'N': 3}
+
+    # le générateur crée des milliers de coups par position : pas de __dict__ par coup
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "moveID",
+                 "isPawnPromotion", "promotionChoice", "isEnpassantMove", "isCastleMove", "isCapture")
+
+    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False, promotionChoice='Q'):
+        startRow, startCol = startSq
+        endRow, endCol = endSq
+        self.startRow = startRow
+        self.startCol = startCol
+        self.endRow = endRow
+        self.endCol = endCol
+        pieceMoved = board[startRow][startCol]
+        self.pieceMoved = pieceMoved
+        moveID = startRow * 1000 + startCol * 100 + endRow * 10 + endCol
+        isPawnPromotion = pieceMoved[1] == 'p' and (endRow == 0 or endRow == 7)
+        if isPawnPromotion:
+            moveID += self.promotionIndex[promotionChoice] * 10000  # une reine garde l'identifiant habituel
+        self.moveID = moveID
+        self.isPawnPromotion = isPawnPromotion
+        self.promotionChoice = promotionChoice
         self.isEnpassantMove = isEnpassantMove
         self.isCastleMove = isCastleMove
 
-        if self.isEnpassantMove:
-            self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
-        self.isCapture = self.pieceCaptured != "--"
+        if isEnpassantMove:
+            self.pieceCaptured = 'wp' if pieceMoved == 'bp' else 'bp'
+            self.isCapture = True
+        else:
+            pieceCaptured = board[endRow][endCol]
+            self.pieceCaptured = pieceCaptured
+            self.isCapture = pieceCaptured != "--"
 
     """
     Overriding the equals method
@@ -423,8 +883,12 @@ class Move:
         if isinstance(other, Move):
             return self.moveID == other.moveID
 
+    def __hash__(self):
+        return self.moveID
+
     """
-    Overriding the string function
+    Short algebraic notation of the move on its own. Disambiguation and check marks depend on the position:
+    ChessPGN.moveToSAN gives the full SAN
     """
     def __str__(self):
         # castle move
@@ -435,10 +899,10 @@ class Move:
 
         # pawn moves
         if self.pieceMoved[1] == 'p':
-            if self.isCapture:
-                return self.colsToFiles[self.startCol] + "x" + endSquare
-            else:
-                return endSquare
+            moveString = self.colsToFiles[self.startCol] + "x" + endSquare if self.isCapture else endSquare
+            if self.isPawnPromotion:
+                moveString += "=" + self.promotionChoice
+            return moveString
 
         # piece moves
         moveString = self.pieceMoved[1]
@@ -447,7 +911,10 @@ class Move:
         return moveString + endSquare
 
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.isPawnPromotion:
+            notation += self.promotionChoice.lower()
+        return notation
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
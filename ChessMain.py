@@ -6,7 +6,8 @@ It is responsible for handling user input and displaying the current game state
 import pygame as p
 import ChessEngine
 import ChessAI
-from multiprocessing import Process, Queue
+import ChessPGN
+import ChessService
 
 BOARD_WIDTH = BOARD_HEIGHT = 512
 MOVE_LOG_PANEL_WIDTH = 250
@@ -16,6 +17,13 @@ SQ_SIZE = BOARD_HEIGHT // DIMENSION  # Taille d'une case de l'échiquier
 MAX_FPS = 15  # Taux de rafraîchissement pour les animations
 IMAGES = {}  # Dictionnaire pour stocker les images des pièces
 COLORS = [p.Color("white"), p.Color("gray")]  # Couleurs des cases de l'échiquier
+BACKEND = "mailbox"  # Représentation de l'échiquier : "mailbox" ou "bitboard"
+AI_WORKERS = 1  # Nombre de processus pour la recherche de l'IA (> 1 : recherche parallèle à la racine)
+BOOK_PATH = "book.bin"  # Livre d'ouvertures de l'IA (voir ChessBook), ignoré s'il n'existe pas
+STORE_PATH = None  # Magasin de positions de l'IA (voir ChessStore), par exemple "positions.db" ; None : désactivé
+PONDER = True  # L'IA réfléchit pendant le temps de l'humain, sur la réponse qu'elle attend
+SOUND_FILES = {"move": "audio/move.mp3", "capture": "audio/capture.mp3"}
+SOUNDS = {}  # Sons préchargés, joués sans relire les fichiers à chaque coup
 
 
 """
@@ -26,7 +34,15 @@ def loadImages():
     pieces = ['wp', 'wR', 'wN', 'wB', 'wK', 'wQ', 'bp', 'bR', 'bN', 'bB', 'bK', 'bQ']
 
     for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+        IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE)).convert_alpha()
+
+
+"""
+Loads the move sounds once, after the mixer is initialised
+"""
+def loadSounds():
+    for name, path in SOUND_FILES.items():
+        SOUNDS[name] = p.mixer.Sound(path)
 
 
 """
@@ -39,14 +55,14 @@ def main():
     screen = p.display.set_mode([BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH, BOARD_HEIGHT])  # Crée la fenêtre du jeu
     clock = p.time.Clock()  # Gère le temps pour les animations
     moveLogFont = p.font.SysFont("Arial", 14, False, False)  # Police utilisée pour afficher les coups joués
-    gs = ChessEngine.GameState()  # Initialise l'état du jeu
+    gs = ChessEngine.GameState(BACKEND)  # Initialise l'état du jeu
     validMoves = gs.getValidMoves()  # Liste des mouvements valides initiaux
+    sanLog = []  # Coups joués en notation SAN, pour l'historique affiché
     sqSelected = ()  # Dernière case cliquée par l'utilisateur (ligne, colonne)
     playerClicks = []  # Liste des clics de l'utilisateur : [(départ), (arrivée)]
     playerOne = True  # Indique si le joueur humain joue avec les blancs
     playerTwo = False  # Indique si un joueur humain joue avec les noirs
-    moveFinderProcess = None  # Processus pour rechercher le meilleur coup de l'IA
-    returnQueue = None  # File pour la communication entre le processus principal et l'IA
+    engine = ChessService.EngineService(BACKEND, AI_WORKERS, BOOK_PATH, storePath=STORE_PATH)  # Processus de l'IA, gardé pendant toute la partie
     AIThinking = False  # Indique si l'IA est en train de réfléchir
     gameOver = False  # Indique si la partie est terminée
     moveMade = False  # Indique si un coup a été joué
@@ -56,6 +72,8 @@ def main():
 
 
     loadImages() # Charge les images des pièces dans le dictionnaire global IMAGES
+    loadSounds()
+    renderer = BoardRenderer(screen, moveLogFont)  # Ne redessine que ce qui a changé d'une image à l'autre
 
     while running:
         isHumanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo) 
@@ -65,6 +83,9 @@ def main():
             if e.type == p.QUIT:
                 running = False
 
+            elif e.type == p.VIDEOEXPOSE:  # La fenêtre doit être entièrement redessinée
+                renderer.invalidate()
+
             elif e.type == p.MOUSEBUTTONDOWN:  # Gère les clics de souris
                 if not gameOver:
                     location = p.mouse.get_pos()  # Coordonnées de la souris
@@ -82,7 +103,9 @@ def main():
                         move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
                         for i in range(len(validMoves)):  # Vérifie si le coup est valide
                             if move == validMoves[i]:
+                                sanLog.append(ChessPGN.moveToSAN(gs, validMoves[i], validMoves))
                                 gs.makeMove(validMoves[i])  # Applique le coup
+                                engine.pushMove(validMoves[i])  # Le transmet à l'IA
                                 moveMade = True
                                 animate = True
                                 sqSelected = ()
@@ -93,40 +116,47 @@ def main():
 
             elif e.type == p.KEYDOWN:  # Gère les entrées clavier
                 if e.key == p.K_u:  # Touche 'u' pour annuler un coup
+                    if AIThinking:
+                        engine.cancel()  # Interrompt la recherche de l'IA si nécessaire
+                        AIThinking = False
+                    engine.undoMove()
                     gs.undoMove()  # Annule le dernier coup
+                    del sanLog[len(gs.moveLog):]
                     moveMade = True
                     animate = False
                     gameOver = False
-                    if AIThinking:
-                        moveFinderProcess.terminate()  # Arrête le processus de l'IA si nécessaire
-                        AIThinking = False
                     moveUndone = True
                 if e.key == p.K_r:  # Touche 'r' pour redémarrer la partie
-                    gs = ChessEngine.GameState()  # Réinitialise l'état du jeu
+                    gs = ChessEngine.GameState(BACKEND)  # Réinitialise l'état du jeu
                     validMoves = gs.getValidMoves()
+                    sanLog = []
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
                     animate = False
                     gameOver = False
                     if AIThinking:
-                        moveFinderProcess.terminate()
+                        engine.cancel()
                         AIThinking = False
+                    engine.newGame()
                     moveUndone = True
 
 
         if not gameOver and not isHumanTurn and not moveUndone:  # Tour de l'IA
             if not AIThinking:
                 AIThinking = True
-                returnQueue = Queue()  # File pour récupérer le coup de l'IA
-                moveFinderProcess = Process(target=ChessAI.findBestMove, args=(gs, validMoves, returnQueue))
-                moveFinderProcess.start()  # Lance le processus de l'IA
+                engine.startSearch(ChessAI.MOVE_TIME)  # Lance la recherche de l'IA
 
-            if not moveFinderProcess.is_alive():  # Si l'IA a terminé
-                AIMove = returnQueue.get()  # Récupère le coup choisi par l'IA
+            reply = engine.getReply()
+            if reply is not None:  # Si l'IA a terminé
+                AIMove = reply.findMove(validMoves)  # Récupère le coup choisi par l'IA
                 if AIMove is None:
                     AIMove = ChessAI.findRandomMove(validMoves)  # Coup aléatoire si aucun coup optimal trouvé
+                sanLog.append(ChessPGN.moveToSAN(gs, AIMove, validMoves))
                 gs.makeMove(AIMove)  # Joue le coup
+                engine.pushMove(AIMove)
+                if PONDER and ((gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)):
+                    engine.startPonder(reply)  # Cherche la réponse attendue pendant que l'humain réfléchit
                 moveMade = True
                 animate = True
                 AIThinking = False
@@ -134,36 +164,28 @@ def main():
 
         if moveMade:
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)  # Anime le dernier coup
+                animateMove(gs.moveLog[-1], screen, gs.board, clock, renderer.boardSurface)  # Anime le dernier coup
+                renderer.invalidate()
             validMoves = gs.getValidMoves()  # Met à jour les mouvements valides
             moveMade = False
             animate = False
             moveUndone = False
 
 
-        drawGameState(screen, gs, validMoves, sqSelected, moveLogFont)  # Affiche l'état actuel du jeu
-
+        text = None
         if gs.checkmate or gs.stalemate:  # Vérifie si la partie est terminée
             gameOver = True
             if gs.stalemate:
                 text = "Stalemate"  # Partie nulle
             else:
                 text = "Black wins by checkmate" if gs.whiteToMove else "White wins by checkmate"
-            drawEndGameText(screen, text)  # Affiche un message de fin de partie
 
+        # Affiche l'état actuel du jeu (et le message de fin de partie) : seules les zones modifiées sont mises à jour
+        p.display.update(renderer.draw(gs, validMoves, sqSelected, sanLog, text))
         clock.tick(MAX_FPS)  # Contrôle le taux de rafraîchissement
-        p.display.flip()  # Met à jour l'affichage
-
 
+    engine.close()  # Arrête le processus de l'IA
 
-"""
-Responsible for all the graphics within a current game state
-"""
-def drawGameState(screen, gs, validMoves, sqSelected, moveLogFont):
-    drawBoard(screen)
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board)
-    drawMoveLog(screen, gs, moveLogFont)
 
 
 """
@@ -179,44 +201,9 @@ def drawBoard(screen):
 
 
 """
-Highlight square selection
-"""
-def highlightSquares(screen, gs, validMoves, sqSelected):
-    if sqSelected != ():
-        r, c = sqSelected
-        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
-            # highlight selected square
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)
-            s.fill(p.Color('blue'))
-            screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
-
-            # highlight valid moves from that square
-            s.fill(p.Color('yellow'))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
-
-
-"""
-Draws the pieces on top of the board using the current GameState.board
+Lines of the move log panel: two moves (white and black) per entry, two entries per line
 """
-def drawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-
-            if piece != "--":
-                screen.blit(IMAGES[piece], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-
-"""
-Draws the move log on the right side of the window
-"""
-def drawMoveLog(screen, gs, font):
-    moveLogRect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
-    p.draw.rect(screen, p.Color("black"), moveLogRect)
-    moveLog = gs.moveLog
+def moveLogLines(moveLog):
     moveTexts = []
     for i in range(0, len(moveLog), 2):
         moveString = str(i // 2 + 1) + ". " + str(moveLog[i]) + " "
@@ -225,76 +212,158 @@ def drawMoveLog(screen, gs, font):
         moveTexts.append(moveString)
 
     movesPerRow = 2
-    padding = 5
-    lineSpacing = 2
-    textY = padding
-
-    for i in range(0, len(moveTexts), movesPerRow):
-        text = ""
-        for j in range(movesPerRow):
-            if i + j < len(moveTexts):
-                text += moveTexts[i + j]
-
-        textObject = font.render(text, True, p.Color('White'))
-        textLocation = moveLogRect.move(padding, textY)
-        screen.blit(textObject, textLocation)
-        textY += textObject.get_height() + lineSpacing
+    return ["".join(moveTexts[i:i + movesPerRow]) for i in range(0, len(moveTexts), movesPerRow)]
+
+
+class BoardRenderer:
+    """
+    Draws the window incrementally. The empty board is rendered once; each frame only the squares whose piece or
+    highlight changed are copied back from it, and the move log panel is redrawn only when its text changed,
+    every line keeping its rendered surface. draw() returns the rectangles to pass to p.display.update
+    """
+    def __init__(self, screen, font):
+        self.screen = screen
+        self.font = font
+        self.boardSurface = p.Surface((BOARD_WIDTH, BOARD_HEIGHT))
+        drawBoard(self.boardSurface)
+        self.highlights = {}
+        for color in ("blue", "yellow"):  # case sélectionnée, cases d'arrivée possibles
+            surface = p.Surface((SQ_SIZE, SQ_SIZE))
+            surface.set_alpha(100)
+            surface.fill(p.Color(color))
+            self.highlights[color] = surface
+        self.endGameFont = p.font.SysFont("Helvetica", 32, True, False)
+        self.lineSurfaces = []  # (texte, surface) de chaque ligne de l'historique déjà rendue
+        self.validMoves = None
+        self.targets = {}  # case de départ -> cases d'arrivée des coups valides
+        self.invalidate()
+
+    """
+    Forgets what is on screen, so the next draw repaints everything (after an animation or a window expose)
+    """
+    def invalidate(self):
+        self.drawnSquares = [[None] * DIMENSION for _ in range(DIMENSION)]  # (pièce, surbrillance) affichées
+        self.drawnLog = None
+        self.drawnEndText = None
+
+    def draw(self, gs, validMoves, sqSelected, moveLog, endText=None):
+        if endText != self.drawnEndText:  # le message apparaît ou doit être effacé : tout l'échiquier est repeint
+            self.drawnSquares = [[None] * DIMENSION for _ in range(DIMENSION)]
+            self.drawnEndText = endText
+        dirty = self.drawSquares(gs, validMoves, sqSelected)
+        if endText is not None and dirty:
+            dirty.append(self.drawEndGameText(endText))
+        logRect = self.drawMoveLog(moveLog)
+        if logRect is not None:
+            dirty.append(logRect)
+        return dirty
+
+    """
+    Redraws the squares whose piece or highlight changed: the selected square and the squares its valid moves
+    reach are highlighted. Returns their rectangles
+    """
+    def drawSquares(self, gs, validMoves, sqSelected):
+        if validMoves is not self.validMoves:
+            self.validMoves = validMoves
+            self.targets = {}
+            for move in validMoves:
+                self.targets.setdefault((move.startRow, move.startCol), set()).add((move.endRow, move.endCol))
+        selected, targets = None, ()
+        if sqSelected != () and gs.board[sqSelected[0]][sqSelected[1]][0] == ('w' if gs.whiteToMove else 'b'):
+            selected, targets = sqSelected, self.targets.get(sqSelected, ())
+
+        dirty = []
+        for r in range(DIMENSION):
+            boardRow, drawnRow = gs.board[r], self.drawnSquares[r]
+            for c in range(DIMENSION):
+                highlight = "blue" if (r, c) == selected else "yellow" if (r, c) in targets else None
+                state = (boardRow[c], highlight)
+                if state == drawnRow[c]:
+                    continue
+                drawnRow[c] = state
+                square = p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                self.screen.blit(self.boardSurface, square, square)
+                if highlight is not None:
+                    self.screen.blit(self.highlights[highlight], square)
+                if boardRow[c] != "--":
+                    self.screen.blit(IMAGES[boardRow[c]], square)
+                dirty.append(square)
+        return dirty
+
+    """
+    Draws the move log (in SAN) on the right side of the window, if it changed. Only new or modified lines are
+    rendered again. Returns the rectangle of the panel, or None
+    """
+    def drawMoveLog(self, moveLog):
+        lines = moveLogLines(moveLog)
+        if lines == self.drawnLog:
+            return None
+        self.drawnLog = lines
+        del self.lineSurfaces[len(lines):]
+        for i, text in enumerate(lines):
+            if i == len(self.lineSurfaces):
+                self.lineSurfaces.append((text, self.font.render(text, True, p.Color('White'))))
+            elif self.lineSurfaces[i][0] != text:
+                self.lineSurfaces[i] = (text, self.font.render(text, True, p.Color('White')))
+
+        moveLogRect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
+        p.draw.rect(self.screen, p.Color("black"), moveLogRect)
+        padding = 5
+        lineSpacing = 2
+        textY = padding
+        for _, textObject in self.lineSurfaces:
+            self.screen.blit(textObject, moveLogRect.move(padding, textY))
+            textY += textObject.get_height() + lineSpacing
+        return moveLogRect
+
+    """
+    Draw text on screen. Returns the rectangle covered
+    """
+    def drawEndGameText(self, text):
+        # Draw text shadow
+        textObject = self.endGameFont.render(text, False, p.Color('Gray'))
+        textLocation = p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT).move(BOARD_WIDTH / 2 - textObject.get_width() / 2,
+                                                                    BOARD_HEIGHT / 2 - textObject.get_height() / 2)
+        self.screen.blit(textObject, textLocation)
+
+        # Draw main text
+        textObject = self.endGameFont.render(text, False, p.Color("Black"))
+        self.screen.blit(textObject, textLocation.move(2, 2))
+        return p.Rect(textLocation.topleft, textObject.get_size()).union(
+            p.Rect(textLocation.move(2, 2).topleft, textObject.get_size()))
 
 
 """
-Animating a move including playing the sound
+Animating a move including playing the sound.
+The position after the move (without the piece moved, with the piece captured) is drawn once on a background
+surface; each frame then only copies back, and updates, the rectangle spanning the start and end squares
 """
-def animateMove(move, screen, board, clock):
-    if move.isCapture:
-        p.mixer.music.load("audio/capture.mp3")
-        p.mixer.music.play()
-    else:
-        p.mixer.music.load("audio/move.mp3")
-        p.mixer.music.play()
+def animateMove(move, screen, board, clock, boardSurface):
+    SOUNDS["capture" if move.isCapture else "move"].play()
 
     dR = move.endRow - move.startRow
     dC = move.endCol - move.startCol
     framesPerSquare = 7
     frameCount = (abs(dR) + abs(dC)) * framesPerSquare
 
+    background = boardSurface.copy()
+    for r in range(DIMENSION):
+        for c in range(DIMENSION):
+            if board[r][c] != "--" and (r, c) != (move.endRow, move.endCol):
+                background.blit(IMAGES[board[r][c]], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    if move.pieceCaptured != '--':
+        captureRow = move.startRow if move.isEnpassantMove else move.endRow
+        background.blit(IMAGES[move.pieceCaptured], p.Rect(move.endCol * SQ_SIZE, captureRow * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+
+    startSquare = p.Rect(move.startCol * SQ_SIZE, move.startRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+    area = startSquare.union(p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE))
     for frame in range(frameCount + 1):
         r, c = (move.startRow + dR * frame / frameCount, move.startCol + dC * frame / frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
-
-        # erase the piece moved from its ending square
-        color = COLORS[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
-
-        # draw captured piece onto rectangle
-        if move.pieceCaptured != '--':
-            if move.isEnpassantMove:
-                enPassantRow = move.endRow + 1 if move.pieceCaptured[0] == 'b' else move.endRow - 1
-                endSquare = p.Rect(move.endCol * SQ_SIZE, enPassantRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-        if move.pieceMoved != '--':
-            screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-        p.display.flip()
+        screen.blit(background, area, area)
+        screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+        p.display.update(area)
         clock.tick(60)
 
 
-"""
-Draw text on screen
-"""
-def drawEndGameText(screen, text):
-    # Draw text shadow
-    font = p.font.SysFont("Helvetica", 32, True, False)
-    textObject = font.render(text, False, p.Color('Gray'))
-    textLocation = p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT).move(BOARD_WIDTH / 2 - textObject.get_width() / 2,
-                                                                BOARD_HEIGHT / 2 - textObject.get_height() / 2)
-    screen.blit(textObject, textLocation)
-
-    # Draw main text
-    textObject = font.render(text, False, p.Color("Black"))
-    screen.blit(textObject, textLocation.move(2, 2))
-
-
 if __name__ == "__main__":
     main()
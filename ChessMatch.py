@@ -0,0 +1,343 @@
+"""
+Headless self-play matches between two engine configurations, on all cores.
+
+Every opening is played twice, colours swapped. Engines limited by nodes or depth are deterministic, so once all
+the openings have been played, each further round adds RANDOM_PLIES random moves to every opening, drawn from a
+seed shared by the two games of a pair: no game repeats an earlier one, and both colours still get the same
+position. Each game runs in a worker process; both sides search with their
+own Search and transposition table (never the shared position store) under the configured time, node or depth
+limit. A game ends on checkmate or stalemate (GameState flags), threefold repetition, the fifty-move rule,
+insufficient material or after MAX_GAME_PLIES. Each finished game is appended to the results file as a JSON
+line, and the running score is reported with an Elo estimate, its 95% error bar and an SPRT (sequential
+probability ratio test) verdict; with --sprt the match stops as soon as the test accepts a hypothesis.
+
+An engine is "name:option=value,...", options being
+    module   module (or .py file) providing Search and TranspositionTable, ChessAI by default
+    time     seconds per move        nodes   nodes per move        depth   depth per move
+    backend  mailbox or bitboard
+plus any Search attribute (for instance a search feature switch), set with the given value.
+
+Usage:
+    python ChessMatch.py "new:module=ChessAI_new.py,nodes=20000" "base:nodes=20000" --games 200 --sprt
+"""
+
+import argparse
+import importlib
+import importlib.util
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import ChessEngine
+import ChessTablebase
+
+MAX_GAME_PLIES = 300  # partie déclarée nulle au-delà
+RANDOM_PLIES = 2  # coups tirés au hasard après l'ouverture, à partir du deuxième tour des ouvertures
+DEFAULT_NODES = 20000
+# ouvertures équilibrées courantes, en notation coordonnées ; chacune est jouée avec les deux couleurs
+OPENINGS = (
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6",  # espagnole
+    "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5",  # italienne
+    "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6",  # sicilienne
+    "e2e4 e7e6 d2d4 d7d5",  # française
+    "e2e4 c7c6 d2d4 d7d5",  # caro-kann
+    "d2d4 d7d5 c2c4 e7e6 b1c3 g8f6",  # gambit dame refusé
+    "d2d4 d7d5 c2c4 c7c6",  # slave
+    "d2d4 g8f6 c2c4 e7e6 b1c3 f8b4",  # nimzo-indienne
+    "d2d4 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6",  # est-indienne
+    "c2c4 e7e5 b1c3 g8f6",  # anglaise
+    "g1f3 d7d5 g2g3 g8f6 f1g2",  # réti
+    "e2e4 d7d5 e4d5 d8d5 b1c3 d5a5",  # scandinave
+)
+
+
+class EngineConfig:
+    """
+    One side of the match, parsed from "name:option=value,..."
+    """
+    def __init__(self, spec):
+        self.name, _, optionText = spec.partition(":")
+        self.module = "ChessAI"
+        self.maxTime = None
+        self.maxNodes = None
+        self.maxDepth = None
+        self.backend = "mailbox"
+        self.searchOptions = {}  # attributs de Search à modifier
+        for option in filter(None, optionText.split(",")):
+            key, _, value = option.partition("=")
+            if key == "module":
+                self.module = value
+            elif key == "time":
+                self.maxTime = float(value)
+            elif key == "nodes":
+                self.maxNodes = int(value)
+            elif key == "depth":
+                self.maxDepth = int(value)
+            elif key == "backend":
+                self.backend = value
+            else:
+                self.searchOptions[key] = json.loads(value) if value[:1] in "0123456789-[{tfn\"" else value
+        if self.maxTime is None and self.maxNodes is None and self.maxDepth is None:
+            self.maxNodes = DEFAULT_NODES
+
+
+"""
+The search module of a configuration: an importable module name, or the path of a .py file
+"""
+def loadModule(name):
+    if not name.endswith(".py"):
+        return importlib.import_module(name)
+    moduleName = "engine_" + os.path.splitext(os.path.basename(name))[0]
+    if moduleName not in sys.modules:
+        spec = importlib.util.spec_from_file_location(moduleName, name)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[moduleName] = module
+        spec.loader.exec_module(module)
+    return sys.modules[moduleName]
+
+
+class Player:
+    """
+    An EngineConfig ready to play: its module, its own Search and transposition table, and its counters
+    """
+    def __init__(self, config):
+        self.config = config
+        self.module = loadModule(config.module)
+        self.search = self.module.Search(tt=self.module.TranspositionTable())
+        self.search.useStore = False  # magasin partagé (ChessStore) : un moteur profiterait des recherches de l'autre
+        for key, value in config.searchOptions.items():
+            setattr(self.search, key, value)
+        self.nodes = 0
+        self.time = 0.0
+
+    def chooseMove(self, gs, validMoves):
+        maxDepth = self.config.maxDepth or self.module.MAX_DEPTH
+        startTime = time.perf_counter()
+        # les deux moteurs cherchent sur le même GameState : chacun y remet ses propres tables d'évaluation
+        gs.setEvaluationTables(self.module.PIECE_SCORE, self.module.PIECE_POSITION_SCORES)
+        result = self.search.iterativeDeepening(gs, validMoves, self.config.maxTime, self.config.maxNodes, maxDepth)
+        # noeuds de toute la recherche, itération interrompue comprise
+        self.nodes += self.search.nodes
+        self.time += time.perf_counter() - startTime
+        return result.bestMove
+
+
+"""
+Result of the game once gs.getValidMoves() has been called, or None while it goes on:
+(result "1-0" / "0-1" / "1/2-1/2", reason)
+"""
+def gameOver(gs):
+    if gs.checkmate:
+        return ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+    if gs.stalemate:
+        return "1/2-1/2", "stalemate"
+    if gs.isRepetition(3):
+        return "1/2-1/2", "repetition"
+    if gs.isFiftyMoveDraw():
+        return "1/2-1/2", "fifty moves"
+    pieces = [piece for row in gs.board for piece in row if piece != "--" and piece[1] != "K"]
+    whitePieces = [piece[1] for piece in pieces if piece[0] == "w"]
+    blackPieces = [piece[1] for piece in pieces if piece[0] == "b"]
+    if ChessTablebase.isInsufficientMaterial(whitePieces, blackPieces):
+        return "1/2-1/2", "insufficient material"
+    if len(gs.moveLog) >= MAX_GAME_PLIES:
+        return "1/2-1/2", "move limit"
+    return None
+
+
+"""
+Worker side: plays one game from an opening, followed by RANDOM_PLIES random moves drawn from seed when it is not
+None. Returns a JSON-ready dict
+"""
+def playGame(gameIndex, openingIndex, opening, whiteSpec, blackSpec, seed=None):
+    white, black = Player(EngineConfig(whiteSpec)), Player(EngineConfig(blackSpec))
+    gs = ChessEngine.GameState(white.config.backend)
+    for text in opening.split():
+        move = next(m for m in gs.getValidMoves() if m.getChessNotation() == text)
+        gs.makeMove(move)
+    randomMoves = []
+    if seed is not None:
+        rng = random.Random(seed)
+        for _ in range(RANDOM_PLIES):
+            validMoves = gs.getValidMoves()
+            if not validMoves:
+                break
+            move = rng.choice(validMoves)
+            randomMoves.append(move.getChessNotation())
+            gs.makeMove(move)
+    moves = []
+    while True:
+        validMoves = gs.getValidMoves()
+        outcome = gameOver(gs)
+        if outcome is not None:
+            break
+        player = white if gs.whiteToMove else black
+        move = player.chooseMove(gs, validMoves)
+        moves.append(move.getChessNotation())
+        gs.makeMove(move)
+    return {"game": gameIndex, "opening": openingIndex, "random": " ".join(randomMoves), "white": white.config.name, "black": black.config.name,
+            "result": outcome[0], "reason": outcome[1], "plies": len(moves), "moves": " ".join(moves),
+            "nodes": {white.config.name: white.nodes, black.config.name: black.nodes},
+            "time": {white.config.name: white.time, black.config.name: black.time}}
+
+
+class MatchStats:
+    """
+    Wins, draws and losses of the first engine, with Elo, error bar and SPRT log-likelihood ratio
+    """
+    def __init__(self, elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05):
+        self.wins = self.draws = self.losses = 0
+        self.elo0, self.elo1 = elo0, elo1
+        self.lowerBound = math.log(beta / (1 - alpha))
+        self.upperBound = math.log((1 - beta) / alpha)
+
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def score(self):
+        return (self.wins + self.draws / 2) / self.games() if self.games() else 0.5
+
+    """
+    Variance of one game's score (0, 1/2 or 1)
+    """
+    def variance(self):
+        n, s = self.games(), self.score()
+        if not n:
+            return 0.0
+        return (self.wins * (1 - s) ** 2 + self.draws * (0.5 - s) ** 2 + self.losses * s ** 2) / n
+
+    """
+    Elo difference and the half-width of its 95% confidence interval
+    """
+    def elo(self):
+        n = self.games()
+        if not n:
+            return 0.0, 0.0
+        margin = 1.96 * math.sqrt(self.variance() / n)
+        low, high = scoreToElo(self.score() - margin), scoreToElo(self.score() + margin)
+        return scoreToElo(self.score()), (high - low) / 2
+
+    """
+    Log-likelihood ratio of elo1 against elo0 (normal approximation of the game scores)
+    """
+    def llr(self):
+        variance = self.variance()
+        if not variance:
+            return 0.0
+        s0, s1 = eloToScore(self.elo0), eloToScore(self.elo1)
+        return self.games() * (s1 - s0) * (2 * self.score() - s0 - s1) / (2 * variance)
+
+    def sprtVerdict(self):
+        llr = self.llr()
+        if llr >= self.upperBound:
+            return "H1 accepted (elo >= %g)" % self.elo1
+        if llr <= self.lowerBound:
+            return "H0 accepted (elo <= %g)" % self.elo0
+        return None
+
+    def summary(self):
+        elo, margin = self.elo()
+        return "%d games: +%d =%d -%d, score %.1f%%, Elo %+.1f +/- %.1f, LLR %.2f [%.2f, %.2f]" % (
+            self.games(), self.wins, self.draws, self.losses, 100 * self.score(), elo, margin, self.llr(),
+            self.lowerBound, self.upperBound)
+
+
+def scoreToElo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def eloToScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def runGame(task):
+    return playGame(*task)
+
+
+"""
+Plays the match and returns its MatchStats. Results are appended to outPath as JSON lines
+"""
+def runMatch(firstSpec, secondSpec, games, outPath, workers=None, openings=OPENINGS, sprt=False,
+             elo0=0.0, elo1=5.0, log=sys.stdout):
+    first, second = EngineConfig(firstSpec), EngineConfig(secondSpec)
+    if first.name == second.name:
+        raise ValueError("the two engines need different names")
+    tasks = []
+    for gameIndex in range(games):
+        openingIndex = (gameIndex // 2) % len(openings)
+        seed = gameIndex // 2 if gameIndex >= 2 * len(openings) else None  # même tirage pour les deux couleurs
+        white, black = (firstSpec, secondSpec) if gameIndex % 2 == 0 else (secondSpec, firstSpec)
+        tasks.append((gameIndex, openingIndex, openings[openingIndex], white, black, seed))
+
+    stats = MatchStats(elo0, elo1)
+    nodes = {first.name: 0, second.name: 0}
+    seconds = {first.name: 0.0, second.name: 0.0}
+    startTime = time.perf_counter()
+    pool = multiprocessing.Pool(workers or os.cpu_count() or 1)
+    try:
+        with open(outPath, "a") as out:
+            for game in pool.imap_unordered(runGame, tasks):
+                out.write(json.dumps(game) + "\n")
+                out.flush()
+                points = {"1-0": 1.0, "0-1": 0.0}.get(game["result"], 0.5)
+                stats.add(points if game["white"] == first.name else 1 - points)
+                for name in nodes:
+                    nodes[name] += game["nodes"][name]
+                    seconds[name] += game["time"][name]
+                print(stats.summary(), file=log, flush=True)
+                if sprt and stats.sprtVerdict() is not None:
+                    break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    print("%s vs %s, %.0fs" % (first.name, second.name, time.perf_counter() - startTime), file=log)
+    print(stats.summary(), file=log)
+    verdict = stats.sprtVerdict()
+    print("SPRT: " + (verdict or "inconclusive"), file=log)
+    for name in nodes:
+        print("%s: %d nodes, %.0f nodes/s" % (name, nodes[name], nodes[name] / max(seconds[name], 1e-9)), file=log)
+    return stats
+
+
+"""
+Openings from a file: one line of coordinate moves (e2e4 e7e5 ...) per opening
+"""
+def readOpenings(path):
+    with open(path) as lines:
+        return tuple(line.split("#")[0].strip() for line in lines if line.split("#")[0].strip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play a match between two engine configurations")
+    parser.add_argument("first", help='engine "name:option=value,..." (the one being tested)')
+    parser.add_argument("second", help="engine it is compared with")
+    parser.add_argument("--games", type=int, default=2 * len(OPENINGS))
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per core)")
+    parser.add_argument("--out", default="match_results.jsonl")
+    parser.add_argument("--openings", help="file of openings, one line of coordinate moves each")
+    parser.add_argument("--sprt", action="store_true", help="stop once the SPRT accepts a hypothesis")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    openings = readOpenings(args.openings) if args.openings else OPENINGS
+    runMatch(args.first, args.second, args.games, args.out, args.workers, openings, args.sprt, args.elo0, args.elo1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
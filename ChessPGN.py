@@ -0,0 +1,256 @@
+"""
+PGN (Portable Game Notation) reading and writing: games are streamed one at a time from a text file, and their
+SAN moves (e4, Nbd7, exd8=Q+, O-O...) are matched against the legal moves of a GameState. The writer turns
+a GameState's moveLog back into SAN, with disambiguation, promotion piece and check or mate markers.
+"""
+
+import re
+
+import ChessEngine
+
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|\(|\)|1-0|0-1|1/2-1/2|\*|[^\s(){};]+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+$')
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")  # toujours écrits, dans cet ordre
+START_POSITION = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -"
+LINE_LENGTH = 79  # longueur maximale des lignes de coups écrites
+
+
+class PGNGame:
+    """
+    One game of a PGN file: its tags (Event, White, Result...), its main line as SAN strings and its result
+    """
+    def __init__(self, tags, moves, result):
+        self.tags = tags
+        self.moves = moves
+        self.result = result
+
+    """
+    GameState after the moves of the main line (from the FEN tag if there is one), with the moves as Move objects
+    """
+    def replay(self, backend="mailbox"):
+        gs = ChessEngine.GameState(backend, self.tags.get("FEN"))
+        gs.underpromotions = True
+        moves = []
+        for san in self.moves:
+            move = parseSAN(gs, san)
+            gs.makeMove(move)
+            moves.append(move)
+        return gs, moves
+
+
+"""
+Main-line tokens of a movetext: comments, NAGs ($1), move numbers and variations are dropped
+"""
+def parseMovetext(text):
+    moves = []
+    result = "*"
+    depth = 0  # profondeur des variantes entre parenthèses
+    for token in TOKEN_PATTERN.findall(text):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(0, depth - 1)
+        elif depth > 0 or token[0] in "{;$" or MOVE_NUMBER_PATTERN.match(token):
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            token = re.sub(r'^\d+\.+', "", token)  # "1.e4" écrit sans espace
+            if token:
+                moves.append(token)
+    return moves, result
+
+
+"""
+Yields the games of a PGN stream one at a time, so a large collection is never fully in memory
+"""
+def readGames(stream):
+    tags = {}
+    movetext = []
+    for line in stream:
+        stripped = line.strip()
+        if stripped.startswith("%"):
+            continue  # ligne d'échappement
+        if stripped.startswith("["):
+            if movetext:  # nouvelle partie sans ligne de résultat
+                yield makeGame(tags, movetext)
+                tags, movetext = {}, []
+            match = TAG_PATTERN.match(stripped)
+            if match:
+                tags[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        elif stripped:
+            movetext.append(stripped)
+            if stripped.split()[-1] in RESULTS:
+                yield makeGame(tags, movetext)
+                tags, movetext = {}, []
+    if tags or movetext:
+        yield makeGame(tags, movetext)
+
+
+def makeGame(tags, movetext):
+    moves, result = parseMovetext(" ".join(movetext))
+    if result == "*" and tags.get("Result") in RESULTS:
+        result = tags["Result"]
+    return PGNGame(tags, moves, result)
+
+
+"""
+Legal move of gs written in SAN. Raises ValueError if the text matches no legal move (or several)
+"""
+def parseSAN(gs, san):
+    text = san.rstrip("+#!?")
+    validMoves = gs.getValidMoves()
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        endCol = 6 if len(text) == 3 else 2
+        for move in validMoves:
+            if move.isCastleMove and move.endCol == endCol:
+                return move
+        raise ValueError("illegal castling: " + san)
+
+    promotion = 'Q'
+    if "=" in text:
+        text, promotion = text.split("=")
+        promotion = promotion.upper()
+    elif text[-1] in "QRBN" and text[0].islower():  # e8Q
+        text, promotion = text[:-1], text[-1]
+    pieceType = text[0] if text[0] in "KQRBN" else 'p'
+    if pieceType != 'p':
+        text = text[1:]
+    text = text.replace("x", "").replace("-", "")
+    if len(text) < 2 or text[-2] not in ChessEngine.Move.filesToCols or text[-1] not in ChessEngine.Move.ranksToRows:
+        raise ValueError("invalid SAN move: " + san)
+    endRow, endCol = ChessEngine.Move.ranksToRows[text[-1]], ChessEngine.Move.filesToCols[text[-2]]
+    hint = text[:-2]  # désambiguïsation : colonne, rangée ou case de départ
+    startCol = ChessEngine.Move.filesToCols.get(hint[0]) if hint else None
+    startRow = ChessEngine.Move.ranksToRows.get(hint[-1]) if hint else None
+
+    matches = [move for move in validMoves
+               if move.pieceMoved[1] == pieceType and move.endRow == endRow and move.endCol == endCol
+               and (startCol is None or move.startCol == startCol) and (startRow is None or move.startRow == startRow)
+               and (not move.isPawnPromotion or move.promotionChoice == promotion)]
+    if len(matches) != 1:
+        raise ValueError(("illegal" if not matches else "ambiguous") + " SAN move: " + san)
+    return matches[0]
+
+
+
+"""
+SAN of a legal move of gs, before it is played: piece letter, departure file and/or rank when another piece
+of the same kind can reach the square, capture, promotion piece, then + or # from the resulting position.
+validMoves are gs.getValidMoves(), if the caller already has them
+"""
+def moveToSAN(gs, move, validMoves=None):
+    if move.isCastleMove:
+        san = "O-O" if move.endCol == 6 else "O-O-O"
+    else:
+        endSquare = move.getRankFile(move.endRow, move.endCol)
+        pieceType = move.pieceMoved[1]
+        if pieceType == 'p':
+            san = (move.colsToFiles[move.startCol] + "x" if move.isCapture else "") + endSquare
+            if move.isPawnPromotion:
+                san += "=" + move.promotionChoice
+        else:
+            if validMoves is None:
+                validMoves = gs.getValidMoves()
+            rivals = [other for other in validMoves
+                      if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow
+                      and other.endCol == move.endCol
+                      and (other.startRow != move.startRow or other.startCol != move.startCol)]
+            hint = ""
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    hint = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    hint = move.rowsToRanks[move.startRow]
+                else:
+                    hint = move.getRankFile(move.startRow, move.startCol)
+            san = pieceType + hint + ("x" if move.isCapture else "") + endSquare
+
+    checkmate, stalemate = gs.checkmate, gs.stalemate  # getValidMoves les modifie sur la position suivante
+    gs.makeMove(move)
+    if gs.inCheck():
+        san += "+" if gs.getValidMoves() else "#"
+    gs.undoMove()
+    gs.checkmate, gs.stalemate = checkmate, stalemate
+    return san
+
+
+"""
+Result of the position: "1-0" or "0-1" after checkmate, "1/2-1/2" after stalemate, "*" while the game goes on
+"""
+def gameResult(gs):
+    gs.getValidMoves()
+    if gs.checkmate:
+        return "0-1" if gs.whiteToMove else "1-0"
+    return "1/2-1/2" if gs.stalemate else "*"
+
+
+"""
+The game played in gs as a PGNGame: its moveLog in SAN, with FEN and SetUp tags when it did not start from the
+initial position. The log is unwound to its first position and replayed, so gs ends where it started
+"""
+def exportGame(gs, tags=None, result=None):
+    moves = list(gs.moveLog)
+    for _ in moves:
+        gs.undoMove()
+    tags = dict(tags or {})
+    startFEN = gs.getFEN()
+    if startFEN.rsplit(" ", 2)[0] != START_POSITION:
+        tags.setdefault("SetUp", "1")
+        tags.setdefault("FEN", startFEN)
+    sanMoves = []
+    for move in moves:
+        sanMoves.append(moveToSAN(gs, move))
+        gs.makeMove(move)
+    result = result or gameResult(gs)
+    tags["Result"] = result
+    return PGNGame(tags, sanMoves, result)
+
+
+"""
+Writes a game in export format: the seven tag roster ("?" when unknown) then the other tags, and the movetext
+wrapped at LINE_LENGTH characters
+"""
+def writeGame(out, game):
+    tags = dict(game.tags, Result=game.result)
+    for name in SEVEN_TAG_ROSTER + tuple(sorted(name for name in tags if name not in SEVEN_TAG_ROSTER)):
+        value = tags.get(name, "?").replace("\\", "\\\\").replace('"', '\\"')
+        out.write('[%s "%s"]\n' % (name, value))
+    out.write("\n")
+
+    startFEN = game.tags.get("FEN")
+    blackFirst = startFEN is not None and startFEN.split()[1] == "b"
+    moveNumber = int(startFEN.split()[5]) if startFEN is not None and len(startFEN.split()) == 6 else 1
+    tokens = []
+    for index, san in enumerate(game.moves):
+        whiteMove = (index % 2 == 0) != blackFirst
+        if whiteMove:
+            tokens.append("%d." % moveNumber)
+        elif index == 0:
+            tokens.append("%d..." % moveNumber)
+        tokens.append(san)
+        if not whiteMove:
+            moveNumber += 1
+    tokens.append(game.result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            out.write(line + "\n")
+            line = token
+        else:
+            line = line + " " + token if line else token
+    out.write(line + "\n\n")
+
+
+"""
+Writes games one at a time, so a generator (readGames, or games being played) is never held in memory
+"""
+def writeGames(out, games):
+    count = 0
+    for game in games:
+        writeGame(out, game)
+        count += 1
+    return count
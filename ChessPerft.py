@@ -0,0 +1,139 @@
+"""
+Perft: counts the leaf nodes of the legal move tree to a given depth.
+The counts of well-known positions are published, so any difference points at a move generation bug,
+and the nodes/second figure measures move generation speed.
+
+Usage (headless, no pygame):
+    python ChessPerft.py                          # run the standard suite
+    python ChessPerft.py --depth 4 --divide       # one position, with a per-root-move breakdown
+    python ChessPerft.py --fen "<fen>" --depth 3 --backend bitboard
+"""
+
+import argparse
+import sys
+import time
+
+import ChessEngine
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# (name, fen, {depth: expected leaf nodes}), from the Chess Programming Wiki "Perft Results" page
+PERFT_SUITE = [
+    ("startpos", START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position4-mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+]
+
+
+"""
+Number of leaf nodes depth plies below the current position.
+At depth 1 the legal moves are counted without being played (bulk counting)
+"""
+def perft(gs, depth):
+    moves = gs.getValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+"""
+Perft split by root move: returns a dict move notation (e.g. "e2e4", "e7e8n") -> leaf nodes below it
+"""
+def divide(gs, depth):
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[move.getChessNotation()] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+
+"""
+Builds a GameState ready for perft: under-promotions are generated, as the published counts include them
+"""
+def newPerftState(fen, backend="mailbox"):
+    gs = ChessEngine.GameState(backend, fen)
+    gs.underpromotions = True
+    return gs
+
+
+"""
+Runs perft on one position and prints nodes, time and nodes/second. Returns the node count
+"""
+def runPosition(fen, depth, backend="mailbox", showDivide=False, out=sys.stdout):
+    gs = newPerftState(fen, backend)
+    start = time.perf_counter()
+    if showDivide:
+        counts = divide(gs, depth)
+        for notation in sorted(counts):
+            print(notation + ": " + str(counts[notation]), file=out)
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(gs, depth)
+    elapsed = time.perf_counter() - start
+    print("depth %d: %d nodes in %.3fs (%d nodes/s)" % (depth, nodes, elapsed, nodes / max(elapsed, 1e-9)), file=out)
+    return nodes
+
+
+"""
+Runs every suite position at each depth whose expected count is at most maxNodes.
+Returns True when every count matches
+"""
+def runSuite(maxNodes=200000, backend="mailbox", out=sys.stdout):
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, expected in PERFT_SUITE:
+        for depth in sorted(expected):
+            if expected[depth] > maxNodes:
+                break
+            gs = newPerftState(fen, backend)
+            start = time.perf_counter()
+            nodes = perft(gs, depth)
+            elapsed = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            passed = nodes == expected[depth]
+            allPassed = allPassed and passed
+            print("%-20s depth %d: %9d (expected %9d) %s  %.3fs" % (
+                name, depth, nodes, expected[depth], "ok  " if passed else "FAIL", elapsed), file=out)
+    print("%s, %d nodes in %.3fs (%d nodes/s, %s backend)" % (
+        "all passed" if allPassed else "FAILURES", totalNodes, totalTime, totalNodes / max(totalTime, 1e-9), backend),
+        file=out)
+    return allPassed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft move generation test and benchmark")
+    parser.add_argument("--fen", help="position to test (default: the standard suite)")
+    parser.add_argument("--depth", type=int, help="perft depth for --fen (default 3)")
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    parser.add_argument("--backend", default="mailbox", choices=("mailbox", "bitboard"))
+    parser.add_argument("--max-nodes", type=int, default=200000,
+                        help="suite mode: skip depths whose expected count is larger (default 200000)")
+    args = parser.parse_args(argv)
+
+    if args.fen is None and args.depth is None and not args.divide:
+        return 0 if runSuite(args.max_nodes, args.backend) else 1
+    runPosition(args.fen or START_FEN, args.depth or 3, args.backend, args.divide)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,483 @@
+"""
+Multi-game server: many casual games held in one asyncio process, the AI searches running in a process pool.
+
+Clients connect over TCP and exchange JSON messages, one per line. A client may play several games at once.
+    {"op": "new", "color": "white", "fen": "...", "movetime": 0.5, "nodes": 20000}   color: the human's side
+    {"op": "move", "game": 3, "move": "e2e4"}                                          coordinates or SAN
+    {"op": "close", "game": 3}
+    {"op": "stats"}
+The server answers with
+    {"op": "started", "game": 3, "fen": "...", "engine": "black", "legal": [...]}
+    {"op": "moved", "game": 3, "by": "human" | "engine", "move": "e2e4", "san": "e4", "fen": "...", "legal": [...]}
+    {"op": "over", "game": 3, "result": "1-0", "reason": "checkmate", "pgn": "..."}
+    {"op": "closed", "game": 3, "reason": "..."}, {"op": "error", "message": "..."}, {"op": "stats", ...}
+"legal" (the legal moves in coordinates) is sent whenever the human is to move. Human moves are checked
+against GameState.getValidMoves; engine moves are streamed back as soon as their search ends.
+
+Searches go through a fair scheduler: at most one per pool worker is running, and waiting searches are taken
+in turn from each client, so a client with many games cannot starve the others. Backpressure: once a client has
+MAX_QUEUED_SEARCHES searches waiting, the server stops reading its messages until one ends; a client that does
+not read its replies (MAX_PENDING_MESSAGES) is disconnected. Memory per session is bounded by MAX_GAMES_PER_CLIENT,
+MAX_SESSIONS, the game length (ChessMatch.MAX_GAME_PLIES, within the preallocated undo stack) and SESSION_TIMEOUT.
+
+Usage:
+    python ChessServer.py serve --port 8765 --workers 4
+    python ChessServer.py load --connections 20 --games 5 --nodes 2000     # load generator, prints latencies
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import io
+import itertools
+import json
+import math
+import os
+import pickle
+import random
+import sys
+import time
+
+import ChessAI
+import ChessEngine
+import ChessMatch
+import ChessPGN
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_SESSIONS = 2000  # parties en cours sur le serveur
+MAX_GAMES_PER_CLIENT = 32
+MAX_QUEUED_SEARCHES = 8  # recherches en attente par client avant de ne plus lire ses messages
+MAX_PENDING_MESSAGES = 256  # messages en attente d'envoi par connexion : au-delà, le client est déconnecté
+MAX_LINE_BYTES = 4096
+DEFAULT_MOVE_TIME = 0.5
+MAX_MOVE_TIME = 5.0
+SESSION_TIMEOUT = 600  # secondes sans message du joueur avant que sa partie soit fermée
+SWEEP_INTERVAL = 30
+
+workerSearch = None  # Search de chaque processus du pool, gardée d'une recherche à l'autre
+
+
+"""
+Pool side: searches the pickled position. Returns (moveID, score, depth, nodes)
+"""
+def searchPosition(gsData, maxTime, maxNodes):
+    global workerSearch
+    if workerSearch is None:
+        workerSearch = ChessAI.Search()
+        workerSearch.useStore = False  # chaque partie doit être cherchée, pour la variété des coups
+    gs = pickle.loads(gsData)
+    validMoves = gs.getValidMoves()
+    random.shuffle(validMoves)  # des parties différentes d'une fois à l'autre
+    result = workerSearch.iterativeDeepening(gs, validMoves, maxTime, maxNodes)
+    return result.bestMove.moveID, result.score, result.depth, result.nodes
+
+
+class FairScheduler:
+    """
+    Hands jobs to the executor, never more than slots at a time, taking the waiting jobs in turn from each client
+    (round robin), so the order is decided here and not by the executor's own FIFO queue
+    """
+    def __init__(self, executor, slots):
+        self.executor = executor
+        self.slots = slots
+        self.running = 0
+        self.queues = collections.OrderedDict()  # client -> deque de (fonction, arguments, future)
+
+    def submit(self, client, function, *args):
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(client, collections.deque()).append((function, args, future))
+        self.dispatch()
+        return future
+
+    def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.running < self.slots and self.queues:
+            client, jobs = self.queues.popitem(last=False)
+            function, args, future = jobs.popleft()
+            if jobs:
+                self.queues[client] = jobs  # le client repasse en fin de tour
+            if future.cancelled():
+                continue
+            self.running += 1
+            task = loop.run_in_executor(self.executor, function, *args)
+            task.add_done_callback(lambda task, future=future: self.finished(task, future))
+
+    def finished(self, task, future):
+        self.running -= 1
+        if not future.cancelled():
+            if task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        self.dispatch()
+
+    def waiting(self):
+        return sum(len(jobs) for jobs in self.queues.values())
+
+    """
+    Drops the waiting jobs of a client that went away
+    """
+    def forget(self, client):
+        for _, _, future in self.queues.pop(client, ()):
+            future.cancel()
+
+
+class Session:
+    """
+    One game: its position, the engine's colour and search limits, and the search running for it, if any
+    """
+    def __init__(self, gameID, client, gs, engineWhite, maxTime, maxNodes):
+        self.gameID = gameID
+        self.client = client
+        self.gs = gs
+        self.engineWhite = engineWhite
+        self.maxTime = maxTime
+        self.maxNodes = maxNodes
+        self.startFEN = gs.getFEN()
+        self.search = None  # future de la recherche en cours
+        self.lastActivity = time.monotonic()
+
+    def engineToMove(self):
+        return self.gs.whiteToMove == self.engineWhite
+
+
+class Client:
+    """
+    One connection: its games, its searches waiting in the scheduler and its outgoing messages.
+    readable is cleared while too many of its searches wait, which stops the server reading its messages
+    """
+    def __init__(self, clientID, writer):
+        self.clientID = clientID
+        self.writer = writer
+        self.outbox = asyncio.Queue(MAX_PENDING_MESSAGES)
+        self.games = {}
+        self.queuedSearches = 0
+        self.readable = asyncio.Event()
+        self.readable.set()
+        self.closed = False
+
+    def send(self, message):
+        if self.closed:
+            return
+        try:
+            self.outbox.put_nowait(json.dumps(message).encode() + b"\n")
+        except asyncio.QueueFull:  # le client ne lit plus ses réponses
+            self.closed = True
+            self.writer.close()
+
+    async def writeLoop(self):
+        while True:
+            data = await self.outbox.get()
+            self.writer.write(data)
+            await self.writer.drain()
+
+
+"""
+Search limit key of a message (or default), as a float; ValueError unless it is finite and positive
+"""
+def positiveLimit(message, key, default=None):
+    value = float(message.get(key, default))
+    if not 0 < value < math.inf:  # NaN aussi
+        raise ValueError("%s must be a positive number" % key)
+    return value
+
+
+class GameServer:
+    """
+    The sessions of every connected client, the process pool running the searches and its scheduler
+    """
+    def __init__(self, workers=None, backend="mailbox"):
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.scheduler = FairScheduler(self.executor, self.workers)
+        self.sessions = {}
+        self.gameIDs = itertools.count(1)
+        self.clientIDs = itertools.count(1)
+        self.searches = 0
+
+    async def handleConnection(self, reader, writer):
+        client = Client(next(self.clientIDs), writer)
+        writeTask = asyncio.create_task(client.writeLoop())
+        try:
+            while not client.closed:
+                await client.readable.wait()
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    client.send({"op": "error", "message": "line too long"})
+                    break
+                if not line:
+                    break
+                message = None  # une ligne illisible ne doit pas reprendre la partie du message précédent
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("a message is a JSON object")
+                    self.handle(client, message)
+                except (ValueError, KeyError, IndexError, TypeError, OverflowError) as error:
+                    client.send({"op": "error", "game": message.get("game") if isinstance(message, dict) else None,
+                                 "message": str(error)})
+        except ConnectionError:
+            pass
+        finally:
+            for session in list(client.games.values()):
+                self.closeSession(session)
+            self.scheduler.forget(client)
+            client.closed = True
+            try:
+                await asyncio.wait_for(self.flush(client), timeout=1.0)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            writeTask.cancel()
+            writer.close()
+
+    async def flush(self, client):
+        while not client.outbox.empty() and not client.writer.is_closing():
+            await asyncio.sleep(0.01)
+
+    def handle(self, client, message):
+        kind = message.get("op")
+        if kind == "new":
+            self.newGame(client, message)
+        elif kind == "move":
+            self.playMove(client, message)
+        elif kind == "close":
+            session = self.getSession(client, message)
+            self.closeSession(session)
+            client.send({"op": "closed", "game": session.gameID, "reason": "closed by the player"})
+        elif kind == "stats":
+            client.send({"op": "stats", "sessions": len(self.sessions), "running": self.scheduler.running,
+                         "waiting": self.scheduler.waiting(), "searches": self.searches, "workers": self.workers})
+        else:
+            raise ValueError("unknown op: %r" % kind)
+
+    def getSession(self, client, message):
+        session = client.games.get(message["game"])
+        if session is None:
+            raise ValueError("no such game: %r" % message["game"])
+        session.lastActivity = time.monotonic()
+        return session
+
+    def newGame(self, client, message):
+        if len(self.sessions) >= MAX_SESSIONS:
+            raise ValueError("server full")
+        if len(client.games) >= MAX_GAMES_PER_CLIENT:
+            raise ValueError("too many games on this connection")
+        gs = ChessEngine.GameState(self.backend, message.get("fen"))
+        gs.underpromotions = True
+        engineWhite = message.get("color", "white") == "black"
+        maxTime = min(positiveLimit(message, "movetime", DEFAULT_MOVE_TIME), MAX_MOVE_TIME)
+        maxNodes = max(1, int(positiveLimit(message, "nodes"))) if message.get("nodes") is not None else None
+        session = Session(next(self.gameIDs), client, gs, engineWhite, maxTime, maxNodes)
+        self.sessions[session.gameID] = session
+        client.games[session.gameID] = session
+        reply = {"op": "started", "game": session.gameID, "fen": session.startFEN,
+                 "engine": "white" if engineWhite else "black"}
+        self.continueGame(session, reply)
+
+    def playMove(self, client, message):
+        session = self.getSession(client, message)
+        if session.search is not None or session.engineToMove():
+            raise ValueError("not your turn")
+        gs = session.gs
+        validMoves = gs.getValidMoves()
+        text = str(message["move"])
+        move = next((m for m in validMoves if m.getChessNotation() == text), None)
+        if move is None:
+            move = ChessPGN.parseSAN(gs, text)  # ValueError si le coup est illégal
+        san = ChessPGN.moveToSAN(gs, move, validMoves)
+        gs.makeMove(move)
+        self.continueGame(session, {"op": "moved", "game": session.gameID, "by": "human",
+                                    "move": move.getChessNotation(), "san": san})
+
+    """
+    Sends reply (with the position, and the legal moves when the human is to move), then ends the game or starts
+    the engine's search
+    """
+    def continueGame(self, session, reply):
+        gs = session.gs
+        validMoves = gs.getValidMoves()
+        outcome = ChessMatch.gameOver(gs)
+        reply["fen"] = gs.getFEN()
+        if outcome is None and not session.engineToMove():
+            reply["legal"] = [move.getChessNotation() for move in validMoves]
+        session.client.send(reply)
+        if outcome is not None:
+            self.endGame(session, *outcome)
+        elif session.engineToMove():
+            self.startSearch(session)
+
+    def startSearch(self, session):
+        client = session.client
+        client.queuedSearches += 1
+        if client.queuedSearches >= MAX_QUEUED_SEARCHES:
+            client.readable.clear()
+        session.search = self.scheduler.submit(client, searchPosition, pickle.dumps(session.gs),
+                                               session.maxTime, session.maxNodes)
+        session.search.add_done_callback(lambda future: self.searchDone(session, future))
+
+    def searchDone(self, session, future):
+        client = session.client
+        client.queuedSearches -= 1
+        if client.queuedSearches < MAX_QUEUED_SEARCHES:
+            client.readable.set()
+        if future.cancelled() or session.gameID not in self.sessions:
+            return
+        session.search = None
+        if future.exception() is not None:
+            client.send({"op": "error", "game": session.gameID, "message": "search failed: %r" % future.exception()})
+            self.closeSession(session)
+            return
+        self.searches += 1
+        moveID, score, depth, nodes = future.result()
+        gs = session.gs
+        validMoves = gs.getValidMoves()
+        move = next(m for m in validMoves if m.moveID == moveID)
+        san = ChessPGN.moveToSAN(gs, move, validMoves)
+        gs.makeMove(move)
+        self.continueGame(session, {"op": "moved", "game": session.gameID, "by": "engine",
+                                    "move": move.getChessNotation(), "san": san, "score": score, "depth": depth,
+                                    "nodes": nodes})
+
+    def endGame(self, session, result, reason):
+        game = ChessPGN.exportGame(session.gs, {"Event": "Casual game", "Site": "ChessServer",
+                                                "White": "engine" if session.engineWhite else "human",
+                                                "Black": "human" if session.engineWhite else "engine"}, result)
+        pgn = io.StringIO()
+        ChessPGN.writeGame(pgn, game)
+        session.client.send({"op": "over", "game": session.gameID, "result": result, "reason": reason,
+                             "pgn": pgn.getvalue()})
+        self.closeSession(session)
+
+    def closeSession(self, session):
+        if session.search is not None:
+            session.search.cancel()  # une recherche déjà lancée finit dans son processus, sans suite
+            session.search = None
+        self.sessions.pop(session.gameID, None)
+        session.client.games.pop(session.gameID, None)
+
+    """
+    Closes the games whose player has been silent for SESSION_TIMEOUT seconds
+    """
+    async def sweepSessions(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            now = time.monotonic()
+            for session in list(self.sessions.values()):
+                if session.search is None and now - session.lastActivity > SESSION_TIMEOUT:
+                    self.closeSession(session)
+                    session.client.send({"op": "closed", "game": session.gameID, "reason": "timeout"})
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handleConnection, host, port, limit=MAX_LINE_BYTES)
+        sweeper = asyncio.create_task(self.sweepSessions())
+        print("listening on %s:%d with %d search workers" % (host, port, self.workers), flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+            self.executor.shutdown(cancel_futures=True)
+
+
+"""
+Load generator: connections clients, each playing games games at the same time, the human side playing random
+legal moves as fast as the engine answers. Returns the engine reply latencies (seconds) and the games finished
+"""
+async def generateLoad(host, port, connections, games, maxTime, maxNodes, log=sys.stdout):
+    latencies = []
+    results = collections.Counter()
+
+    async def connection():
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+        queues = {}  # partie -> file de ses messages
+        pendingStarts = collections.deque()  # files des parties demandées, dans l'ordre des "new" envoyés
+
+        async def readLoop():
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message["op"] == "started":
+                    queues[message["game"]] = inbox = pendingStarts.popleft()
+                    await inbox.put(message)
+                elif message.get("game") in queues:
+                    await queues[message["game"]].put(message)
+                elif message["op"] == "error" and message.get("game") is None and pendingStarts:
+                    await pendingStarts.popleft().put(message)
+
+        def send(message):
+            writer.write(json.dumps(message).encode() + b"\n")
+
+        async def play(gameNumber):
+            inbox = asyncio.Queue()
+            pendingStarts.append(inbox)
+            send({"op": "new", "color": "white" if gameNumber % 2 == 0 else "black", "movetime": maxTime,
+                  "nodes": maxNodes})
+            sentAt = time.perf_counter()
+            while True:
+                message = await inbox.get()
+                if message["op"] == "over":
+                    results[message["result"]] += 1
+                    return
+                if message["op"] in ("closed", "error"):
+                    results["aborted"] += 1
+                    return
+                if message.get("by") == "engine" or (message["op"] == "started" and message["engine"] == "white"):
+                    latencies.append(time.perf_counter() - sentAt)
+                if "legal" in message:
+                    send({"op": "move", "game": message["game"], "move": random.choice(message["legal"])})
+                    await writer.drain()
+                    sentAt = time.perf_counter()
+
+        reading = asyncio.create_task(readLoop())
+        await asyncio.gather(*(play(gameNumber) for gameNumber in range(games)))
+        reading.cancel()
+        writer.close()
+
+    startTime = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(connections)))
+    elapsed = time.perf_counter() - startTime
+    latencies.sort()
+    if latencies:
+        percentile = lambda share: latencies[min(len(latencies) - 1, int(share * len(latencies)))]
+        print("%d engine moves in %.1fs (%.1f moves/s); latency p50 %.3fs, p95 %.3fs, max %.3fs" % (
+            len(latencies), elapsed, len(latencies) / elapsed, percentile(0.5), percentile(0.95), latencies[-1]),
+            file=log)
+    print("games: " + ", ".join("%s %d" % item for item in sorted(results.items())), file=log)
+    return latencies, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve many games over TCP, or load-test a server")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the game server")
+    serve.add_argument("--host", default=DEFAULT_HOST)
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--workers", type=int, default=None, help="search processes (default: one per core)")
+    serve.add_argument("--backend", default="mailbox", choices=("mailbox", "bitboard"))
+    load = commands.add_parser("load", help="play random games against a server and report its latency")
+    load.add_argument("--host", default=DEFAULT_HOST)
+    load.add_argument("--port", type=int, default=DEFAULT_PORT)
+    load.add_argument("--connections", type=int, default=10)
+    load.add_argument("--games", type=int, default=4, help="games played at once on each connection")
+    load.add_argument("--movetime", type=float, default=0.1)
+    load.add_argument("--nodes", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(GameServer(args.workers, args.backend).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    asyncio.run(generateLoad(args.host, args.port, args.connections, args.games, args.movetime, args.nodes))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+Long-lived engine process.
+Instead of spawning a Process (and pickling the whole GameState) for every AI move, ChessMain starts one
+EngineService. Its process keeps its own copy of the position, updated with the moves played (sent as moveIDs),
+and a single Search whose transposition table and history survive from one move to the next.
+A search is interrupted with stop/cancel messages instead of Process.terminate().
+When an opening book is given, a position found in it is answered at once with a book move, without searching.
+
+Pondering: after its move, the engine can go on thinking on the opponent's time (startPonder), searching the
+position after the reply it expects (the second move of its principal variation). If that reply is played,
+the next startSearch adopts the running search instead of starting a new one, so the time already spent counts;
+otherwise the ponder search is dropped and only its transposition table entries are kept.
+"""
+
+import multiprocessing
+import queue
+import random
+import time
+
+import ChessAI
+import ChessBook
+import ChessEngine
+import ChessStore
+
+MAX_PONDER_TIME = 60.0  # durée maximale d'une recherche sur le temps de l'adversaire, en secondes
+
+
+class SearchReply:
+    """
+    Outcome of a search run by the service process. Moves are sent back as moveIDs (see Move.moveID);
+    stats is the ChessAI.SearchStats of the search (None for a book move)
+    """
+    def __init__(self, searchID, bestMoveID, score, depth, pvIDs, nodes, elapsed, stats=None):
+        self.searchID = searchID
+        self.bestMoveID = bestMoveID
+        self.score = score
+        self.depth = depth
+        self.pvIDs = pvIDs
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.stats = stats
+
+    """
+    The move of validMoves matching the best move, or None
+    """
+    def findMove(self, validMoves):
+        for move in validMoves:
+            if move.moveID == self.bestMoveID:
+                return move
+        return None
+
+
+"""
+Searches gs (or answers with a book move) and returns the SearchReply of search searchID
+"""
+def searchReply(gs, book, search, searchID, maxTime, maxNodes, maxDepth):
+    validMoves = gs.getValidMoves()
+    bookMove = book.probe(gs, validMoves) if book is not None else None
+    if bookMove is not None:
+        return SearchReply(searchID, bookMove.moveID, 0, 0, [bookMove.moveID], 0, 0.0)
+    random.shuffle(validMoves)
+    result = search.iterativeDeepening(gs, validMoves, maxTime, maxNodes, maxDepth)
+    bestMoveID = result.bestMove.moveID if result.bestMove is not None else None
+    return SearchReply(searchID, bestMoveID, result.score, result.depth, [move.moveID for move in result.pv],
+                       result.nodes, result.elapsed, result.stats)
+
+
+"""
+Body of the service process: applies the messages of the commands queue, one at a time.
+    ("new", fen)                                   new game (fen None: starting position)
+    ("move", moveID)                               play a move on the service's position
+    ("undo",)                                      take the last move back
+    ("go", searchID, maxTime, maxNodes, maxDepth)  search, then put a SearchReply in the results queue
+    ("ponder", searchID, moveID, maxTime)          search the position after moveID (the expected reply), then
+                                                   put a SearchReply and take moveID back
+    ("quit",)
+stopSearchID is a shared integer: the search whose id it holds stops and replies with its best move so far.
+ponderDeadline is a shared time (time.time()): once set (> 0), the ponder search stops at that time.
+profile: time the phases of every search (see Search.profile)
+storePath: file of the persistent position store (see ChessStore), None to search without it
+"""
+def serviceLoop(commands, results, stopSearchID, backend, workers, bookPath=None, profile=False,
+                ponderDeadline=None, storePath=None):
+    gs = ChessEngine.GameState(backend)
+    if storePath:
+        ChessAI.positionStore = ChessStore.PositionStore(storePath)
+    book = ChessBook.openBook(bookPath)
+    if workers > 1:
+        search = ChessAI.ParallelSearch(workers)
+    else:
+        search = ChessAI.Search()
+    search.profile = profile
+    try:
+        while True:
+            message = commands.get()
+            kind = message[0]
+            if kind == "quit":
+                break
+            elif kind == "new":
+                gs = ChessEngine.GameState(backend, message[1])
+            elif kind == "move":
+                move = next(m for m in gs.getValidMoves() if m.moveID == message[1])
+                gs.makeMove(move)
+            elif kind == "undo":
+                gs.undoMove()
+            elif kind == "go":
+                searchID, maxTime, maxNodes, maxDepth = message[1:]
+                search.shouldStop = lambda: stopSearchID.value == searchID
+                results.put(searchReply(gs, book, search, searchID, maxTime, maxNodes, maxDepth))
+            elif kind == "ponder":
+                searchID, moveID, maxTime = message[1:]
+                ponderMove = next((m for m in gs.getValidMoves() if m.moveID == moveID), None)
+                if ponderMove is None:
+                    continue
+                search.shouldStop = lambda: (stopSearchID.value == searchID
+                                             or 0 < ponderDeadline.value < time.time())
+                gs.makeMove(ponderMove)
+                try:
+                    results.put(searchReply(gs, book, search, searchID, maxTime, None, ChessAI.MAX_DEPTH))
+                finally:
+                    gs.undoMove()  # le coup réellement joué arrive ensuite par un message "move"
+    finally:
+        if workers > 1:
+            search.close()
+        if book is not None:
+            book.close()
+
+
+class EngineService:
+    """
+    Front end of the service process, used by the GUI. Every move played on the GUI's GameState must be
+    passed to pushMove (and every undo to undoMove) so both positions stay the same.
+    bookPath: opening book file (see ChessBook), ignored if it does not exist
+    profile: time the phases of each search; the timings come back in SearchReply.stats
+    storePath: persistent position store (see ChessStore), off when None
+    """
+    def __init__(self, backend="mailbox", workers=1, bookPath=None, profile=False, storePath=None):
+        self.commands = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.stopSearchID = multiprocessing.RawValue('i', -1)
+        self.ponderDeadline = multiprocessing.RawValue('d', 0.0)
+        self.searchID = 0
+        self.cancelledSearchID = -1
+        self.ponderMoveID = None  # réponse attendue pendant que l'IA réfléchit sur le temps de l'adversaire
+        self.ponderStartTime = 0.0
+        self.ponderHit = False  # la réponse attendue a été jouée : la recherche en cours sera adoptée
+        # a daemon process cannot start the pool of a parallel search
+        self.process = multiprocessing.Process(target=serviceLoop, daemon=workers <= 1,
+                                               args=(self.commands, self.results, self.stopSearchID, backend, workers,
+                                                     bookPath, profile, self.ponderDeadline, storePath))
+        self.process.start()
+
+    def newGame(self, fen=None):
+        self.stopPondering()
+        self.commands.put(("new", fen))
+
+    """
+    Plays move on the service's position. While pondering, the expected reply turns the ponder search into
+    the search of the next move (see startSearch); any other move ends it
+    """
+    def pushMove(self, move):
+        if self.ponderMoveID is not None and move.moveID == self.ponderMoveID:
+            self.ponderMoveID = None
+            self.ponderHit = True
+        else:
+            self.stopPondering()
+        self.commands.put(("move", move.moveID))
+
+    def undoMove(self):
+        self.stopPondering()
+        self.commands.put(("undo",))
+
+    """
+    Thinks on the opponent's time, after the engine's move has been pushed: searches the position after the
+    reply expected by reply (the second move of its principal variation), for at most maxTime seconds.
+    Returns the expected reply's moveID, or None if there is nothing to ponder on
+    """
+    def startPonder(self, reply, maxTime=MAX_PONDER_TIME):
+        self.stopPondering()
+        if len(reply.pvIDs) < 2:
+            return None
+        self.searchID += 1
+        self.ponderMoveID = reply.pvIDs[1]
+        self.ponderStartTime = time.time()
+        self.ponderDeadline.value = 0.0
+        self.commands.put(("ponder", self.searchID, self.ponderMoveID, maxTime))
+        return self.ponderMoveID
+
+    """
+    Drops the ponder search, if any (its transposition table entries stay)
+    """
+    def stopPondering(self):
+        if self.ponderMoveID is not None or self.ponderHit:
+            self.cancel()
+            self.ponderMoveID = None
+            self.ponderHit = False
+
+    """
+    Starts a search of the current position; the reply comes later through getReply. Returns the search id.
+    After a ponder hit, the ponder search goes on instead and stops maxTime seconds after it started
+    (at once if it has already searched that long); maxNodes and maxDepth are then not used
+    """
+    def startSearch(self, maxTime=ChessAI.MOVE_TIME, maxNodes=None, maxDepth=ChessAI.MAX_DEPTH):
+        if self.ponderHit:
+            self.ponderHit = False
+            if maxTime is not None:
+                self.ponderDeadline.value = self.ponderStartTime + maxTime
+            return self.searchID
+        self.stopPondering()
+        self.searchID += 1
+        self.commands.put(("go", self.searchID, maxTime, maxNodes, maxDepth))
+        return self.searchID
+
+    """
+    Ends the current search early: it still replies, with the best move of its last completed iteration
+    """
+    def stop(self):
+        self.stopSearchID.value = self.searchID
+
+    """
+    Ends the current search and drops its reply (after an undo or a new game)
+    """
+    def cancel(self):
+        self.stop()
+        self.cancelledSearchID = self.searchID
+
+    """
+    Reply of the latest search if it has arrived (non-blocking unless timeout is given), otherwise None.
+    Replies of cancelled or superseded searches are skipped
+    """
+    def getReply(self, timeout=None):
+        while True:
+            try:
+                if timeout is None:
+                    reply = self.results.get_nowait()
+                else:
+                    reply = self.results.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            if reply.searchID == self.searchID and reply.searchID != self.cancelledSearchID:
+                return reply
+
+    def close(self):
+        self.cancel()
+        self.commands.put(("quit",))
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,217 @@
+"""
+Persistent position store: results of root searches kept on disk in an SQLite file.
+
+The store is off unless a file is given (ChessAI.positionStore, the UCI option StoreFile, EngineService storePath).
+Entries are keyed by a position key and a tag: the search (ChessAI) builds the key from the Zobrist key and the
+positions played since the last capture or pawn move, which decide repetition draws inside the search, and the
+tag from its evaluation tables and search options, so results of another evaluation are never reused.
+Each entry holds the depth searched, the score (in pawns, for the side to move) and the best move (Move.moveID)
+of a position, and the time it was last used. The search looks its root position up before searching: a result
+deep enough is played at once, a shallower one only puts its best move first. Positions that come back game
+after game (openings, common middlegames) are thus searched once and then answered from the store.
+
+Every engine process on the host can open the same file: SQLite locks it, and in WAL mode readers never wait
+for a writer. Each process opens its own connection on first use (a connection must not cross a fork); within a
+process, threads share it under a lock (the UCI front end searches in a new thread for every go).
+The size is bounded: every PRUNE_INTERVAL stores, entries unused for maxAge seconds are dropped, then the least
+recently used ones beyond maxEntries. A store that cannot be opened or written is simply skipped by the search.
+
+Usage:
+    python ChessStore.py info [--store positions.db]
+    python ChessStore.py prune [--store positions.db] [--max-entries N] [--max-age DAYS]
+    python ChessStore.py clear [--store positions.db]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_STORE = "positions.db"  # nom proposé, utilisé par la ligne de commande
+SCHEMA_VERSION = 2  # un fichier d'une autre version est vidé à l'ouverture
+MAX_ENTRIES = 1000000  # environ 70 Mo sur disque
+MAX_AGE = None  # en secondes ; None : seule la limite de taille s'applique
+PRUNE_INTERVAL = 100  # écritures (par processus) entre deux nettoyages
+TOUCH_INTERVAL = 60.0  # une lecture ne met à jour la date d'utilisation que si elle a plus d'une minute
+BUSY_TIMEOUT = 2.0  # attente maximale d'un verrou tenu par un autre processus, en secondes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    key INTEGER NOT NULL,
+    tag INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    score REAL NOT NULL,
+    move INTEGER,
+    used REAL NOT NULL,
+    PRIMARY KEY (key, tag)
+);
+CREATE INDEX IF NOT EXISTS positionsByUse ON positions (used);
+"""
+
+
+"""
+Keys are unsigned 64-bit integers, SQLite integers are signed
+"""
+def toSQLiteKey(key):
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class PositionStore:
+    """
+    probe(key, tag) returns (depth, score, moveID) or None; store(key, tag, depth, score, moveID) keeps the deeper
+    result. path None or "" (the default) disables the store
+    """
+    def __init__(self, path=None, maxEntries=MAX_ENTRIES, maxAge=MAX_AGE):
+        self.path = path
+        self.maxEntries = maxEntries
+        self.maxAge = maxAge
+        self.available = bool(path)
+        self.connection = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.storesSincePrune = 0
+
+    """
+    The connection of the current process, opened (and the table created) on first use
+    """
+    def connect(self):
+        if self.connection is None or self.pid != os.getpid():
+            try:
+                connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                             check_same_thread=False)
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")  # WAL : un arrêt brutal ne corrompt pas le fichier
+                if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    connection.execute("DROP TABLE IF EXISTS positions")
+                    connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+                connection.executescript(SCHEMA)
+            except sqlite3.Error:
+                self.available = False
+                return None
+            self.connection = connection
+            self.pid = os.getpid()
+            self.storesSincePrune = 0
+        return self.connection
+
+    def probe(self, key, tag):
+        if not self.available:
+            return None
+        key, tag = toSQLiteKey(key), toSQLiteKey(tag)
+        with self.lock:
+            connection = self.connect()
+            if connection is None:
+                return None
+            try:
+                row = connection.execute("SELECT depth, score, move, used FROM positions WHERE key = ? AND tag = ?",
+                                         (key, tag)).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                if now - row[3] > TOUCH_INTERVAL:  # LRU : la position reste parmi les plus récemment utilisées
+                    connection.execute("UPDATE positions SET used = ? WHERE key = ? AND tag = ?", (now, key, tag))
+            except sqlite3.Error:  # verrou tenu trop longtemps par un autre processus : tant pis pour cette fois
+                return None
+        return row[0], row[1], row[2]
+
+    def store(self, key, tag, depth, score, moveID):
+        if not self.available:
+            return
+        with self.lock:
+            connection = self.connect()
+            if connection is None:
+                return
+            try:
+                connection.execute("INSERT INTO positions (key, tag, depth, score, move, used) VALUES (?, ?, ?, ?, ?, ?) "
+                                   "ON CONFLICT (key, tag) DO UPDATE SET depth = excluded.depth, score = excluded.score, "
+                                   "move = excluded.move, used = excluded.used WHERE excluded.depth >= positions.depth",
+                                   (toSQLiteKey(key), toSQLiteKey(tag), depth, score, moveID, time.time()))
+                self.storesSincePrune += 1
+                if self.storesSincePrune >= PRUNE_INTERVAL:
+                    self.removeUnused(connection)
+            except sqlite3.Error:
+                pass
+
+    """
+    Drops the entries unused for maxAge seconds, then the least recently used ones beyond maxEntries.
+    Returns the number of entries removed
+    """
+    def prune(self):
+        with self.lock:
+            connection = self.connect()
+            return self.removeUnused(connection) if connection is not None else 0
+
+    def removeUnused(self, connection):
+        self.storesSincePrune = 0
+        removed = 0
+        if self.maxAge is not None:
+            removed += connection.execute("DELETE FROM positions WHERE used < ?",
+                                          (time.time() - self.maxAge,)).rowcount
+        if self.maxEntries is not None:
+            excess = connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0] - self.maxEntries
+            if excess > 0:
+                removed += connection.execute("DELETE FROM positions WHERE rowid IN "
+                                              "(SELECT rowid FROM positions ORDER BY used LIMIT ?)", (excess,)).rowcount
+        return removed
+
+    def clear(self):
+        with self.lock:
+            connection = self.connect()
+            if connection is not None:
+                connection.execute("DELETE FROM positions")
+
+    """
+    {"entries": .., "oldest": .., "newest": .., "depths": {depth: count}}, times as time.time() values
+    """
+    def info(self):
+        with self.lock:
+            connection = self.connect()
+            if connection is None:
+                return None
+            entries, oldest, newest = connection.execute("SELECT COUNT(*), MIN(used), MAX(used) "
+                                                         "FROM positions").fetchone()
+            depths = dict(connection.execute("SELECT depth, COUNT(*) FROM positions GROUP BY depth ORDER BY depth"))
+        return {"entries": entries, "oldest": oldest, "newest": newest, "depths": depths}
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or trim the persistent position store")
+    parser.add_argument("command", choices=("info", "prune", "clear"))
+    parser.add_argument("--store", default=DEFAULT_STORE, help="SQLite file of the store")
+    parser.add_argument("--max-entries", type=int, default=MAX_ENTRIES)
+    parser.add_argument("--max-age", type=float, default=None, help="days without use before an entry is dropped")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.store):
+        print("no store at " + args.store, file=sys.stderr)
+        return 1
+    maxAge = args.max_age * 86400 if args.max_age is not None else None
+    store = PositionStore(args.store, args.max_entries, maxAge)
+    try:
+        if args.command == "prune":
+            print("%d entries removed" % store.prune())
+        elif args.command == "clear":
+            store.clear()
+        info = store.info()
+        if info is None:
+            print("cannot open " + args.store, file=sys.stderr)
+            return 1
+        print("%d entries" % info["entries"])
+        if info["entries"]:
+            print("last used: %s to %s" % (time.strftime("%Y-%m-%d %H:%M", time.localtime(info["oldest"])),
+                                           time.strftime("%Y-%m-%d %H:%M", time.localtime(info["newest"]))))
+            print("depths: " + ", ".join("%d: %d" % item for item in info["depths"].items()))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""
+Endgame tablebases: distance-to-mate tables for positions with 3 or 4 pieces (kings included), generated offline
+by retrograde analysis and probed by the search.
+
+A table covers one material set, named like "KRvK" or "KQvKR" (white pieces, then black pieces). A position is
+indexed by the squares of its pieces (in the order of the name) and the side to move:
+    index = ((whiteKing * 64 + square1) * 64 + square2 ...) * 2 + (1 if black to move else 0)
+where the white king is always on files a-d (positions with the white king on e-h are mirrored, since without
+castling the board is symmetric left-right), so whiteKing is row * 4 + col and a table has 32 * 64^(n-1) * 2
+entries. Positions with black holding the stronger material are probed in the table of the colour-flipped position.
+
+Each entry is one signed byte, from the side to move's point of view:
+    0        draw (or illegal position)
+    d > 0    the side to move mates in d plies
+    -d < 0   the side to move is mated in d - 1 plies (-1: checkmated)
+The file is a 20-byte header (magic, version, material name, entry count) followed by the entries; it is read
+through mmap, so every engine process shares the same pages.
+
+Generation (requires numpy): every legal position's moves are generated once with GameState; moves staying in the
+table are kept as successor indexes, captures and promotions are resolved by probing the smaller tables (built
+first if missing). En passant rights are not part of the index: a position where an en passant capture is
+possible is not probed, and a double pawn step is treated as an ordinary move. Wins and losses are then propagated one ply at a time, as whole-array numpy operations, until
+nothing changes; the remaining positions are draws.
+
+Usage:
+    python ChessTablebase.py build                  # every 3-piece table (KQvK, KRvK, KPvK)
+    python ChessTablebase.py build KQvKR KRvKN      # chosen tables (4-piece tables take long: ~16M positions each)
+    python ChessTablebase.py probe --fen "<fen>"
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+import ChessEngine
+
+TABLEBASE_DIR = "tablebases"
+MAX_PIECES = 4
+HEADER = struct.Struct("<4sB11sI")  # magic, version, material, entries
+MAGIC = b"PCTB"
+VERSION = 1
+PIECE_ORDER = "QRBNP"  # ordre des pièces dans un nom de table (le roi vient toujours en premier)
+PIECE_VALUES = {"Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+THREE_PIECE_SETS = ("KQvK", "KRvK", "KPvK")
+FOUR_PIECE_SETS = ("KQvKQ", "KQvKR", "KQvKB", "KQvKN", "KQvKP", "KRvKR", "KRvKB", "KRvKN", "KRvKP",
+                   "KBvKP", "KNvKP", "KPvKP", "KQQvK", "KQRvK", "KRRvK", "KBBvK", "KBNvK", "KPPvK",
+                   "KQPvK", "KRPvK", "KBPvK", "KNPvK")
+
+
+"""
+Name of a material set from the non-king pieces of each side ("Q", "RP"...)
+"""
+def materialName(whitePieces, blackPieces):
+    order = lambda pieces: "".join(sorted(pieces, key=PIECE_ORDER.index))
+    return "K" + order(whitePieces) + "vK" + order(blackPieces)
+
+
+"""
+Name of the table holding a material set: the side with more material plays white
+"""
+def canonicalName(whitePieces, blackPieces):
+    whiteValue = sum(PIECE_VALUES[piece] for piece in whitePieces)
+    blackValue = sum(PIECE_VALUES[piece] for piece in blackPieces)
+    name, flipped = materialName(whitePieces, blackPieces), materialName(blackPieces, whitePieces)
+    if (blackValue, flipped) > (whiteValue, name):
+        return flipped, True
+    return name, False
+
+
+"""
+True when no side can ever mate: bare kings, or a single bishop or knight
+"""
+def isInsufficientMaterial(whitePieces, blackPieces):
+    pieces = whitePieces + blackPieces
+    return len(pieces) == 0 or (len(pieces) == 1 and pieces[0] in "BN")
+
+
+class Tablebase:
+    """
+    One material set: its piece list (in index order) and, once loaded, its entries
+    """
+    def __init__(self, name):
+        self.name = name
+        whiteText, blackText = name.split("v")
+        self.pieces = ["w" + ("p" if piece == "P" else piece) for piece in whiteText] + \
+                      ["b" + ("p" if piece == "P" else piece) for piece in blackText]
+        self.size = 32 * 64 ** (len(self.pieces) - 1) * 2
+        self.values = None
+        self.file = None
+
+    def load(self, path):
+        self.file = open(path, "rb")
+        self.values = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, name, entries = HEADER.unpack_from(self.values, 0)
+        if magic != MAGIC or version != VERSION or name.rstrip(b"\0").decode() != self.name or entries != self.size:
+            raise ValueError("invalid tablebase file: " + path)
+
+    def close(self):
+        if self.values is not None:
+            self.values.close()
+            self.file.close()
+
+    """
+    Index of a position given the squares (row * 8 + col) of self.pieces, in that order. Pieces of the same
+    type and colour are interchangeable: their squares are sorted
+    """
+    def indexOf(self, squares, whiteToMove):
+        if squares[0] & 7 > 3:  # roi blanc sur les colonnes e-h : position symétrique
+            squares = [square ^ 7 for square in squares]
+        squares = list(squares)
+        for i in range(1, len(squares) - 1):
+            if self.pieces[i] == self.pieces[i + 1] and squares[i] > squares[i + 1]:
+                squares[i], squares[i + 1] = squares[i + 1], squares[i]
+        king = squares[0]
+        index = (king >> 3) * 4 + (king & 7)
+        for square in squares[1:]:
+            index = index * 64 + square
+        return index * 2 + (0 if whiteToMove else 1)
+
+    def decode(self, index):
+        whiteToMove = index % 2 == 0
+        index //= 2
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            squares.append(index % 64)
+            index //= 64
+        squares.append((index // 4) * 8 + index % 4)
+        squares.reverse()
+        return squares, whiteToMove
+
+    def value(self, index):
+        return struct.unpack_from("b", self.values, HEADER.size + index)[0]
+
+
+class Tablebases:
+    """
+    The tables found in a directory, opened on first use. probe() gives the value of a position or None
+    """
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}  # nom -> Tablebase, ou None si le fichier n'existe pas
+        self.available = os.path.isdir(directory) and any(name.endswith(".tb") for name in os.listdir(directory))
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".tb")
+
+    def getTable(self, name):
+        if name not in self.tables:
+            table = None
+            if os.path.exists(self.path(name)):
+                table = Tablebase(name)
+                table.load(self.path(name))
+            self.tables[name] = table
+        return self.tables[name]
+
+    """
+    Table value of the position (see the module docstring), 0 for insufficient material, None if not covered:
+    too many pieces, castling rights, a possible en passant capture, or no table for the material
+    """
+    def probe(self, gs):
+        if gs.pieceCount > MAX_PIECES or gs.castlingRights or self.canCaptureEnpassant(gs):
+            return None
+        squaresByPiece = {}
+        for r in range(8):
+            for c in range(8):
+                piece = gs.board[r][c]
+                if piece != "--":
+                    squaresByPiece.setdefault(piece, []).append(r * 8 + c)
+        whitePieces = [piece[1].upper() for piece, squares in squaresByPiece.items() for _ in squares
+                       if piece[0] == "w" and piece[1] != "K"]
+        blackPieces = [piece[1].upper() for piece, squares in squaresByPiece.items() for _ in squares
+                       if piece[0] == "b" and piece[1] != "K"]
+        if isInsufficientMaterial(whitePieces, blackPieces):
+            return 0
+        name, flipped = canonicalName(whitePieces, blackPieces)
+        table = self.getTable(name)
+        if table is None:
+            return None
+        whiteToMove = gs.whiteToMove
+        if flipped:  # les couleurs sont échangées et l'échiquier retourné
+            squaresByPiece = {("b" if piece[0] == "w" else "w") + piece[1]: [square ^ 56 for square in squares]
+                              for piece, squares in squaresByPiece.items()}
+            whiteToMove = not whiteToMove
+        squares = []
+        used = {}
+        for piece in table.pieces:
+            squares.append(squaresByPiece[piece][used.get(piece, 0)])
+            used[piece] = used.get(piece, 0) + 1
+        return table.value(table.indexOf(squares, whiteToMove))
+
+    """
+    True if a pawn of the side to move stands beside the pawn that just advanced two squares
+    (the tables do not record en passant rights)
+    """
+    @staticmethod
+    def canCaptureEnpassant(gs):
+        if gs.enpassantPossible == ():
+            return False
+        row, col = gs.enpassantPossible
+        pawnRow = row + 1 if gs.whiteToMove else row - 1
+        allyPawn = "wp" if gs.whiteToMove else "bp"
+        return any(0 <= c <= 7 and gs.board[pawnRow][c] == allyPawn for c in (col - 1, col + 1))
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+
+"""
+Material sets reached from name by one capture or one promotion (the tables name depends on)
+"""
+def dependencies(name):
+    whiteText, blackText = name.split("v")
+    white, black = list(whiteText[1:]), list(blackText[1:])
+    result = set()
+    for side, other, isWhite in ((white, black, True), (black, white, False)):
+        for i, piece in enumerate(side):
+            rest = side[:i] + side[i + 1:]
+            captured = (rest, other) if isWhite else (other, rest)
+            if not isInsufficientMaterial(*captured):
+                result.add(canonicalName(*captured)[0])
+            if piece == "P":
+                for promotion in "QRBN":
+                    promoted = (rest + [promotion], other) if isWhite else (other, rest + [promotion])
+                    if not isInsufficientMaterial(*promoted):
+                        result.add(canonicalName(*promoted)[0])
+    return sorted(result)
+
+
+"""
+Builds the table of a material set (and, first, the missing tables it depends on) into tablebases.directory
+"""
+def buildTable(name, tablebases, log=sys.stdout):
+    for dependency in dependencies(name):
+        if not os.path.exists(tablebases.path(dependency)):
+            buildTable(dependency, tablebases, log)
+    values = generateValues(name, tablebases, log)
+    os.makedirs(tablebases.directory, exist_ok=True)
+    with open(tablebases.path(name), "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, name.encode(), len(values)))
+        out.write(values.tobytes())
+    tablebases.tables.pop(name, None)
+    tablebases.available = True
+
+
+"""
+Retrograde analysis of one material set. Returns the int8 entries
+"""
+def generateValues(name, tablebases, log=sys.stdout):
+    import numpy as np  # dépendance optionnelle, seulement pour générer les tables
+    from array import array
+
+    startTime = time.perf_counter()
+    table = Tablebase(name)
+    pieces, size = table.pieces, table.size
+    print("%s: %d positions" % (name, size), file=log)
+    NONE = 1000  # pas encore de distance
+    status = np.zeros(size, dtype=np.int8)  # 1 : le trait gagne, -1 : le trait perd, 0 : nul ou inconnu
+    distance = np.zeros(size, dtype=np.int16)  # demi-coups jusqu'au mat
+    valid = np.zeros(size, dtype=bool)
+    offsets = np.zeros(size + 1, dtype=np.int64)  # coups restant dans la table : targets[offsets[i]:offsets[i + 1]]
+    targets = array("i")
+    externalWin = np.full(size, NONE, dtype=np.int16)  # plus court gain par une prise ou une promotion
+    externalLoss = np.zeros(size, dtype=np.int16)  # plus longue perte par une prise ou une promotion
+    notLosing = np.zeros(size, dtype=bool)  # pat, ou une prise/promotion qui ne perd pas
+
+    gs = ChessEngine.GameState()
+    gs.board = [["--"] * 8 for _ in range(8)]
+    gs.castlingRights = 0
+    gs.enpassantPossible = ()
+    gs.resetLogs()  # la pile d'annulation repart sans droits de roque
+    gs.underpromotions = True
+    progressStep = size // 8
+    for index in range(size):
+        offsets[index] = len(targets)
+        if index and index % progressStep == 0:
+            print("  %d%% (%.0fs)" % (index * 100 // size, time.perf_counter() - startTime), file=log, flush=True)
+        squares, whiteToMove = table.decode(index)
+        if not isValidPlacement(table, squares):
+            continue
+        for piece, square in zip(pieces, squares):
+            gs.board[square >> 3][square & 7] = piece
+        gs.whiteKingLocation = divmod(squares[0], 8)
+        gs.blackKingLocation = divmod(squares[pieces.index("bK")], 8)
+        gs.whiteToMove = not whiteToMove
+        if not gs.inCheck():  # le camp qui n'a pas le trait ne peut pas être en échec
+            gs.whiteToMove = whiteToMove
+            valid[index] = True
+            moves = gs.getValidMoves()
+            if not moves:
+                if gs.checkmate:
+                    status[index] = -1
+                else:
+                    notLosing[index] = True
+            pieceAt = {square: i for i, square in enumerate(squares)}
+            for move in moves:
+                if move.isCapture or move.isPawnPromotion:
+                    gs.pieceCount = len(pieces)
+                    gs.makeMove(move)
+                    child = tablebases.probe(gs)
+                    gs.undoMove()
+                    if child is None:
+                        raise RuntimeError("missing tablebase after %s in %s" % (move.getChessNotation(), name))
+                    if child < 0:
+                        externalWin[index] = min(externalWin[index], -child)  # l'adversaire est maté en -child - 1
+                    elif child > 0:
+                        externalLoss[index] = max(externalLoss[index], child + 1)
+                    else:
+                        notLosing[index] = True
+                else:
+                    newSquares = list(squares)
+                    newSquares[pieceAt[move.startRow * 8 + move.startCol]] = move.endRow * 8 + move.endCol
+                    targets.append(table.indexOf(newSquares, not whiteToMove))
+            gs.checkmate = gs.stalemate = False
+        for square in squares:
+            gs.board[square >> 3][square & 7] = "--"
+    offsets[size] = len(targets)
+    print("  %d legal positions, %d moves, %.1fs" % (valid.sum(), len(targets), time.perf_counter() - startTime),
+          file=log)
+
+    targets = np.frombuffer(targets, dtype=np.int32) if len(targets) else np.zeros(0, dtype=np.int32)
+    starts = offsets[:-1]
+    hasMoves = offsets[1:] > starts
+    segmentStarts = starts[hasMoves]
+    lastExternal = max(int(externalWin[externalWin < NONE].max(initial=0)), int(externalLoss.max(initial=0)))
+    lastChange = 0
+    ply = 0
+    while ply <= lastChange + 2 or ply <= lastExternal:
+        ply += 1
+        unresolved = valid & (status == 0)
+        if ply % 2 == 1:  # gain en ply demi-coups : un coup mène à une position perdue en ply - 1
+            childLost = (status[targets] == -1) & (distance[targets] == ply - 1)
+            found = np.zeros(size, dtype=bool)
+            if len(targets):
+                found[hasMoves] = np.logical_or.reduceat(childLost, segmentStarts)
+            newly = unresolved & (found | (externalWin == ply))
+            status[newly] = 1
+        else:  # perte en ply demi-coups : tous les coups mènent à une position gagnée pour l'adversaire
+            allWon = np.ones(size, dtype=bool)
+            if len(targets):
+                allWon[hasMoves] = np.logical_and.reduceat(status[targets] == 1, segmentStarts)
+            newly = unresolved & allWon & ~notLosing & (externalLoss <= ply)
+            status[newly] = -1
+        distance[newly] = ply
+        if newly.any():
+            lastChange = ply
+
+    if distance.max(initial=0) >= 127:
+        raise RuntimeError("%s: distances do not fit in a byte" % name)
+    values = np.where(status == 1, distance, np.where(status == -1, -(distance + 1), 0)).astype(np.int8)
+    print("  %d wins, %d losses, longest mate %d plies, %.1fs" % ((status == 1).sum(), (status == -1).sum(),
+                                                                  distance.max(initial=0), time.perf_counter() - startTime),
+          file=log)
+    return values
+
+
+"""
+A position the index can describe but the board cannot hold: two pieces on a square, a pawn on the first or
+last rank, kings side by side, or interchangeable pieces not in sorted order (the index keeps one order only)
+"""
+def isValidPlacement(table, squares):
+    if len(set(squares)) != len(squares):
+        return False
+    for piece, square in zip(table.pieces, squares):
+        if piece[1] == "p" and (square < 8 or square >= 56):
+            return False
+    whiteKing, blackKing = squares[0], squares[table.pieces.index("bK")]
+    if abs((whiteKing >> 3) - (blackKing >> 3)) <= 1 and abs((whiteKing & 7) - (blackKing & 7)) <= 1:
+        return False
+    for i in range(1, len(squares) - 1):
+        if table.pieces[i] == table.pieces[i + 1] and squares[i] > squares[i + 1]:
+            return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe the endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="generate tables (default: every 3-piece table)")
+    build.add_argument("names", nargs="*", help="material sets such as KRvK, or 3 / 4 for every table of that size")
+    build.add_argument("--dir", default=TABLEBASE_DIR)
+    probe = commands.add_parser("probe", help="value of a position")
+    probe.add_argument("--fen", required=True)
+    probe.add_argument("--dir", default=TABLEBASE_DIR)
+    args = parser.parse_args(argv)
+
+    tablebases = Tablebases(args.dir)
+    if args.command == "build":
+        names = []
+        for name in args.names or ["3"]:
+            names.extend(THREE_PIECE_SETS if name == "3" else FOUR_PIECE_SETS if name == "4" else [name])
+        for name in names:
+            if not os.path.exists(tablebases.path(name)):
+                buildTable(name, tablebases)
+        return 0
+
+    gs = ChessEngine.GameState(fen=args.fen)
+    value = tablebases.probe(gs)
+    if value is None:
+        print("not in the tablebases")
+    elif value == 0:
+        print("draw")
+    elif value > 0:
+        print("side to move mates in %d plies" % value)
+    else:
+        print("side to move is mated in %d plies" % (-value - 1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Offline tuning of the ChessAI evaluation tables (PIECE_SCORE and the piece-square tables) against game results.
+
+scoreBoard is linear in its tables: the score is the sum, over the pieces, of their material value plus their
+square bonus. A position is therefore a feature vector (how many of each piece, which squares they stand on,
+white counted positive and black negative) and scoreBoard is a dot product with the table values.
+Positions are stored as one byte per square (uint8, 64 per position), features are built a chunk at a time,
+and the tables are fitted by batched gradient descent on the Texel loss: mean((sigmoid(K * score) - result)^2).
+
+Usage (requires numpy):
+    python ChessTuner.py encode games.epd dataset.npz     # lines "<fen> ... <result>", result 1-0 / 0-1 / 1/2-1/2
+    python ChessTuner.py tune dataset.npz --out tuned_tables.py
+The output file holds the new tables in ChessAI's format, ready to replace the constants there.
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import ChessAI
+
+PIECE_TYPES = ("p", "N", "B", "R", "Q", "K")
+PIECE_CODES = {color + pieceType: 1 + index + (6 if color == "b" else 0)
+               for color in "wb" for index, pieceType in enumerate(PIECE_TYPES)}  # 0 : case vide
+FEN_CODES = {("P" if piece[1] == "p" else piece[1]) if piece[0] == "w" else piece[1].lower(): code
+             for piece, code in PIECE_CODES.items()}
+TUNED_TYPES = ("p", "N", "B", "R", "Q")  # le roi n'a ni valeur ni table dans scoreBoard
+TABLE_NAMES = {"p": "PAWN_SCORES", "N": "KNIGHT_SCORES", "B": "BISHOP_SCORES", "R": "ROOK_SCORES", "Q": "QUEEN_SCORES"}
+FEATURE_COUNT = len(TUNED_TYPES) * 65  # une valeur matérielle + 64 bonus de case par type
+MIRROR = np.arange(64) ^ 56  # case vue du côté noir : les tables noires sont les tables blanches inversées
+RESULTS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+
+"""
+One byte per square (row * 8 + col), see PIECE_CODES
+"""
+def encodeBoard(board):
+    return bytes(PIECE_CODES.get(piece, 0) for row in board for piece in row)
+
+
+def encodeFENBoard(placement):
+    codes = bytearray()
+    for char in placement:
+        if char.isdigit():
+            codes.extend(b"\0" * int(char))
+        elif char != "/":
+            codes.append(FEN_CODES[char])
+    if len(codes) != 64:
+        raise ValueError("invalid FEN board: " + placement)
+    return bytes(codes)
+
+
+"""
+Finds the game result (white's score) in a dataset line: 1-0, 0-1, 1/2-1/2 (optionally quoted, as in EPD c9)
+or a number in brackets such as [0.5]
+"""
+def parseResult(line):
+    for token in reversed(line.replace(";", " ").split()):
+        token = token.strip('"')
+        if token in RESULTS:
+            return RESULTS[token]
+        if token.startswith("[") and token.endswith("]"):
+            return float(token[1:-1])
+    raise ValueError("no result in line: " + line.strip())
+
+
+"""
+Streams a position file into compact arrays: boards (N, 64) uint8 and results (N,) float32.
+Lines are read one at a time and packed chunk by chunk, so only the compact arrays are kept in memory
+"""
+def encodeDataset(path, chunkSize=100000):
+    boardChunks, resultChunks = [], []
+    boards, results = bytearray(), []
+    with open(path) as positions:
+        for line in positions:
+            if not line.strip() or line.startswith("#"):
+                continue
+            boards += encodeFENBoard(line.split()[0])
+            results.append(parseResult(line))
+            if len(results) == chunkSize:
+                boardChunks.append(np.frombuffer(bytes(boards), dtype=np.uint8).reshape(-1, 64))
+                resultChunks.append(np.array(results, dtype=np.float32))
+                boards, results = bytearray(), []
+    if results:
+        boardChunks.append(np.frombuffer(bytes(boards), dtype=np.uint8).reshape(-1, 64))
+        resultChunks.append(np.array(results, dtype=np.float32))
+    if not boardChunks:
+        return np.zeros((0, 64), dtype=np.uint8), np.zeros(0, dtype=np.float32)
+    return np.concatenate(boardChunks), np.concatenate(resultChunks)
+
+
+"""
+Feature matrix (B, FEATURE_COUNT) of a batch of encoded boards. For each tuned piece type, column t is the
+material balance and the 64 columns after it the square occupancy, both +1 per white piece and -1 per black piece
+"""
+def buildFeatures(boards):
+    features = np.zeros((len(boards), FEATURE_COUNT), dtype=np.float32)
+    for index, pieceType in enumerate(TUNED_TYPES):
+        white = (boards == PIECE_CODES["w" + pieceType]).astype(np.float32)
+        black = (boards == PIECE_CODES["b" + pieceType]).astype(np.float32)
+        base = index * 65
+        features[:, base] = white.sum(axis=1) - black.sum(axis=1)
+        features[:, base + 1:base + 65] = white - black[:, MIRROR]
+    return features
+
+
+"""
+Current ChessAI tables as a weight vector matching buildFeatures
+"""
+def getWeights(pieceScore=None, tables=None):
+    pieceScore = pieceScore or ChessAI.PIECE_SCORE
+    weights = np.zeros(FEATURE_COUNT, dtype=np.float64)
+    for index, pieceType in enumerate(TUNED_TYPES):
+        table = tables[pieceType] if tables else getattr(ChessAI, TABLE_NAMES[pieceType])
+        weights[index * 65] = pieceScore[pieceType]
+        weights[index * 65 + 1:index * 65 + 65] = np.asarray(table, dtype=np.float64).reshape(64)
+    return weights
+
+
+"""
+scoreBoard (without checkmate/stalemate detection) for every position, as one matrix product per chunk
+"""
+def evaluateBatch(boards, weights, chunkSize=16384):
+    scores = np.empty(len(boards), dtype=np.float64)
+    for start in range(0, len(boards), chunkSize):
+        scores[start:start + chunkSize] = buildFeatures(boards[start:start + chunkSize]) @ weights
+    return scores
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def texelLoss(scores, results, k):
+    return float(np.mean((sigmoid(k * scores) - results) ** 2))
+
+
+"""
+Scaling constant K that best maps the current scores to results, by a coarse then a fine grid search
+"""
+def fitScaling(scores, results):
+    best = min(np.linspace(0.05, 3.0, 60), key=lambda k: texelLoss(scores, results, k))
+    return float(min(np.linspace(max(best - 0.05, 0.01), best + 0.05, 21), key=lambda k: texelLoss(scores, results, k)))
+
+
+"""
+Batched gradient descent (with momentum) on the Texel loss. Each epoch is one pass over the data, chunk by chunk:
+gradient = X^T (2 (p - y) p (1 - p) K) / N
+"""
+def tune(boards, results, weights, epochs=100, learningRate=1.0, momentum=0.9, chunkSize=16384, log=sys.stdout):
+    weights = weights.copy()
+    k = fitScaling(evaluateBatch(boards, weights, chunkSize), results)
+    print("K = %.4f" % k, file=log)
+    velocity = np.zeros_like(weights)
+    count = len(boards)
+    for epoch in range(epochs):
+        gradient = np.zeros_like(weights)
+        loss = 0.0
+        for start in range(0, count, chunkSize):
+            features = buildFeatures(boards[start:start + chunkSize])
+            target = results[start:start + chunkSize]
+            predicted = sigmoid(k * (features @ weights))
+            error = predicted - target
+            loss += float(np.sum(error ** 2))
+            gradient += features.T @ (2.0 * error * predicted * (1.0 - predicted) * k)
+        gradient /= count
+        velocity = momentum * velocity - learningRate * gradient
+        weights += velocity
+        print("epoch %d: loss %.6f" % (epoch + 1, loss / count), file=log)
+    return weights
+
+
+"""
+Python source of the tuned tables, in the format of the ChessAI constants
+"""
+def formatTables(weights):
+    lines = ["PIECE_SCORE = {%s}" % ", ".join(['"K": 0'] + ['"%s": %s' % (pieceType, round(weights[index * 65], 2))
+                                                            for index, pieceType in reversed(list(enumerate(TUNED_TYPES)))]),
+             ""]
+    for index, pieceType in enumerate(TUNED_TYPES):
+        name = TABLE_NAMES[pieceType]
+        table = weights[index * 65 + 1:index * 65 + 65].reshape(8, 8)
+        rows = ["[" + ", ".join("%.2f" % value for value in row) + "]" for row in table]
+        indent = " " * (len(name) + 4)
+        lines.append(name + " = [" + (",\n" + indent).join(rows) + "]")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the ChessAI evaluation tables on game results")
+    commands = parser.add_subparsers(dest="command", required=True)
+    encode = commands.add_parser("encode", help="pack a FEN/EPD file with results into a .npz dataset")
+    encode.add_argument("positions")
+    encode.add_argument("dataset")
+    tuneCommand = commands.add_parser("tune", help="fit the tables on a .npz dataset")
+    tuneCommand.add_argument("dataset")
+    tuneCommand.add_argument("--epochs", type=int, default=100)
+    tuneCommand.add_argument("--learning-rate", type=float, default=1.0)
+    tuneCommand.add_argument("--chunk-size", type=int, default=16384)
+    tuneCommand.add_argument("--out", default="tuned_tables.py")
+    args = parser.parse_args(argv)
+
+    if args.command == "encode":
+        boards, results = encodeDataset(args.positions)
+        np.savez_compressed(args.dataset, boards=boards, results=results)
+        print("%d positions written to %s" % (len(boards), args.dataset))
+        return 0
+
+    data = np.load(args.dataset)
+    boards, results = data["boards"], data["results"]
+    weights = tune(boards, results, getWeights(), args.epochs, args.learning_rate, chunkSize=args.chunk_size)
+    with open(args.out, "w") as out:
+        out.write(formatTables(weights) + "\n")
+    print("tables written to " + args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
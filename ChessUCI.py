@@ -0,0 +1,334 @@
+"""
+Headless UCI (Universal Chess Interface) front end, for tournament managers and servers.
+Reads commands on stdin and answers on stdout; built on ChessEngine and ChessAI, without pygame.
+
+Supported commands:
+    uci, isready, ucinewgame, setoption name Threads|Backend|OwnBook|BookFile|TablebaseDir|StoreFile|SearchStats value <v>
+    setoption name NullMove|LateMoveReductions|PrincipalVariationSearch value true|false
+    position startpos|fen <fen> [moves <move>...]
+    go [searchmoves <move>...] [ponder] [depth N] [nodes N] [movetime ms] [wtime ms] [btime ms] [winc ms] [binc ms]
+       [movestogo N] [infinite]
+    ponderhit, stop, quit
+The search runs in a thread so stop and isready are answered while it thinks. Each completed iteration
+prints "info depth .. score .. nodes .. nps .. time .. pv ..". Under go infinite or go ponder, bestmove is held
+until stop (or ponderhit, which also gives the search the time the clock allows). Positions found in the opening book
+(OwnBook, BookFile) are answered with a book move without searching. With SearchStats on, the phases of the
+search are timed and its statistics are sent as JSON ("info string stats {...}") before bestmove.
+StoreFile enables the persistent position store (see ChessStore) with the given file; "<empty>", the default,
+searches without it.
+NullMove, LateMoveReductions and PrincipalVariationSearch switch the selective search techniques of ChessAI.Search.
+
+Usage:
+    python ChessUCI.py
+"""
+
+import os
+import sys
+import threading
+
+import ChessAI
+import ChessBook
+import ChessEngine
+import ChessStore
+import ChessTablebase
+
+ENGINE_NAME = "Python-Chess-engine"
+ENGINE_AUTHOR = "Python-Chess-engine authors"
+DEFAULT_MOVES_TO_GO = 30  # coups restants supposés quand l'interface ne donne que la pendule
+MOVE_OVERHEAD = 0.05  # secondes gardées pour la communication avec l'interface
+GO_LIMITS = ("wtime", "btime", "winc", "binc", "movestogo", "depth", "nodes", "mate", "movetime")  # suivis d'un entier
+GO_FLAGS = ("infinite", "ponder")
+
+
+"""
+The legal move written in UCI notation (e2e4, e7e8q), or None
+"""
+def parseUCIMove(gs, text):
+    for move in gs.getValidMoves():
+        if move.getChessNotation() == text:
+            return move
+    return None
+
+
+"""
+UCI score: "cp <centipawns>" or "mate <moves>" (negative when the engine gets mated)
+"""
+def formatScore(score):
+    if abs(score) >= ChessAI.MATE_THRESHOLD:
+        plies = ChessAI.CHECKMATE - abs(score)
+        moves = (plies + 1) // 2
+        return "mate %d" % (moves if score > 0 else -moves)
+    return "cp %d" % round(score * 100)
+
+
+"""
+Seconds to spend on a move from the clock: an even share of the remaining time plus most of the increment,
+never more than the time left
+"""
+def allocateTime(timeLeft, increment, movesToGo):
+    budget = timeLeft / (movesToGo or DEFAULT_MOVES_TO_GO) + increment * 0.8
+    return max(0.01, min(budget, timeLeft - MOVE_OVERHEAD))
+
+
+class UCIEngine:
+    """
+    State of the UCI session: the current position, the search and the thread running it.
+    output receives each line to send (print to stdout by default)
+    """
+    def __init__(self, output=None):
+        self.output = output or self.printLine
+        self.backend = "mailbox"
+        self.threads = 1
+        self.ownBook = True
+        self.searchStats = False
+        self.searchFeatures = {name: True for name in ChessAI.SEARCH_FEATURES}  # nullMove... -> activé
+        self.book = ChessBook.openBook(ChessBook.DEFAULT_BOOK)
+        self.gs = self.newGameState()
+        self.search = ChessAI.Search()
+        self.parallelSearch = None  # pool de processus gardé tant que Threads ne change pas
+        self.searchThread = None
+        self.stopEvent = threading.Event()  # un nouveau pour chaque recherche
+        self.releaseEvent = threading.Event()  # bestmove peut être envoyé (go infinite/ponder : après stop ou ponderhit)
+        self.ponderTime = None  # temps accordé à la recherche lors d'un ponderhit
+        self.ponderTimer = None  # arrête la recherche une fois ce temps écoulé
+
+    @staticmethod
+    def printLine(line):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def newGameState(self, fen=None):
+        gs = ChessEngine.GameState(self.backend, fen)
+        gs.underpromotions = True  # l'interface peut envoyer e7e8n
+        return gs
+
+    """
+    Handles one command line. Returns False after quit
+    """
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.output("id name " + ENGINE_NAME)
+            self.output("id author " + ENGINE_AUTHOR)
+            self.output("option name Threads type spin default 1 min 1 max %d" % (os.cpu_count() or 1))
+            self.output("option name Backend type combo default mailbox var mailbox var bitboard")
+            self.output("option name OwnBook type check default true")
+            self.output("option name BookFile type string default " + ChessBook.DEFAULT_BOOK)
+            self.output("option name TablebaseDir type string default " + ChessTablebase.TABLEBASE_DIR)
+            self.output("option name StoreFile type string default <empty>")
+            self.output("option name SearchStats type check default false")
+            for name in ChessAI.SEARCH_FEATURES:
+                self.output("option name %s%s type check default true" % (name[0].upper(), name[1:]))
+            self.output("uciok")
+        elif command == "isready":
+            self.output("readyok")
+        elif command == "setoption":
+            self.setOption(arguments)
+        elif command == "ucinewgame":
+            self.waitForSearch()
+            ChessAI.transpositionTable.clear()
+            self.search = ChessAI.Search()
+            self.gs = self.newGameState()
+        elif command == "position":
+            self.waitForSearch()
+            self.setPosition(arguments)
+        elif command == "go":
+            self.waitForSearch()
+            self.go(arguments)
+        elif command == "ponderhit":
+            self.ponderHit()
+        elif command == "stop":
+            self.waitForSearch()
+        elif command == "quit":
+            self.waitForSearch()
+            self.closeParallelSearch()
+            return False
+        return True
+
+    def setOption(self, arguments):
+        if "name" not in arguments or "value" not in arguments:
+            return
+        name = " ".join(arguments[arguments.index("name") + 1:arguments.index("value")]).lower()
+        value = " ".join(arguments[arguments.index("value") + 1:])
+        self.waitForSearch()
+        if name == "threads":
+            try:
+                threads = max(1, int(value))
+            except ValueError:
+                return  # valeur invalide : l'option est ignorée
+            if threads != self.threads:
+                self.closeParallelSearch()
+                self.threads = threads
+                if threads > 1:
+                    self.parallelSearch = ChessAI.ParallelSearch(threads)
+        elif name == "backend" and value in ("mailbox", "bitboard"):
+            self.backend = value
+            self.gs = self.newGameState()
+        elif name == "ownbook":
+            self.ownBook = value.lower() == "true"
+        elif name == "bookfile":
+            if self.book is not None:
+                self.book.close()
+            self.book = ChessBook.openBook(value)
+        elif name == "searchstats":
+            self.searchStats = value.lower() == "true"
+        elif name in (feature.lower() for feature in ChessAI.SEARCH_FEATURES):
+            feature = next(feature for feature in ChessAI.SEARCH_FEATURES if feature.lower() == name)
+            self.searchFeatures[feature] = value.lower() == "true"
+        elif name == "tablebasedir":
+            ChessAI.tablebases.close()
+            ChessAI.tablebases = ChessTablebase.Tablebases(value)
+        elif name == "storefile":
+            ChessAI.positionStore.close()
+            ChessAI.positionStore = ChessStore.PositionStore(None if value == "<empty>" else value)
+
+    def closeParallelSearch(self):
+        if self.parallelSearch is not None:
+            self.parallelSearch.close()
+            self.parallelSearch = None
+
+    """
+    position startpos [moves ...] / position fen <fen> [moves ...]
+    """
+    def setPosition(self, arguments):
+        movesIndex = arguments.index("moves") if "moves" in arguments else len(arguments)
+        if arguments and arguments[0] == "fen":
+            self.gs = self.newGameState(" ".join(arguments[1:movesIndex]))
+        else:
+            self.gs = self.newGameState()
+        for text in arguments[movesIndex + 1:]:
+            move = parseUCIMove(self.gs, text)
+            if move is None:
+                self.output("info string illegal move " + text)
+                break
+            self.gs.makeMove(move)
+
+    """
+    Starts the search thread with the limits of a go command
+    """
+    def go(self, arguments):
+        options = {}
+        searchMoves = []
+        index = 0
+        while index < len(arguments):
+            token = arguments[index]
+            index += 1
+            if token in GO_FLAGS:
+                options[token] = True
+            elif token == "searchmoves":
+                while index < len(arguments) and arguments[index] not in GO_LIMITS + GO_FLAGS:
+                    searchMoves.append(arguments[index])
+                    index += 1
+            elif token in GO_LIMITS and index < len(arguments):
+                try:
+                    options[token] = int(arguments[index])
+                    index += 1
+                except ValueError:
+                    pass  # valeur manquante : le mot suivant est lu comme une option
+
+        maxDepth = min(options.get("depth", ChessAI.MAX_DEPTH), ChessAI.MAX_DEPTH)
+        maxNodes = options.get("nodes")
+        maxTime = None
+        if "movetime" in options:
+            maxTime = options["movetime"] / 1000
+        elif not options.get("infinite"):
+            clock, increment = ("wtime", "winc") if self.gs.whiteToMove else ("btime", "binc")
+            if clock in options:
+                maxTime = allocateTime(options[clock] / 1000, options.get(increment, 0) / 1000,
+                                       options.get("movestogo"))
+            elif "depth" not in options and maxNodes is None:
+                maxTime = ChessAI.MOVE_TIME
+
+        self.cancelPonderTimer()
+        self.stopEvent = threading.Event()
+        self.releaseEvent = threading.Event()
+        self.ponderTime = None
+        if options.get("ponder"):  # la recherche dure jusqu'au ponderhit, qui lui accorde alors maxTime
+            self.ponderTime, maxTime = maxTime, None
+        elif not options.get("infinite"):
+            self.releaseEvent.set()
+        self.searchThread = threading.Thread(target=self.runSearch, args=(maxTime, maxNodes, maxDepth, searchMoves,
+                                                                          self.stopEvent, self.releaseEvent),
+                                             daemon=True)
+        self.searchThread.start()
+
+    def runSearch(self, maxTime, maxNodes, maxDepth, searchMoves, stopEvent, releaseEvent):
+        bestMove = self.findBestMove(maxTime, maxNodes, maxDepth, searchMoves, stopEvent)
+        releaseEvent.wait()  # go infinite/ponder : jamais de bestmove avant stop ou ponderhit
+        self.output("bestmove " + (bestMove.getChessNotation() if bestMove is not None else "0000"))
+
+    """
+    Book move, or best move found by the search (restricted to searchMoves when given)
+    """
+    def findBestMove(self, maxTime, maxNodes, maxDepth, searchMoves, stopEvent):
+        validMoves = self.gs.getValidMoves()
+        restricted = [move for move in validMoves if move.getChessNotation() in searchMoves]
+        if restricted:
+            validMoves = restricted
+        elif self.ownBook and self.book is not None:
+            bookMove = self.book.probe(self.gs)
+            if bookMove is not None:
+                self.output("info string book move")
+                return bookMove
+        search = self.parallelSearch if self.threads > 1 else self.search
+        search.shouldStop = stopEvent.is_set
+        search.onIteration = self.sendInfo
+        search.profile = self.searchStats
+        for feature, enabled in self.searchFeatures.items():
+            setattr(search, feature, enabled)
+        result = search.iterativeDeepening(self.gs, validMoves, maxTime, maxNodes, maxDepth)
+        if self.searchStats:
+            self.output("info string stats " + result.stats.toJSON())
+        return result.bestMove
+
+    """
+    The opponent played the expected move: the ponder search becomes a normal one, stopped once the time the
+    clock allowed has run out
+    """
+    def ponderHit(self):
+        if self.searchThread is None:
+            return
+        if self.ponderTime is not None and self.ponderTimer is None:
+            self.ponderTimer = threading.Timer(self.ponderTime, self.stopEvent.set)
+            self.ponderTimer.daemon = True
+            self.ponderTimer.start()
+        self.releaseEvent.set()
+
+    def cancelPonderTimer(self):
+        if self.ponderTimer is not None:
+            self.ponderTimer.cancel()
+            self.ponderTimer = None
+
+    def sendInfo(self, result):
+        elapsed = max(result.elapsed, 1e-6)
+        self.output("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+            result.depth, formatScore(result.score), result.nodes, result.nodes / elapsed, elapsed * 1000,
+            " ".join(move.getChessNotation() for move in result.pv)))
+
+    """
+    Stops the running search, if any, and waits for its bestmove
+    """
+    def waitForSearch(self):
+        self.cancelPonderTimer()
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.releaseEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.waitForSearch()
+    engine.closeParallelSearch()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Consistency checks of the move generator on both backends: perft counts of the standard suite (shallow depths),
+FEN round trip, Zobrist keys kept by makeMove/undoMove, SAN round trip.
+
+Usage:
+    python -m pytest -q
+"""
+
+import random
+
+import pytest
+
+import ChessEngine
+import ChessPerft
+import ChessPGN
+
+BACKENDS = ("mailbox", "bitboard")
+MAX_PERFT_NODES = 10000  # profondeurs gardées : quelques secondes pour toute la suite
+RANDOM_GAMES = 4
+RANDOM_PLIES = 80
+
+SHALLOW_PERFT = [(name, fen, depth, expected) for name, fen, counts in ChessPerft.PERFT_SUITE
+                 for depth, expected in sorted(counts.items()) if expected <= MAX_PERFT_NODES]
+SUITE_FENS = [fen for _, fen, _ in ChessPerft.PERFT_SUITE]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("name, fen, depth, expected", SHALLOW_PERFT,
+                         ids=["%s-%d" % (name, depth) for name, _, depth, _ in SHALLOW_PERFT])
+def test_perft(backend, name, fen, depth, expected):
+    assert ChessPerft.perft(ChessPerft.newPerftState(fen, backend), depth) == expected
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("fen", SUITE_FENS)
+def test_fen_round_trip(backend, fen):
+    gs = ChessEngine.GameState(backend, fen)
+    assert gs.getFEN() == fen
+    for move in gs.getValidMoves():  # chaque position suivante se relit à l'identique
+        gs.makeMove(move)
+        after = gs.getFEN()
+        assert ChessEngine.GameState(backend, after).getFEN() == after
+        gs.undoMove()
+    assert gs.getFEN() == fen
+
+
+"""
+Random games: after every move the incremental key equals the key computed from scratch, and undoing the whole
+game gives back the starting key and position
+"""
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("fen", SUITE_FENS)
+def test_zobrist_undo(backend, fen):
+    rng = random.Random(fen)
+    for _ in range(RANDOM_GAMES):
+        gs = ChessEngine.GameState(backend, fen)
+        startKey = gs.zobristKey
+        played = 0
+        for _ in range(RANDOM_PLIES):
+            moves = gs.getValidMoves()
+            if not moves:
+                break
+            gs.makeMove(rng.choice(moves))
+            played += 1
+            assert gs.zobristKey == gs.computeZobristKey()
+        for _ in range(played):
+            gs.undoMove()
+            assert gs.zobristKey == gs.computeZobristKey()
+        assert gs.zobristKey == startKey
+        assert gs.getFEN() == fen
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("fen", SUITE_FENS)
+def test_san_round_trip(backend, fen):
+    gs = ChessEngine.GameState(backend, fen)
+    rng = random.Random(fen)
+    for _ in range(20):
+        moves = gs.getValidMoves()
+        if not moves:
+            break
+        sans = [ChessPGN.moveToSAN(gs, move, moves) for move in moves]
+        assert len(set(sans)) == len(sans)
+        for move, san in zip(moves, sans):
+            assert ChessPGN.parseSAN(gs, san) == move
+        gs.makeMove(rng.choice(moves))